@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+"""
+Option counts over a form's submissions: make_human_readable on every
+form and counting the labels, against FormAggregation.
+
+    python benchmarks/aggregate_bench.py [number of forms]
+"""
+import collections
+import copy
+import json
+import os
+import random
+import sys
+import time
+
+from commcareapi.aggregate import FormAggregation
+from commcareapi.comm_care_data import CommCareForm
+from commcareapi.xform import XForm
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        '..', 'tests', 'test_fixtures')
+
+
+def read_fixture(name):
+    with open(os.path.join(FIXTURES, name), 'r') as f:
+        return f.read()
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    form_data = json.loads(read_fixture('form_data_with_0len_select1.json'))
+    xform = XForm(read_fixture('form_definition_for_0len.xml'))
+    questions = xform.get_questions(['en'])
+    forms = []
+    for i in xrange(count):
+        data = copy.deepcopy(form_data)
+        data['form']['testmodule1_form_createcase_question3'] = \
+            random.choice(['select1', 'select2'])
+        data['form']['testmodule1_form_createcase_question4'] = \
+            random.choice(['select1', 'select2', 'select1 select2'])
+        forms.append(CommCareForm(data, validate=False))
+
+    start = time.time()
+    counts = collections.defaultdict(collections.Counter)
+    for form in forms:
+        for label, value in form.make_human_readable(questions):
+            if isinstance(value, basestring):
+                counts[label][value] += 1
+    elapsed = time.time() - start
+    print 'make_human_readable: %8.0f forms/sec' % (count / elapsed)
+
+    start = time.time()
+    FormAggregation.from_xform(xform, ['en']).add_forms(forms).result()
+    elapsed = time.time() - start
+    print 'FormAggregation:     %8.0f forms/sec' % (count / elapsed)
+
+
+if __name__ == '__main__':
+    main()
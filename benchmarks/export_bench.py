@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+"""
+Throughput of commcareapi.export.render_forms at 1, 4 and 16 processes.
+
+    python benchmarks/export_bench.py [number of forms]
+"""
+import copy
+import json
+import os
+import sys
+import time
+
+from commcareapi.export import render_forms
+from commcareapi.xform import XForm
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        '..', 'tests', 'test_fixtures')
+
+
+def read_fixture(name):
+    with open(os.path.join(FIXTURES, name), 'r') as f:
+        return f.read()
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    form_data = json.loads(read_fixture('form_data_with_0len_select1.json'))
+    definition = read_fixture('form_definition_for_0len.xml')
+    definitions = {XForm(definition).data_node.tag_xmlns: definition}
+
+    def forms():
+        for i in xrange(count):
+            data = copy.deepcopy(form_data)
+            data['id'] = str(i)
+            yield data
+
+    for processes in (1, 4, 16):
+        start = time.time()
+        for _ in render_forms(forms(), definitions, ['en'],
+                              processes=processes):
+            pass
+        elapsed = time.time() - start
+        print '%2d processes: %8.0f forms/sec' % (processes, count / elapsed)
+
+
+if __name__ == '__main__':
+    main()
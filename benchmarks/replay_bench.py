@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+"""
+Throughput of CaseReplay on synthetic forms: each case is created, then
+updated and finally closed by later forms.
+
+    python benchmarks/replay_bench.py [forms]
+"""
+import sys
+import tempfile
+import time
+
+from commcareapi.replay import CaseReplay, SqliteCaseTable
+
+
+def make_forms(count):
+    for i in range(count):
+        case_id = 'case-%d' % (i // 3)
+        block = {'@case_id': case_id, '@user_id': 'user',
+                 '@date_modified': '2014-01-01T00:00:%02d' % (i % 60)}
+        if i % 3 == 0:
+            block['create'] = {'case_type': 'mother', 'case_name': case_id,
+                               'owner_id': 'owner'}
+        elif i % 3 == 1:
+            block['update'] = {'visits': str(i), 'risk': 'high'}
+        else:
+            block['close'] = ''
+        yield {'id': 'form-%d' % i, 'received_on': '2014-01-01T%09d' % i,
+               'form': {'@xmlns': 'x', 'meta': {}, 'case': block,
+                        'question': 'answer', 'group': {'q': 'a'}}}
+
+
+def bench(name, replay, count):
+    forms = list(make_forms(count))
+    start = time.time()
+    events = sum(1 for _ in replay.replay(forms))
+    elapsed = time.time() - start
+    print '%-8s %8d forms %8d events %10.0f forms/min' % (
+        name, count, events, count / elapsed * 60)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    bench('memory', CaseReplay(), count)
+    with tempfile.NamedTemporaryFile(suffix='.db') as f:
+        bench('sqlite', CaseReplay(SqliteCaseTable(f.name)), count)
+
+
+if __name__ == '__main__':
+    main()
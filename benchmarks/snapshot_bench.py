@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+"""
+Size and reload time of a case snapshot compared with the indented JSON
+written by dump_api_fixtures.
+
+    python benchmarks/snapshot_bench.py [cases]
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'tests'))
+
+from commcareapi.comm_care_data import CommCareCase
+from commcareapi.snapshot import SnapshotReader, SnapshotWriter
+from memory_test import make_case
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    cases = [make_case(i) for i in range(count)]
+    directory = tempfile.mkdtemp()
+
+    json_path = os.path.join(directory, 'cases.json')
+    with open(json_path, 'w') as f:
+        json.dump(cases, f, indent=4)
+    start = time.time()
+    with open(json_path) as f:
+        loaded = [CommCareCase(data, validate=False) for data in json.load(f)]
+    json_seconds = time.time() - start
+
+    snapshot_path = os.path.join(directory, 'cases.snap')
+    with SnapshotWriter(snapshot_path, 'case') as writer:
+        for case in cases:
+            writer.write(case)
+    del loaded
+    start = time.time()
+    loaded = list(SnapshotReader(snapshot_path))
+    snapshot_seconds = time.time() - start
+    del loaded
+    start = time.time()
+    for case in SnapshotReader(snapshot_path):
+        pass
+    stream_seconds = time.time() - start
+
+    for name, path, seconds in (
+            ('json', json_path, json_seconds),
+            ('snapshot', snapshot_path, snapshot_seconds),
+            ('snapshot (streamed)', snapshot_path, stream_seconds)):
+        print '%-20s %10d bytes %7.2f s %9.0f cases/s' % (
+            name, os.path.getsize(path), seconds, count / seconds)
+    os.remove(json_path)
+    os.remove(snapshot_path)
+    os.rmdir(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+"""
+Startup cost of the package: import time of each module, and the time
+from interpreter start to the end of a first case() request against a
+local server. Each measurement runs in a fresh interpreter; the median
+of the runs is printed.
+
+    python benchmarks/startup_bench.py [runs]
+"""
+import BaseHTTPServer
+import json
+import os
+import subprocess
+import sys
+import threading
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+CASE = os.path.join(ROOT, 'tests', 'test_fixtures', 'case_response.json')
+
+IMPORT = """
+import time
+start = time.time()
+import %s
+print (time.time() - start) * 1000
+"""
+
+FIRST_REQUEST = """
+import time
+start = time.time()
+from commcareapi import comm_care_data
+comm_care_data.HOST = %r
+api = comm_care_data.CommCareAPI('domain', 'user', 'password')
+comm_care_data.CommCareResources(api).case('case_id')
+print (time.time() - start) * 1000
+"""
+
+MODULES = ['commcareapi.tracing', 'commcareapi.xform',
+           'commcareapi.comm_care_data', 'commcareapi.dump_api_fixtures',
+           'commcareapi.replay', 'commcareapi.export']
+
+
+class CaseHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        with open(CASE) as f:
+            body = f.read()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def median_ms(code, runs):
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    times = sorted(float(subprocess.check_output([sys.executable, '-c', code],
+                                                 env=env))
+                   for _ in range(runs))
+    return times[len(times) // 2]
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 7
+    for module in MODULES:
+        print '%-36s %7.1f ms' % ('import ' + module,
+                                  median_ms(IMPORT % module, runs))
+
+    server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), CaseHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    host = 'http://127.0.0.1:%d' % server.server_address[1]
+    print '%-36s %7.1f ms' % ('first case() request',
+                              median_ms(FIRST_REQUEST % host, runs))
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,28 @@
+#!/usr/bin/env python
+"""
+Micro-benchmark of XForm.get_questions on the test fixture definitions.
+
+    python benchmarks/xform_bench.py [repeats]
+"""
+import os
+import sys
+import timeit
+
+from commcareapi.xform import XForm
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        '..', 'tests', 'test_fixtures')
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    for name in ('test_xform_definition.xml', 'test_repeat_definition.xml'):
+        with open(os.path.join(FIXTURES, name), 'r') as f:
+            xform = XForm(f.read())
+        elapsed = min(timeit.repeat(lambda: xform.get_questions(['en']),
+                                    number=repeats, repeat=3))
+        print '%-30s %8.1f us/call' % (name, elapsed / repeats * 1e6)
+
+
+if __name__ == '__main__':
+    main()
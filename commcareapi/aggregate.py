@@ -0,0 +1,362 @@
+"""
+Dashboard aggregates over all the submissions of a form: option counts
+for select questions, summaries of numeric answers and the number of
+times each repeat group was filled in.
+
+    aggregation = FormAggregation.from_xform(XForm(definition), ['en'])
+    aggregation.add_forms(resources.list_forms(params={'xmlns': xmlns}))
+    aggregation.result()
+
+Accumulators are set up once from the get_questions output, and forms
+are read in batches: answers are gathered per question for the whole
+batch and each accumulator then takes them all at once. Aggregations
+are picklable, so workers can each aggregate part of the forms and
+their results be combined with merge().
+"""
+import collections
+import math
+
+from .tracing import traced
+
+NUMERIC_TYPES = frozenset(['int', 'integer', 'long', 'short', 'decimal',
+                           'double', 'float'])
+QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+
+class QuantileSketch(object):
+    """
+    Counts values in buckets whose bounds grow geometrically, so any
+    quantile is within relative_accuracy of the true value, in memory
+    that grows with the log of the range of values rather than their
+    number. Sketches with the same accuracy merge exactly.
+    """
+    def __init__(self, relative_accuracy=0.01):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.positive = collections.Counter()
+        self.negative = collections.Counter()
+        self.zeros = 0
+        self.count = 0
+
+    def _key(self, value):
+        return int(math.ceil(math.log(value) / self.log_gamma))
+
+    def _value(self, key):
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def add_values(self, values):
+        key = self._key
+        self.positive.update([key(v) for v in values if v > 0])
+        self.negative.update([key(-v) for v in values if v < 0])
+        self.zeros += sum(1 for v in values if v == 0)
+        self.count += len(values)
+
+    def merge(self, other):
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Can't merge sketches of different accuracy")
+        self.positive.update(other.positive)
+        self.negative.update(other.negative)
+        self.zeros += other.zeros
+        self.count += other.count
+
+    def quantile(self, q):
+        """ The q quantile (0 <= q <= 1), or None if there are no values """
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        for key in sorted(self.negative, reverse=True):
+            seen += self.negative[key]
+            if seen > rank:
+                return -self._value(key)
+        seen += self.zeros
+        if seen > rank:
+            return 0.0
+        for key in sorted(self.positive):
+            seen += self.positive[key]
+            if seen > rank:
+                return self._value(key)
+        return self._value(max(self.positive))
+
+
+class SelectCounts(object):
+    """ How often each option of a select or select1 was chosen """
+    kind = 'select'
+
+    def __init__(self, question):
+        self.label = question['label']
+        self.options = collections.OrderedDict(
+            (option['value'], option['label'])
+            for option in question.get('options', []))
+        self.multiple = question['tag'] == 'select'
+        self.answered = 0
+        self.counts = collections.Counter()
+
+    def add_values(self, values):
+        self.answered += len(values)
+        if self.multiple:
+            chosen = []
+            for value in values:
+                chosen.extend(('%s' % value).split())
+            self.counts.update(chosen)
+        else:
+            self.counts.update([('%s' % value).strip() for value in values])
+
+    def merge(self, other):
+        self.answered += other.answered
+        self.counts.update(other.counts)
+
+    def result(self):
+        # options not in the definition (e.g. from an older build) are
+        # counted too, after the known ones
+        counts = collections.OrderedDict(
+            (value, self.counts[value]) for value in self.options)
+        for value in sorted(self.counts):
+            if value not in counts:
+                counts[value] = self.counts[value]
+        return {'type': self.kind, 'label': self.label,
+                'answered': self.answered, 'counts': counts,
+                'labels': dict(self.options)}
+
+
+class NumericSummary(object):
+    """
+    Count, min, max, mean and approximate quantiles of a number. The total
+    is kept exactly, as non-overlapping partial sums, so merged summaries
+    have the same mean as one summary of all the values.
+    """
+    kind = 'numeric'
+
+    def __init__(self, question, relative_accuracy=0.01):
+        self.label = question['label']
+        self.count = 0
+        self.invalid = 0
+        self.partials = []
+        self.min = None
+        self.max = None
+        self.sketch = QuantileSketch(relative_accuracy)
+
+    def add_values(self, values):
+        numbers = []
+        for value in values:
+            try:
+                number = float(value)
+            except (TypeError, ValueError):
+                number = None
+            if number is None or math.isnan(number) or math.isinf(number):
+                self.invalid += 1
+            else:
+                numbers.append(number)
+        if not numbers:
+            return
+        self.count += len(numbers)
+        _add_exact(self.partials, numbers)
+        low, high = min(numbers), max(numbers)
+        self.min = low if self.min is None else min(self.min, low)
+        self.max = high if self.max is None else max(self.max, high)
+        self.sketch.add_values(numbers)
+
+    def merge(self, other):
+        self.count += other.count
+        self.invalid += other.invalid
+        _add_exact(self.partials, other.partials)
+        for name, pick in (('min', min), ('max', max)):
+            values = [v for v in (getattr(self, name), getattr(other, name))
+                      if v is not None]
+            setattr(self, name, pick(values) if values else None)
+        self.sketch.merge(other.sketch)
+
+    def result(self):
+        return {'type': self.kind, 'label': self.label, 'count': self.count,
+                'invalid': self.invalid, 'min': self.min, 'max': self.max,
+                'mean': math.fsum(self.partials) / self.count
+                        if self.count else None,
+                'quantiles': dict((q, self.sketch.quantile(q))
+                                  for q in QUANTILES)}
+
+
+def _add_exact(partials, values):
+    """
+    Add values to partials, a list of non-overlapping floats whose sum is
+    exactly the sum of everything added (as in the recipe math.fsum is
+    based on)
+    """
+    for x in values:
+        i = 0
+        for y in partials:
+            if abs(x) < abs(y):
+                x, y = y, x
+            high = x + y
+            low = y - (high - x)
+            if low:
+                partials[i] = low
+                i += 1
+            x = high
+        partials[i:] = [x]
+
+
+class RepeatCounts(object):
+    """ A histogram of the number of entries in a repeat group """
+    kind = 'repeat'
+
+    def __init__(self, question):
+        self.label = question['label']
+        self.histogram = collections.Counter()
+
+    def add_values(self, values):
+        self.histogram.update(values)
+
+    def merge(self, other):
+        self.histogram.update(other.histogram)
+
+    def result(self):
+        forms = sum(self.histogram.values())
+        entries = sum(length * count
+                      for length, count in self.histogram.items())
+        return {'type': self.kind, 'label': self.label,
+                'histogram': dict(self.histogram),
+                'mean': float(entries) / forms if forms else None}
+
+
+class FormAggregation(object):
+    """
+    Aggregates the answers to the questions (as returned by
+    XForm.get_questions) of a form. select and select1 questions are
+    always counted; numeric and repeats are the paths of the questions
+    to summarise as numbers and of the groups that are repeats, which
+    from_xform reads from the binds and body of the form.
+
+    Questions inside a repeat are aggregated over every entry.
+    """
+    def __init__(self, questions, numeric=(), repeats=(),
+                 relative_accuracy=0.01):
+        self.numeric = frozenset(numeric)
+        self.repeats = frozenset(repeats)
+        self.relative_accuracy = relative_accuracy
+        self.accumulators = collections.OrderedDict()
+        self.forms = 0
+        # answer paths start with the data node, e.g. /data/question
+        data_nodes = set(question['value'].split('/')[1]
+                         for question in questions)
+        self.plan = []
+        if len(data_nodes) == 1:
+            self.plan = self._plan(questions, '/%s/' % data_nodes.pop())
+
+    @classmethod
+    def from_xform(cls, xform, langs, **kwargs):
+        numeric = set()
+        for bind in xform.model_node.findall('{f}bind'):
+            type = bind.attrib.get('type', '').split(':')[-1]
+            if type in NUMERIC_TYPES:
+                numeric.add(bind.attrib['nodeset'])
+        repeats = set(repeat.attrib['nodeset']
+                      for repeat in xform.find('{h}body').xml.iter(
+                          '{http://www.w3.org/2002/xforms}repeat'))
+        return cls(xform.get_questions(langs), numeric=numeric,
+                   repeats=repeats, **kwargs)
+
+    def _plan(self, questions, context):
+        """
+        A list of (keys, accumulator index, child plan) for questions,
+        where keys lead from the data at context to the answer, and only
+        repeats have a child plan.
+        """
+        plan = []
+        for question in questions:
+            path = question['value']
+            if not path.startswith(context):
+                continue
+            keys = tuple(path[len(context):].split('/'))
+            tag = question['tag']
+            if tag == 'group' and path in self.repeats:
+                index = self._add(path, RepeatCounts(question))
+                plan.append((keys, index,
+                             self._plan(question.get('children', []),
+                                        path + '/')))
+            elif tag == 'group':
+                # answers in a group are nested in the same data
+                plan.extend(self._plan(question.get('children', []),
+                                       context))
+            elif tag in ('select', 'select1'):
+                plan.append((keys, self._add(path, SelectCounts(question)),
+                             None))
+            elif path in self.numeric:
+                plan.append((keys, self._add(path, NumericSummary(
+                    question, self.relative_accuracy)), None))
+        return plan
+
+    def _add(self, path, accumulator):
+        self.accumulators[path] = accumulator
+        return len(self.accumulators) - 1
+
+    @traced('FormAggregation.add_batch')
+    def add_batch(self, forms):
+        """ Aggregate a list of CommCareForm objects (or form data) """
+        pending = [[] for _ in self.accumulators]
+        for form in forms:
+            form = getattr(form, 'form_data', form)
+            _collect(self.plan, form.get('form') or {}, pending)
+        for accumulator, values in zip(self.accumulators.values(), pending):
+            if values:
+                accumulator.add_values(values)
+        self.forms += len(forms)
+
+    def add_forms(self, forms, batch_size=1000):
+        batch = []
+        for form in forms:
+            batch.append(form)
+            if len(batch) == batch_size:
+                self.add_batch(batch)
+                batch = []
+        if batch:
+            self.add_batch(batch)
+        return self
+
+    def merge(self, other):
+        """ Add the forms aggregated by other, for the same questions """
+        if list(other.accumulators) != list(self.accumulators):
+            raise ValueError("Can't merge aggregations of different questions")
+        for mine, theirs in zip(self.accumulators.values(),
+                                other.accumulators.values()):
+            mine.merge(theirs)
+        self.forms += other.forms
+        return self
+
+    def result(self):
+        """ {'forms': count, 'questions': {path: summary}} """
+        return {'forms': self.forms,
+                'questions': collections.OrderedDict(
+                    (path, accumulator.result())
+                    for path, accumulator in self.accumulators.items())}
+
+
+def _lookup(data, keys):
+    for key in keys:
+        if not isinstance(data, dict):
+            return None
+        data = data.get(key)
+    return data
+
+
+def _collect(plan, data, pending):
+    for keys, index, children in plan:
+        value = _lookup(data, keys)
+        if children is None:
+            if isinstance(value, basestring) and value.strip():
+                pending[index].append(value)
+            elif isinstance(value, (int, long, float)) and \
+                    not isinstance(value, bool):
+                pending[index].append(value)
+            continue
+        if value is None or value == '':
+            entries = []
+        elif isinstance(value, list):
+            entries = value
+        else:
+            # a repeat filled in once is not a list in the form json
+            entries = [value]
+        pending[index].append(len(entries))
+        for entry in entries:
+            if isinstance(entry, dict):
+                _collect(children, entry, pending)
@@ -1,31 +1,88 @@
+import collections
+import copy
+import os
+import socket
 import sys
+import threading
+import time
 import urllib2
 import string
 import json
 import drest
-from jsonpath_rw import parse as jsonpath_parse
 
-from .xform import parse_xml
+# jsonpath_rw and lxml (through .xform) are slow to import and only some
+# code paths need them, so they are imported on first use.
+from .tracing import span, traced
 
 HOST = 'https://www.commcarehq.org'
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+
+_jsonpath_parsers = {}
 
 
 def jsonpath(json, expression):
-    parser = jsonpath_parse(expression)
-    matches = parser.find(json)
-    return [o.value for o in matches]
+    with span('jsonpath', expression=expression):
+        parser = _jsonpath_parsers.get(expression)
+        if parser is None:
+            from jsonpath_rw import parse as jsonpath_parse
+            parser = _jsonpath_parsers[expression] = \
+                jsonpath_parse(expression)
+        matches = parser.find(json)
+        return [o.value for o in matches]
+
+
+def fixed_path(data, *keys):
+    """
+    Matches of the jsonpath expression '$.key1.key2...', without parsing
+    it: a list holding the value, or an empty list if a key is missing.
+    """
+    for key in keys:
+        if not isinstance(data, dict) or key not in data:
+            return []
+        data = data[key]
+    return [data]
+
+
+class CommCareRequestHandler(drest.request.RequestHandler):
+    """
+    drest request handler with tracing spans around the HTTP request and
+    the JSON decoding of the response. If a rate_limiter is set, each
+    request first waits for a token for its domain.
+    """
+    domain = None
+    rate_limiter = None
+
+    def _wait_for_rate_limit(self):
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire(self.domain)
+
+    def _make_request(self, url, method, payload=None, headers=None):
+        self._wait_for_rate_limit()
+        with span('http', method=method, url=url):
+            return super(CommCareRequestHandler, self)._make_request(
+                url, method, payload, headers)
+
+    def _deserialize(self, data):
+        with span('json', bytes=len(data)):
+            return super(CommCareRequestHandler, self)._deserialize(data)
 
 
 class CommCareAPI(drest.api.API):
 
-    def __init__(self, domain, user, password, limit=100, debug=False):
+    def __init__(self, domain, user, password, limit=100, debug=False,
+                 request_handler=CommCareRequestHandler, rate_limiter=None):
         baseurl = self.commcare_base(domain, 'v0.4')
         extra_params = dict(limit=limit)
         super(CommCareAPI, self).__init__(baseurl=baseurl,
                                           extra_params=extra_params,
                                           auth_mech='basic',
+                                          request_handler=request_handler,
                                           debug=debug)
         super(CommCareAPI, self).auth(user, password)
+        self.domain = domain
+        self.request.domain = domain
+        self.request.rate_limiter = rate_limiter
 
     def commcare_base(self, domain, version):
         return '{host}/a/{domain}/api/{version}/'.format(
@@ -34,6 +91,145 @@ class CommCareAPI(drest.api.API):
             version=version)
 
 
+class AdaptivePageSize(object):
+    """
+    Chooses the limit for each page fetched by get_all_resources.
+
+    The limit grows while pages come back well within the latency
+    (seconds) and response size (bytes) budgets, shrinks in proportion
+    when a page goes over, and is halved before retrying a page that
+    failed. Every decision is appended to history.
+    """
+    def __init__(self, min_limit=10, max_limit=1000, limit=100,
+                 target_seconds=2.0, target_bytes=None, max_retries=3):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = self.clamp(limit)
+        self.target_seconds = target_seconds
+        self.target_bytes = target_bytes
+        self.max_retries = max_retries
+        self.history = []
+
+    def clamp(self, limit):
+        return max(self.min_limit, min(self.max_limit, int(limit)))
+
+    def page_fetched(self, offset, objects, seconds, size=None):
+        ratios = [seconds / self.target_seconds]
+        if self.target_bytes and size is not None:
+            ratios.append(float(size) / self.target_bytes)
+        ratio = max(ratios)
+        limit = self.limit
+        if ratio > 1:
+            self.limit = self.clamp(limit / ratio)
+        elif ratio < 0.5 and objects >= limit:
+            self.limit = self.clamp(limit * 2)
+        self.history.append({'offset': offset, 'limit': limit,
+                             'objects': objects, 'seconds': seconds,
+                             'bytes': size, 'error': None,
+                             'next_limit': self.limit})
+
+    def page_failed(self, offset, seconds, error):
+        limit = self.limit
+        self.limit = self.clamp(limit // 2)
+        self.history.append({'offset': offset, 'limit': limit,
+                             'objects': 0, 'seconds': seconds,
+                             'bytes': None, 'error': str(error),
+                             'next_limit': self.limit})
+
+
+def is_retryable(error):
+    if isinstance(error, socket.error):
+        return True
+    if isinstance(error, drest.exc.dRestRequestError):
+        return error.response.status >= 500
+    # drest re-raises timeouts, connection resets and unknown hosts as
+    # dRestAPIError
+    if isinstance(error, drest.exc.dRestAPIError):
+        return True
+    return False
+
+
+class ResourceValidator(object):
+    """
+    Checks that objects have the keys given in rules (and that each key
+    in nested holds a dictionary with the keys of its own rules). Rules
+    are compiled once, so one validator can check many objects.
+    """
+    def __init__(self, rules, nested=None):
+        self.required = tuple(rules)
+        self.nested = [(key, tuple(nested_rules))
+                       for key, nested_rules in (nested or {}).items()]
+
+    def errors(self, data):
+        """
+        Return a list of problems with data, empty if it is valid.
+        """
+        if not isinstance(data, dict):
+            return ['not a dictionary']
+        errors = ['missing %s' % key for key in self.required
+                  if key not in data]
+        for key, required in self.nested:
+            value = data.get(key)
+            if not isinstance(value, dict):
+                if key in data:
+                    errors.append('%s is not a dictionary' % key)
+                continue
+            errors.extend('missing %s.%s' % (key, nested_key)
+                          for nested_key in required
+                          if nested_key not in value)
+        return errors
+
+    def validate(self, data):
+        errors = self.errors(data)
+        if errors:
+            raise CommCareResourceValidationError(', '.join(errors))
+        return True
+
+    def validate_page(self, objects, sample=1, start=0):
+        """
+        Check a page of objects, or one in every `sample` of them, and
+        return (index, id, errors) for each invalid object checked. start
+        is the index of the first object in the whole listing, so a
+        sample spans pages.
+        """
+        invalid = []
+        first = -start % sample
+        for index in xrange(first, len(objects), sample):
+            data = objects[index]
+            errors = self.errors(data)
+            if errors:
+                object_id = data.get('id') if isinstance(data, dict) else None
+                invalid.append((start + index, object_id, errors))
+        return invalid
+
+    def check_page(self, objects, validate=True, start=0):
+        """
+        Raise CommCareResourceValidationError describing every invalid
+        object of a page checked according to validate (as for
+        should_validate).
+        """
+        if not validate:
+            return
+        sample = 1 if validate is True else validate
+        invalid = self.validate_page(objects, sample, start)
+        if invalid:
+            raise CommCareResourceValidationError('; '.join(
+                'object %d (id %s): %s' % (index, object_id, ', '.join(errors))
+                for index, object_id, errors in invalid))
+
+
+def should_validate(validate, index):
+    """
+    validate is True (check everything), False or 0 (trusted, check
+    nothing) or a number N to check one object in N.
+    """
+    if validate is True:
+        return True
+    if not validate:
+        return False
+    return index % validate == 0
+
+
 class CommCareForm(object):
 
     form_validator = {
@@ -44,21 +240,27 @@ class CommCareForm(object):
         u"metadata": None,
     }
 
+    # "case" and "@version" are not required: forms without case blocks
+    # exist (see has_case) and HQ omits @version on some update forms
     form_form_validator = {
-        u"case": None,
         u"@xmlns": None,
         u"meta": None,
-        u"@version": None,
     }
 
-    def __init__(self, form_data):
+    validator = ResourceValidator(form_validator,
+                                  {u"form": form_form_validator})
+
+    def __init__(self, form_data, validate=True):
+        """
+        Pass validate=False to skip validation of trusted data.
+        """
         self.form_data = form_data
-        if not self.is_form_valid:
+        if validate and not self.is_form_valid():
             raise CommCareResourceValidationError('Form not valid')
 
     @property
     def case(self):
-        matches = jsonpath(self.form_data, '$.form.case')
+        matches = fixed_path(self.form_data, 'form', 'case')
         if len(matches) == 1:
             return matches[0]
         else:
@@ -82,14 +284,18 @@ class CommCareForm(object):
 
     @property
     def case_updated(self):
-        matches = jsonpath(self.form_data, '$.form.case.@case_updated')
+        matches = fixed_path(self.form_data, 'form', 'case', '@case_updated')
         return matches[0]
 
     @property
     def form_id(self):
-        matches = jsonpath(self.form_data, '$.id')
+        matches = fixed_path(self.form_data, 'id')
         return matches[0]
 
+    @property
+    def received_on(self):
+        return self.form_data.get('received_on')
+
     @property
     def xmlns_id(self):
         form_data = self.form_data
@@ -98,8 +304,11 @@ class CommCareForm(object):
 
     @property
     def xmlns_unique_id(self):
+        """ xmlns + "v" + version, or None if the form has no @version """
         form_data = self.form_data
         version = form_data['form'].get('@version')
+        if version is None or self.xmlns_id is None:
+            return None
         xmlns_unique_id = self.xmlns_id + "v" + version
         return xmlns_unique_id
 
@@ -108,15 +317,9 @@ class CommCareForm(object):
         return self.form_data['form']['case'].get('@caseid')
 
     def is_form_valid(self):
-        try:
-            CommCareResources.validate(self.form_data,
-                                       self.form_validator)
-            CommCareResources.validate(self.form_data.get('form'),
-                                       self.form_form_validator)
-            return True
-        except CommCareResourceValidationError:
-            return False
+        return not self.validator.errors(self.form_data)
 
+    @traced('make_human_readable')
     def make_human_readable(self, form_definition):
         """
         form_definition is a list of dictionaries retrieved by running
@@ -195,8 +398,12 @@ class CommCareCase(object):
         u"date_opened": None,
     }
 
+    validator = ResourceValidator(case_validator,
+                                  {u"properties": case_properties_validator})
+
     # case_data can be both json or dictionary representation of a commcare case
-    def __init__(self, case_data):
+    # pass validate=False to skip validation of trusted data
+    def __init__(self, case_data, validate=True):
         if not isinstance(case_data, dict):
             try:
                 self.case_data = json.loads(case_data)
@@ -205,18 +412,11 @@ class CommCareCase(object):
         else:
             self.case_data = case_data
 
-        if not self.is_case_valid:
+        if validate and not self.is_case_valid():
             raise CommCareResourceValidationError('Case not valid')
 
     def is_case_valid(self):
-        try:
-            CommCareResources.validate(self.case_data,
-                                       self.case_validator)
-            CommCareResources.validate(self.case_data.get('properties'),
-                                       self.case_properties_validator)
-            return True
-        except CommCareResourceValidationError:
-            return False
+        return not self.validator.errors(self.case_data)
 
     @property
     def case_id(self):
@@ -243,50 +443,207 @@ class CommCareResourceValidationError(Exception):
     pass
 
 
+class CommCareDirectory(object):
+    """
+    All users and groups of a domain, indexed for in-memory lookups.
+
+    The full user and group lists are paged in on first use and fetched
+    again once they are older than ttl seconds.
+    """
+    def __init__(self, resources, ttl=3600):
+        self.resources = resources
+        self.ttl = ttl
+        self.loaded_at = None
+
+    def refresh(self):
+        users = self.resources.list_users()
+        groups = self.resources.list_groups()
+
+        self._users = dict((user['id'], user) for user in users)
+        self._usernames = dict((user['username'], user) for user in users)
+        self._groups = dict((group['id'], group) for group in groups)
+        self._members = {}
+        self._user_groups = {}
+        for group in groups:
+            members = [self._users[user_id] for user_id
+                       in group.get('users', []) if user_id in self._users]
+            self._members[group['id']] = members
+            for user in members:
+                self._user_groups.setdefault(user['id'], []).append(group)
+        self.loaded_at = time.time()
+
+    def ensure_fresh(self):
+        if self.loaded_at is None or \
+                time.time() - self.loaded_at > self.ttl:
+            self.refresh()
+        return self
+
+    def user(self, user_id):
+        return self.ensure_fresh()._users.get(user_id)
+
+    def user_by_username(self, username):
+        return self.ensure_fresh()._usernames.get(username)
+
+    def group(self, group_id):
+        return self.ensure_fresh()._groups.get(group_id)
+
+    def members(self, group_id):
+        return self.ensure_fresh()._members.get(group_id, [])
+
+    def groups_for_user(self, user_id):
+        return self.ensure_fresh()._user_groups.get(user_id, [])
+
+    def owner(self, owner_id):
+        """
+        A case owner may be a user or a (case sharing) group. Returns the
+        user or group dictionary, or None if the owner is unknown.
+        """
+        return self.user(owner_id) or self.group(owner_id)
+
+
+class _Call(object):
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.done_at = None
+        self.followers = 0
+
+
+class SingleFlight(object):
+    """
+    Coalesces concurrent identical calls: while a call for a key is in
+    flight, other callers for the same key wait for it and get the same
+    result, or the same exception, instead of making their own request.
+    If window is given, successful results are also reused for `window`
+    seconds after they come back, to absorb bursts.
+
+    Each caller gets its own copy (made by copy) of a shared result, so
+    callers can modify what they get.
+    """
+    def __init__(self, window=0, copy=copy.deepcopy):
+        self.window = window
+        self.copy = copy
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.finished = collections.deque()
+        self.requests = 0
+        self.shared = 0
+
+    def _expire(self, now):
+        finished = self.finished
+        while finished and now - finished[0][0] > self.window:
+            done_at, key, call = finished.popleft()
+            if self.calls.get(key) is call:
+                del self.calls[key]
+
+    def do(self, key, fn):
+        with self.lock:
+            self._expire(time.time())
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = _Call()
+                self.requests += 1
+            else:
+                call.followers += 1
+                self.shared += 1
+
+        if leader:
+            try:
+                call.result = fn()
+            except:
+                call.error = sys.exc_info()
+            with self.lock:
+                call.done_at = time.time()
+                if call.error is None and self.window > 0:
+                    self.finished.append((call.done_at, key, call))
+                    shared = True
+                else:
+                    del self.calls[key]
+                    shared = call.followers > 0
+            call.event.set()
+        else:
+            call.event.wait()
+            shared = True
+
+        if call.error is not None:
+            raise call.error[0], call.error[1], call.error[2]
+        # nobody else can see an unshared result, so it needs no copy
+        return self.copy(call.result) if shared else call.result
+
+
 class CommCareResources(object):
 
-    def __init__(self, api):
+    def __init__(self, api, lookup_window=0, hedger=None, scheduler=None):
         api.add_resource('case')
         api.add_resource('form')
         api.add_resource('fixture')
         api.add_resource('user')
         api.add_resource('group')
         self.api = api
+        self.lookups = SingleFlight(window=lookup_window)
+        self.hedger = hedger
+        self.scheduler = scheduler
 
     @classmethod
     def validate(cls, data, rules):
-        rules_keys = set(rules.keys())
-        data_keys = set(data.keys())
-
-        if rules_keys.issubset(data_keys):
+        missing = [key for key in rules if key not in data]
+        if not missing:
             return True
         else:
-            raise CommCareResourceValidationError(str(data_keys - rules_keys))
+            raise CommCareResourceValidationError(str(missing))
 
     def fixture(self):
-        fixtures_list = self.get_all_resources('fixture')
-        
-        fixtures = []
-        for fixture in fixtures_list:
-            fixtures.append(fixture)
-        
-        return fixtures 
+        return self.lookups.do(
+            ('fixture',), lambda: list(self.get_all_resources('fixture')))
+
+    def _scheduled(self, priority, fn):
+        """
+        Call fn in a slot of the scheduler (see priority.PriorityScheduler),
+        if there is one.
+        """
+        if self.scheduler is None:
+            return fn()
+        with self.scheduler.slot(priority):
+            return fn()
+
+    def _get(self, resource, id, params=None, priority=None):
+        """
+        GET one object's data, sharing the request with concurrent
+        identical lookups (see SingleFlight), and hedged if there is a
+        hedger (see hedging.Hedger).
+
+        Only lookups of the same priority are shared, so an interactive
+        lookup never waits on a bulk one still queued in the scheduler.
+        """
+        params = params or {}
+        if self.scheduler is not None:
+            priority = priority or self.scheduler.current_priority()
+        key = (resource, id, tuple(sorted(params.items())), priority)
+        if self.hedger is not None:
+            def get():
+                return self.hedger.get(resource, id, params).data
+        else:
+            def get():
+                return getattr(self.api, resource).get(id, params).data
+        return self.lookups.do(key, lambda: self._scheduled(priority, get))
 
     def list_users(self):
         """
         https://www.commcarehq.org/a/[domain]/api/[version]/user/[user_id]
         """
-        resp = self.api.user.get()
-        return resp.data['objects']
+        return list(self.get_all_resources('user'))
 
     def list_groups(self):
         """
         https://www.commcarehq.org/a/[domain]/api/[version]/group/
         """
-        resp = self.api.group.get()
-        return resp.data['objects']
+        return list(self.get_all_resources('group'))
 
-    def get_all_resources(self, resource, params=None):
+    def get_all_resources(self, resource, params=None, page_size=None,
+                          priority=None, validator=None, validate=True):
         """ Page through API responses
 
             There is a hard limit on the Case API to return 100 per request.
@@ -298,6 +655,17 @@ class CommCareResources(object):
                 "next": "?limit=10&offset=10",
                 "limit": 10
             }
+
+            If page_size (an AdaptivePageSize) is given, the limit is
+            chosen per request and failed pages are retried with a smaller
+            limit. The offset always advances by the number of objects
+            received, so pages never overlap or leave gaps.
+
+            Each page is fetched in a scheduler slot of the given
+            priority, if there is a scheduler.
+
+            If a validator (a ResourceValidator) is given, each page is
+            checked with its check_page before any of it is yielded.
         """
         if params is None:
             params = {}
@@ -306,31 +674,90 @@ class CommCareResources(object):
         more_pages = True
         while more_pages:
             params.update({'offset': count})
-            resp = getattr(self.api, resource).get(params=params)
+            with span('get_all_resources.page', resource=resource,
+                      offset=count):
+                if page_size is None:
+                    get = getattr(self.api, resource).get
+                    resp = self._scheduled(priority,
+                                           lambda: get(params=params))
+                else:
+                    resp = self._scheduled(
+                        priority, lambda: self._get_adaptive_page(
+                            resource, params, page_size))
             objects = resp.data.get('objects', [])
+            if validator is not None:
+                validator.check_page(objects, validate, count)
             for case in objects:
                 yield case
 
             count += len(objects)
-            meta = resp.data.get('meta')
+            meta = resp.data.get('meta') or {}
             more_pages = (count < meta.get('total_count', 0))
 
-    def list_cases(self, params={}):
+    def _get_adaptive_page(self, resource, params, page_size):
+        retries = 0
+        while True:
+            params['limit'] = page_size.limit
+            start = time.time()
+            try:
+                resp = getattr(self.api, resource).get(params=params)
+            except Exception as e:
+                if not is_retryable(e) or retries >= page_size.max_retries:
+                    raise
+                retries += 1
+                page_size.page_failed(params['offset'],
+                                      time.time() - start, e)
+                continue
+            size = (resp.headers or {}).get('content-length')
+            page_size.page_fetched(params['offset'],
+                                   len(resp.data.get('objects', [])),
+                                   time.time() - start,
+                                   int(size) if size is not None else None)
+            return resp
+
+    def list_cases(self, params={}, validate=True, priority=None):
         """
         https://www.commcarehq.org/a/[domain]/api/v0.3/case/
         structure of resp;
         -> meta [pagination?]
         -> objects [list of cases]
-        """
-        list_cases_data = self.get_all_resources('case', params=params)
-        list_cases = []
-
-        for case in list_cases_data:
-            list_cases.append(CommCareCase(case))
 
-        return list_cases
-
-    def case(self, case_id):
+        validate may be True, False (trusted) or N to validate one case
+        in N.
+        """
+        list_cases_data = self.get_all_resources(
+            'case', params=params, priority=priority,
+            validator=CommCareCase.validator, validate=validate)
+        # pages are validated as they arrive
+        return [CommCareCase(case, validate=False)
+                for case in list_cases_data]
+
+    def list_forms(self, xmlns=None, received_on_start=None,
+                   received_on_end=None, params=None, page_size=None,
+                   validate=True, priority=None):
+        """
+        https://www.commcarehq.org/a/[domain]/api/v0.4/form/
+        Yields CommCareForm objects ordered by received_on, one page at a
+        time. received_on_start and received_on_end are inclusive.
+        validate is as for list_cases.
+        """
+        params = dict(params or {})
+        if xmlns is not None:
+            params['xmlns'] = xmlns
+        if received_on_start is not None:
+            params['received_on_start'] = received_on_start
+        if received_on_end is not None:
+            params['received_on_end'] = received_on_end
+        params.setdefault('order_by', 'received_on')
+
+        forms = self.get_all_resources('form', params=params,
+                                       page_size=page_size, priority=priority,
+                                       validator=CommCareForm.validator,
+                                       validate=validate)
+        for form in forms:
+            yield CommCareForm(form, validate=False)
+
+    def case(self, case_id, priority=None):
         """
         https://www.commcarehq.org/a/[domain]/api/v0.3/case/[case_id]/
         Case as documented:
@@ -364,18 +791,17 @@ class CommCareResources(object):
         properties = fields.DictFild('properties')
         indices = fields.DictField('indices')
         """
-        resp = self.api.case.get(case_id)
-        return CommCareCase(resp.data)
+        return CommCareCase(self._get('case', case_id, priority=priority))
 
-    def form(self, form_id):
+    def form(self, form_id, priority=None):
         try:
-            resp = self.api.form.get(form_id)
+            data = self._get('form', form_id, priority=priority)
         except drest.exc.dRestRequestError as e:
             print >> sys.stderr, e.response.status
             print >> sys.stderr, e.response.data
             print >> sys.stderr, e.response.headers
         else:
-            return CommCareForm(resp.data)
+            return CommCareForm(data)
 
 
 class CommCareSuiteXML():
@@ -388,14 +814,46 @@ class CommCareSuiteXML():
         download_url = HOST + '/a/' + domain + '/apps/download/' + app_id
         self.download_url = download_url
 
-    def get_suite_xml(self):
+    def get_suite_xml(self, etag=None, last_modified=None):
         """
         Calls Commcare to get suite.xml and adds to instance
+
+        If etag or last_modified (from a previous response) are given the
+        request is conditional, and None is returned when the suite has
+        not changed.
         """
         url = self.download_url + '/suite.xml'
-        suite_xml = urllib2.urlopen(url).read()
-        self.validate_suite_xml(suite_xml)
+        request = urllib2.Request(url)
+        if etag:
+            request.add_header('If-None-Match', etag)
+        if last_modified:
+            request.add_header('If-Modified-Since', last_modified)
+        try:
+            response = urllib2.urlopen(request)
+        except urllib2.HTTPError as e:
+            if e.code == 304:
+                return None
+            raise
+        headers = response.info()
+        self.etag = headers.getheader('ETag')
+        self.last_modified = headers.getheader('Last-Modified')
+        chunks = []
+
+        def read_chunks():
+            while True:
+                chunk = response.read(DOWNLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+                yield chunk
+
+        # parse while downloading rather than after
+        from .xform import parse_xml_chunks
+        suite_tree = parse_xml_chunks(read_chunks())
+        self.validate_suite_xml(suite_tree)
+        suite_xml = ''.join(chunks)
         self.suite_xml = suite_xml
+        self.suite_tree = suite_tree
         return suite_xml
 
     @classmethod
@@ -407,6 +865,7 @@ class CommCareSuiteXML():
 
         resources = []
         locations = []
+        from .xform import parse_xml
         tree = parse_xml(suite_xml)
         xforms = [child for child in tree if child.tag == 'xform']
         if xforms:
@@ -462,6 +921,7 @@ class CommCareSuiteXML():
         """
         Return a dictionary containing the id and the location
         """
+        from .xform import parse_xml
         tree = parse_xml(suite_xml)
         xforms = [child for child in tree if child.tag == 'xform']
         resources = {}
@@ -477,10 +937,159 @@ class CommCareSuiteXML():
 
     @classmethod
     def get_suite_version(cls, suite_xml):
-        tree = parse_xml(suite_xml)
-        return tree.attrib['version']
+        # only the root element is needed, so stop at its start tag
+        from .xform import iterparse_xml
+        for event, suite in iterparse_xml(suite_xml, events=('start',)):
+            return suite.attrib['version']
 
     def get_xform_definition(self, resource_snippet):
         url = self.download_url + resource_snippet.lstrip('.')
         form_definition = urllib2.urlopen(url).read()
         return form_definition
+
+    def get_xform_fingerprints(self, suite_xml, known=None):
+        """
+        Map the resource id (xmlns id and version, as in
+        get_xform_locations) of each xform in suite_xml to the structural
+        fingerprint of its definition, so resources whose fingerprints
+        match can share parsed definitions. Ids in known, a map from an
+        earlier call, are not downloaded again.
+        """
+        from .xform import XForm
+        known = known or {}
+        fingerprints = {}
+        for resource_id, location in \
+                self.get_xform_locations(suite_xml).items():
+            if resource_id in known:
+                fingerprints[resource_id] = known[resource_id]
+            else:
+                definition = self.get_xform_definition(location)
+                fingerprints[resource_id] = XForm(definition).fingerprint()
+        return fingerprints
+
+
+class CommCareSuiteWatcher(object):
+    """
+    Polls suite.xml for new app builds using conditional requests, so an
+    unchanged build costs a single 304. The last seen suite is persisted
+    to state_file (if given) so polling can resume after a restart.
+    """
+    def __init__(self, suite, state_file=None):
+        self.suite = suite
+        self.state_file = state_file
+        self.state = {}
+        if state_file and os.path.exists(state_file):
+            with open(state_file, 'r') as f:
+                self.state = json.load(f)
+
+    @property
+    def version(self):
+        return self.state.get('version')
+
+    @property
+    def xform_locations(self):
+        return self.state.get('xform_locations', {})
+
+    def check(self):
+        """
+        Returns None if the suite has not changed since the last check,
+        otherwise a dictionary with the new version and the 'added' and
+        'removed' xform locations. Resource ids include the xform version,
+        so a re-versioned xform appears as added.
+        """
+        suite_xml = self.suite.get_suite_xml(
+            etag=self.state.get('etag'),
+            last_modified=self.state.get('last_modified'))
+        if suite_xml is None:
+            return None
+
+        version = CommCareSuiteXML.get_suite_version(self.suite.suite_tree)
+        old_locations = self.xform_locations
+        new_locations = CommCareSuiteXML.get_xform_locations(
+            self.suite.suite_tree)
+        changed = version != self.version
+        self.state = {
+            'etag': self.suite.etag,
+            'last_modified': self.suite.last_modified,
+            'version': version,
+            'xform_locations': new_locations,
+        }
+        self.save()
+        if not changed:
+            return None
+
+        return {
+            'version': version,
+            'added': dict((k, v) for k, v in new_locations.items()
+                          if k not in old_locations),
+            'removed': dict((k, v) for k, v in old_locations.items()
+                            if k not in new_locations),
+        }
+
+    def get_changed_xform_definitions(self, change):
+        """
+        Download only the xforms added by a change returned from check.
+        """
+        return dict((resource_id, self.suite.get_xform_definition(location))
+                    for resource_id, location in change['added'].items())
+
+    def save(self):
+        if self.state_file:
+            with open(self.state_file, 'w') as f:
+                json.dump(self.state, f)
+
+
+class CommCareFormSync(object):
+    """
+    Incrementally downloads forms received since the last sync.
+
+    The received_on of the newest form seen, and the ids of the forms
+    received at exactly that time, are persisted to state_file. The next
+    sync starts from that received_on (inclusive) and skips those ids, so
+    forms at the boundary are neither missed nor yielded twice.
+    """
+    def __init__(self, resources, state_file=None, xmlns=None):
+        self.resources = resources
+        self.state_file = state_file
+        self.xmlns = xmlns
+        self.state = {'received_on': None, 'seen_ids': []}
+        if state_file and os.path.exists(state_file):
+            with open(state_file, 'r') as f:
+                self.state = json.load(f)
+
+    @property
+    def received_on(self):
+        return self.state['received_on']
+
+    def sync(self, page_size=None):
+        """
+        Yields new CommCareForm objects in received_on order. A form only
+        counts as synced once the consumer asks for the next one (or the
+        iteration finishes), so a form whose processing raised is yielded
+        again by the next sync. Progress is saved when the iteration
+        finishes or is abandoned.
+        """
+        watermark = self.state['received_on']
+        seen_ids = set(self.state['seen_ids'])
+        try:
+            for form in self.resources.list_forms(
+                    xmlns=self.xmlns, received_on_start=watermark,
+                    page_size=page_size):
+                received_on = form.received_on
+                if received_on == watermark and form.form_id in seen_ids:
+                    continue
+                yield form
+                if watermark is None or received_on > watermark:
+                    watermark = received_on
+                    seen_ids = set()
+                if received_on == watermark:
+                    seen_ids.add(form.form_id)
+        finally:
+            self.state = {'received_on': watermark,
+                          'seen_ids': sorted(seen_ids)}
+            self.save()
+
+    def save(self):
+        if self.state_file:
+            with open(self.state_file, 'w') as f:
+                json.dump(self.state, f)
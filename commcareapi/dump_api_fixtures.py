@@ -11,20 +11,105 @@ def main():
     parser.add_argument('-p', help='password', required=True)
     parser.add_argument('-d', help='domain', required=True)
     parser.add_argument('-v', help='debug', action='store_true', required=False)
+    parser.add_argument('--rate-db',
+                        help='share a request rate limit with other '
+                             'processes through this file')
+    parser.add_argument('--rate', type=float, default=5.0,
+                        help='requests per second (with --rate-db)')
 
     subparsers = parser.add_subparsers(dest='resource')
     case_parser = subparsers.add_parser('case', help='list cases or get case')
     case_parser.add_argument('uuid', nargs='?', default=None)
+    case_parser.add_argument('--snapshot',
+                             help='write all cases to this binary snapshot')
 
     form_parser = subparsers.add_parser('form', help='get form')
     form_parser.add_argument('uuid', nargs='?')
 
+    export_parser = subparsers.add_parser(
+        'export', help='export all objects of a resource as gzipped ndjson')
+    export_parser.add_argument(
+        'export_resource', choices=['case', 'form', 'fixture', 'user', 'group'])
+    export_parser.add_argument('-o', help='output directory', required=True)
+    export_parser.add_argument('--window', type=int, default=1000,
+                               help='objects per request and output file')
+    export_parser.add_argument('--workers', type=int, default=4,
+                               help='parallel requests')
+    export_parser.add_argument('--index', action='store_true',
+                               help='write uncompressed ndjson with an id '
+                                    'index for random access')
+
+    sample_parser = subparsers.add_parser(
+        'sample', help='random sample of cases or forms')
+    sample_parser.add_argument('sample_resource', choices=['case', 'form'])
+    sample_parser.add_argument('-n', type=int, default=1000,
+                               help='sample size')
+    sample_parser.add_argument('--case-type', action='append',
+                               help='sample cases of this type (may be '
+                                    'repeated, to stratify by type)')
+    sample_parser.add_argument('--workers', type=int, default=4,
+                               help='parallel requests')
+    sample_parser.add_argument('--seed', type=int, default=None)
+
     args = parser.parse_args()
 
-    api = CommCareAPI(args.d, args.u, args.p, debug=args.v)
+    rate_limiter = None
+    if args.rate_db:
+        from commcareapi.ratelimit import SharedRateLimiter
+        rate_limiter = SharedRateLimiter(args.rate_db, rate=args.rate)
+
+    if args.resource == 'export':
+        from commcareapi.export import BulkExport
+        def make_resources():
+            return CommCareResources(
+                CommCareAPI(args.d, args.u, args.p, debug=args.v,
+                            rate_limiter=rate_limiter))
+        BulkExport(make_resources, args.export_resource, args.o,
+                   window=args.window, workers=args.workers,
+                   compress=not args.index).run()
+        return
+
+    if args.resource == 'sample':
+        from commcareapi.sampling import Sampler
+        def make_resources():
+            return CommCareResources(
+                CommCareAPI(args.d, args.u, args.p, debug=args.v,
+                            rate_limiter=rate_limiter))
+        if args.case_type and args.sample_resource != 'case':
+            parser.error('--case-type only applies to cases')
+        strata = None
+        if args.case_type:
+            strata = dict((case_type, {'type': case_type})
+                          for case_type in args.case_type)
+        sampler = Sampler(make_resources, workers=args.workers,
+                          seed=args.seed)
+        try:
+            if args.sample_resource == 'case':
+                sample = sampler.sample_cases(args.n, strata=strata)
+            else:
+                sample = sampler.sample_forms(args.n, strata=strata)
+        finally:
+            sampler.close()
+        attribute = args.sample_resource + '_data'
+        if strata is None:
+            resp = [getattr(obj, attribute) for obj in sample]
+        else:
+            resp = dict((name, [getattr(obj, attribute) for obj in objects])
+                        for name, objects in sample.items())
+        print json.dumps(resp, indent=4)
+        return
+
+    api = CommCareAPI(args.d, args.u, args.p, debug=args.v,
+                      rate_limiter=rate_limiter)
     handler = CommCareResources(api)
 
     if args.resource == 'case':
+        if args.snapshot:
+            from commcareapi.snapshot import SnapshotWriter
+            with SnapshotWriter(args.snapshot, 'case') as writer:
+                for case in handler.get_all_resources('case'):
+                    writer.write(case)
+            return
         if args.uuid:
             resp = handler.case(args.uuid).case_data
         else:
@@ -0,0 +1,86 @@
+from .comm_care_data import CommCareCase, CommCareForm
+
+
+def record_user_and_owner(record):
+    """
+    Return the (user_id, owner_id) of a CommCareCase or CommCareForm.
+    A form's owner is the owner of the case it creates, if any.
+    """
+    if isinstance(record, CommCareCase):
+        return (record.case_data.get('user_id'),
+                record.case_properties.get('owner_id'))
+    if isinstance(record, CommCareForm):
+        form = record.form_data.get('form', {})
+        case = form.get('case') or {}
+        create = case.get('create') or {}
+        return ((form.get('meta') or {}).get('userID'),
+                create.get('owner_id'))
+    raise TypeError("Can't enrich %r" % record)
+
+
+class CommCareEnricher(object):
+    """
+    Annotates streams of cases or forms with user and group details from
+    a CommCareDirectory.
+
+    Each record gets an `enrichment` dictionary with 'user' and 'owner'
+    entries. A user is projected to {'id', 'type': 'user', user_fields...,
+    'groups': [group projections]} and a group to {'id', 'type': 'group',
+    group_fields...}. Unknown ids give None and the record is passed
+    through unchanged otherwise.
+
+    Projections are built once per id and shared between records, so
+    they must not be modified.
+    """
+    def __init__(self, directory, user_fields=('username',),
+                 group_fields=('name',)):
+        self.directory = directory
+        self.user_fields = user_fields
+        self.group_fields = group_fields
+        self._projections = {}
+        self._loaded_at = None
+
+    def _project_group(self, group):
+        projection = {'id': group['id'], 'type': 'group'}
+        for field in self.group_fields:
+            projection[field] = group.get(field)
+        return projection
+
+    def _project(self, id):
+        directory = self.directory
+        user = directory.user(id)
+        if user is not None:
+            projection = {'id': id, 'type': 'user'}
+            for field in self.user_fields:
+                projection[field] = user.get(field)
+            projection['groups'] = [self._project_group(group) for group
+                                    in directory.groups_for_user(id)]
+            return projection
+        group = directory.group(id)
+        if group is not None:
+            return self._project_group(group)
+        return None
+
+    def enrich(self, records):
+        """
+        Yields each record of the iterable after setting its enrichment.
+        """
+        self.directory.ensure_fresh()
+        if self._loaded_at != self.directory.loaded_at:
+            self._projections = {}
+            self._loaded_at = self.directory.loaded_at
+        projections = self._projections
+        project = self._project
+
+        for record in records:
+            user_id, owner_id = record_user_and_owner(record)
+            try:
+                user = projections[user_id]
+            except KeyError:
+                user = projections[user_id] = project(user_id)
+            try:
+                owner = projections[owner_id]
+            except KeyError:
+                owner = projections[owner_id] = project(owner_id)
+            record.enrichment = {'user': user, 'owner': owner}
+            yield record
@@ -0,0 +1,367 @@
+import collections
+import glob
+import gzip
+import json
+import mmap
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+
+from .comm_care_data import CommCareCase, CommCareForm
+from .xform import XFormCache
+
+
+# Per-process state, set up by _init_worker so that each worker parses
+# each xform definition at most once, and runs get_questions once for
+# definitions that differ only in version.
+_definitions = {}
+_questions = XFormCache()
+_langs = []
+
+
+def _init_worker(definitions, langs):
+    global _definitions, _questions, _langs
+    _definitions = definitions
+    _questions = XFormCache()
+    _langs = langs
+
+
+def _get_questions(form):
+    for key in (form.xmlns_unique_id, form.xmlns_id):
+        if key is not None and key in _definitions:
+            return _questions.get_questions(key, _definitions[key], _langs)
+    return None
+
+
+def _render_batch(batch):
+    rendered = []
+    for form_data in batch:
+        form = CommCareForm(form_data)
+        questions = _get_questions(form)
+        if questions is None:
+            rendered.append((form.form_id, None))
+        else:
+            rendered.append((form.form_id,
+                             form.make_human_readable(questions)))
+    return rendered
+
+
+def _batches(forms, batch_size):
+    batch = []
+    for form in forms:
+        if isinstance(form, CommCareForm):
+            form = form.form_data
+        batch.append(form)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def render_forms(forms, definitions, langs, processes=None,
+                 batch_size=500, max_in_flight=None):
+    """
+    Render forms with make_human_readable across a pool of processes.
+
+    forms is an iterable of CommCareForm objects (or raw form data) and
+    definitions maps xmlns_unique_id (or plain xmlns) to the xform XML.
+    Yields (form_id, human_readable) tuples in input order; forms with no
+    matching definition are yielded with None. At most max_in_flight
+    batches (default twice the number of processes) are outstanding at
+    once, so the input is consumed no faster than results are read.
+    """
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+
+    if processes <= 1:
+        _init_worker(definitions, langs)
+        for batch in _batches(forms, batch_size):
+            for row in _render_batch(batch):
+                yield row
+        return
+
+    if max_in_flight is None:
+        max_in_flight = 2 * processes
+
+    pool = multiprocessing.Pool(processes, _init_worker, (definitions, langs))
+    try:
+        pending = collections.deque()
+        for batch in _batches(forms, batch_size):
+            pending.append(pool.apply_async(_render_batch, (batch,)))
+            if len(pending) >= max_in_flight:
+                for row in pending.popleft().get():
+                    yield row
+        while pending:
+            for row in pending.popleft().get():
+                yield row
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+class ExportError(Exception):
+    pass
+
+
+# a listing order that new objects do not shuffle, so windows fetched in
+# parallel, or on a later run, neither overlap nor leave gaps
+ORDER_BY = {'case': 'server_date_modified', 'form': 'received_on'}
+
+
+class BulkExport(object):
+    """
+    Export every object of a paged resource to gzipped NDJSON files, one
+    per offset window, fetching windows in parallel threads.
+
+    With compress=False the files are plain NDJSON and each gets a
+    sidecar .idx file listing the id, byte offset and length of every
+    line, for random access with ExportIndex.
+
+    make_resources is called once per thread to build a CommCareResources,
+    since drest clients are not thread safe. Completed windows are
+    recorded in a checkpoint file in output_dir, so running the same
+    export again resumes where it stopped.
+
+    A window is fetched in as many requests as the server's page limit
+    needs, and only counts as completed once it holds `window` objects
+    (or all that are left); ExportError is raised if it comes up short.
+    A resumed run first asks for the current total_count, so windows
+    after the old end of the listing, and the old last window if it was
+    short, are fetched again when the listing has grown.
+
+    Cases and forms are listed in ORDER_BY order unless params give an
+    order_by.
+    """
+    def __init__(self, make_resources, resource, output_dir, window=1000,
+                 workers=4, params=None, progress=sys.stderr, compress=True):
+        self.make_resources = make_resources
+        self.resource = resource
+        self.output_dir = output_dir
+        self.window = window
+        self.workers = workers
+        self.params = dict(params or {})
+        if resource in ORDER_BY:
+            self.params.setdefault('order_by', ORDER_BY[resource])
+        self.progress = progress
+        self.compress = compress
+        self.local = threading.local()
+        self.checkpoint_file = os.path.join(
+            output_dir, '%s.checkpoint.json' % resource)
+
+    def part_file(self, offset):
+        extension = '.ndjson.gz' if self.compress else '.ndjson'
+        return os.path.join(self.output_dir, '%s-%09d%s' % (
+            self.resource, offset, extension))
+
+    def load_checkpoint(self):
+        if os.path.exists(self.checkpoint_file):
+            with open(self.checkpoint_file, 'r') as f:
+                checkpoint = json.load(f)
+            if checkpoint.get('window') == self.window and \
+                    checkpoint.get('params') == self.params and \
+                    checkpoint.get('compress', True) == self.compress:
+                return checkpoint
+        return {'resource': self.resource, 'window': self.window,
+                'params': self.params, 'compress': self.compress,
+                'total_count': None, 'done': {}}
+
+    def save_checkpoint(self, checkpoint):
+        tmp = self.checkpoint_file + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(checkpoint, f)
+        os.rename(tmp, self.checkpoint_file)
+
+    def _get(self, params):
+        resources = getattr(self.local, 'resources', None)
+        if resources is None:
+            resources = self.local.resources = self.make_resources()
+        return getattr(resources.api, self.resource).get(params=params)
+
+    def count(self):
+        """ The current total_count of the listing """
+        resp = self._get(dict(self.params, offset=0, limit=1))
+        return (resp.data.get('meta') or {}).get('total_count', 0)
+
+    def fetch_window(self, offset):
+        # HQ caps the objects per request (100 for cases) whatever limit
+        # is asked for, so page until the window is full
+        objects = []
+        meta = {}
+        while True:
+            params = dict(self.params, offset=offset + len(objects),
+                          limit=self.window - len(objects))
+            resp = self._get(params)
+            page = resp.data.get('objects', [])
+            meta = resp.data.get('meta') or meta
+            objects.extend(page[:self.window - len(objects)])
+            expected = min(self.window,
+                           max(0, meta.get('total_count', 0) - offset))
+            if not page or len(objects) >= expected:
+                break
+        if len(objects) < expected:
+            raise ExportError('window at offset %d has %d of %d objects' % (
+                offset, len(objects), expected))
+
+        part_file = self.part_file(offset)
+        if self.compress:
+            f = gzip.open(part_file + '.tmp', 'wb')
+        else:
+            f = open(part_file + '.tmp', 'wb')
+        index = []
+        position = 0
+        try:
+            for obj in objects:
+                line = json.dumps(obj) + '\n'
+                f.write(line)
+                index.append('%s\t%d\t%d\n' % (
+                    unicode(obj.get('id')).encode('utf-8'), position,
+                    len(line)))
+                position += len(line)
+        finally:
+            f.close()
+        if not self.compress:
+            # the index is in place before the part it describes
+            with open(part_file + '.idx.tmp', 'wb') as f:
+                f.writelines(index)
+            os.rename(part_file + '.idx.tmp', part_file + '.idx')
+        os.rename(part_file + '.tmp', part_file)
+        return offset, len(objects), meta
+
+    def run(self):
+        """
+        Runs (or resumes) the export, returning the number of objects
+        written over all runs.
+        """
+        if not os.path.isdir(self.output_dir):
+            os.makedirs(self.output_dir)
+        checkpoint = self.load_checkpoint()
+        done = checkpoint['done']
+        start = time.time()
+        exported = [0]
+
+        def window_done(offset, count, meta):
+            done[str(offset)] = count
+            if meta.get('total_count') is not None:
+                checkpoint['total_count'] = meta['total_count']
+            self.save_checkpoint(checkpoint)
+            exported[0] += count
+            self.report(checkpoint, exported[0], time.time() - start)
+
+        if checkpoint['total_count'] is None:
+            window_done(*self.fetch_window(0))
+        else:
+            checkpoint['total_count'] = self.count()
+        total = checkpoint['total_count'] or 0
+
+        def complete(offset):
+            return done.get(str(offset)) == min(self.window, total - offset)
+        offsets = [offset for offset in range(0, total, self.window)
+                   if not complete(offset)]
+        pool = ThreadPool(self.workers)
+        try:
+            for result in pool.imap_unordered(self.fetch_window, offsets):
+                window_done(*result)
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+        return sum(count for offset, count in done.items()
+                   if int(offset) < total)
+
+    def report(self, checkpoint, exported, elapsed):
+        if self.progress is None:
+            return
+        total = checkpoint['total_count'] or 0
+        written = sum(checkpoint['done'].values())
+        rate = exported / elapsed if elapsed > 0 else 0
+        if rate:
+            eta = '%ds' % ((total - written) / rate)
+        else:
+            eta = '?'
+        self.progress.write('%s: %d/%d rows, %.0f rows/sec, ETA %s\n' % (
+            self.resource, written, total, rate, eta))
+
+
+class ExportIndex(object):
+    """
+    Random access by id to the objects of an uncompressed BulkExport,
+    using the sidecar .idx files and memory mapped parts, so only the
+    requested lines are read:
+
+        with ExportIndex('cases/', 'case') as cases:
+            case = cases.get(case_id)
+            found = cases.get_many(case_ids)
+
+    Cases and forms are returned as CommCareCase and CommCareForm objects
+    (not validated again), other resources as dictionaries.
+    """
+    wrappers = {'case': CommCareCase, 'form': CommCareForm}
+
+    def __init__(self, output_dir, resource):
+        self.resource = resource
+        self.entries = {}
+        self.maps = {}
+        self.lock = threading.Lock()
+        pattern = os.path.join(output_dir, '%s-*.ndjson.idx' % resource)
+        for index_file in sorted(glob.glob(pattern)):
+            part_file = index_file[:-len('.idx')]
+            if not os.path.exists(part_file):
+                continue
+            with open(index_file, 'rb') as f:
+                for line in f:
+                    id, offset, length = line.rstrip('\n').split('\t')
+                    self.entries[id.decode('utf-8')] = (
+                        part_file, int(offset), int(length))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, id):
+        return id in self.entries
+
+    def _map(self, part_file):
+        with self.lock:
+            part = self.maps.get(part_file)
+            if part is None:
+                with open(part_file, 'rb') as f:
+                    part = self.maps[part_file] = mmap.mmap(
+                        f.fileno(), 0, access=mmap.ACCESS_READ)
+            return part
+
+    def _read(self, entry):
+        part_file, offset, length = entry
+        data = json.loads(self._map(part_file)[offset:offset + length])
+        wrapper = self.wrappers.get(self.resource)
+        return wrapper(data, validate=False) if wrapper else data
+
+    def get(self, id):
+        """ The object with this id, or None """
+        entry = self.entries.get(id)
+        return self._read(entry) if entry else None
+
+    def get_many(self, ids):
+        """
+        Returns {id: object} for the ids that are in the export. Lines are
+        read in file and offset order, so reads are sequential.
+        """
+        found = [(self.entries[id], id) for id in set(ids)
+                 if id in self.entries]
+        found.sort()
+        return dict((id, self._read(entry)) for entry, id in found)
+
+    def close(self):
+        with self.lock:
+            for part in self.maps.values():
+                part.close()
+            self.maps = {}
@@ -0,0 +1,137 @@
+"""
+Hedged GETs for single objects: if a lookup has not answered after a
+delay taken from recent latencies, the same request is sent again and
+whichever succeeds first is used. This cuts the tail latency caused by
+the occasional slow HQ response, at the cost of a few extra requests.
+
+    hedger = Hedger(make_resources, percentile=95, max_extra=0.05)
+    resources = CommCareResources(api, hedger=hedger)
+    resources.case(case_id)
+
+Only idempotent GETs are hedged. The slower request is not cancelled
+(httplib2 has no way to), it finishes in the background.
+"""
+import collections
+import Queue
+import sys
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+
+
+class Hedger(object):
+    """
+    Runs lookups on a pool of `workers` threads, each with its own
+    CommCareResources from make_resources (drest clients are not thread
+    safe).
+
+    The hedge delay is `delay` seconds if given, otherwise the
+    `percentile` of the last `window` request latencies, kept between
+    min_delay and max_delay (max_delay until min_samples are seen). At
+    most `max_extra` hedges are sent per lookup on average.
+    """
+    def __init__(self, make_resources, delay=None, percentile=95,
+                 min_delay=0.05, max_delay=2.0, max_extra=0.1, workers=4,
+                 window=1000, min_samples=20):
+        self.make_resources = make_resources
+        self.delay = delay
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.max_extra = max_extra
+        self.min_samples = min_samples
+        self.latencies = collections.deque(maxlen=window)
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.pool = ThreadPool(workers)
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def hedge_delay(self):
+        if self.delay is not None:
+            return self.delay
+        with self.lock:
+            latencies = sorted(self.latencies)
+        if len(latencies) < self.min_samples:
+            return self.max_delay
+        index = min(len(latencies) - 1,
+                    int(len(latencies) * self.percentile / 100.0))
+        return max(self.min_delay, min(self.max_delay, latencies[index]))
+
+    def _attempt(self, resource, id, params, hedge, results):
+        resources = getattr(self.local, 'resources', None)
+        if resources is None:
+            resources = self.local.resources = self.make_resources()
+        start = time.time()
+        try:
+            resp = getattr(resources.api, resource).get(id, params)
+        except:
+            results.put((hedge, False, sys.exc_info()))
+            return
+        with self.lock:
+            self.latencies.append(time.time() - start)
+        results.put((hedge, True, resp))
+
+    def _may_hedge(self):
+        with self.lock:
+            if self.hedges < self.max_extra * self.requests:
+                self.hedges += 1
+                return True
+            return False
+
+    def get(self, resource, id, params=None):
+        """
+        GET resource/id, hedged. Raises the first error if every attempt
+        fails.
+        """
+        params = params or {}
+        results = Queue.Queue()
+        state = {'done': False, 'attempts': 1}
+
+        def hedge():
+            with self.lock:
+                if state['done']:
+                    return
+            if self._may_hedge():
+                with self.lock:
+                    state['attempts'] = 2
+                self.pool.apply_async(
+                    self._attempt, (resource, id, params, True, results))
+
+        with self.lock:
+            self.requests += 1
+        self.pool.apply_async(self._attempt,
+                              (resource, id, params, False, results))
+        # a timer rather than results.get(timeout), which polls on
+        # Python 2 and would delay answers that beat the hedge
+        timer = threading.Timer(self.hedge_delay(), hedge)
+        timer.daemon = True
+        timer.start()
+        try:
+            errors = []
+            while True:
+                hedged, ok, value = results.get()
+                if ok:
+                    if hedged:
+                        with self.lock:
+                            self.hedge_wins += 1
+                    return value
+                errors.append(value)
+                with self.lock:
+                    if len(errors) >= state['attempts']:
+                        state['done'] = True
+                        raise errors[0][0], errors[0][1], errors[0][2]
+        finally:
+            timer.cancel()
+            with self.lock:
+                state['done'] = True
+
+    def stats(self):
+        with self.lock:
+            return {'requests': self.requests, 'hedges': self.hedges,
+                    'hedge_wins': self.hedge_wins}
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
@@ -0,0 +1,179 @@
+import base64
+import collections
+import itertools
+import socket
+import threading
+from contextlib import contextmanager
+
+import drest
+from httplib2 import Http, ServerNotFoundError
+
+from .comm_care_data import CommCareAPI, CommCareResources, \
+    CommCareRequestHandler
+from .tracing import span
+
+
+class FairScheduler(object):
+    """
+    Hands out at most `concurrency` request slots at a time across
+    domains. When a slot frees up it goes to the waiting domain that has
+    had the least service relative to its weight (weighted fair queuing),
+    so one busy domain cannot starve the others. Domains have weight 1
+    unless given in weights.
+    """
+    def __init__(self, concurrency, weights=None):
+        self.concurrency = concurrency
+        self.weights = weights or {}
+        self.active = 0
+        self.condition = threading.Condition()
+        self.waiting = collections.defaultdict(collections.deque)
+        self.virtual_time = collections.defaultdict(float)
+        self.clock = 0.0
+        self.tickets = itertools.count()
+
+    def _next_ticket(self):
+        best = None
+        for domain, queue in self.waiting.items():
+            if not queue:
+                continue
+            # ties go to the domain whose first request has waited longest
+            key = (self.virtual_time[domain], queue[0][0])
+            if best is None or key < best[0]:
+                best = (key, domain)
+        if best is None:
+            return None, None
+        domain = best[1]
+        return domain, self.waiting[domain][0]
+
+    def acquire(self, domain):
+        with self.condition:
+            queue = self.waiting[domain]
+            if not queue:
+                # an idle domain does not bank credit while it is idle
+                self.virtual_time[domain] = max(self.virtual_time[domain],
+                                                self.clock)
+            ticket = (next(self.tickets), domain)
+            queue.append(ticket)
+            while self.active >= self.concurrency or \
+                    self._next_ticket()[1] is not ticket:
+                self.condition.wait()
+            queue.popleft()
+            self.active += 1
+            self.clock = self.virtual_time[domain]
+            self.virtual_time[domain] += 1.0 / self.weights.get(domain, 1)
+            self.condition.notify_all()
+
+    def release(self, domain):
+        with self.condition:
+            self.active -= 1
+            self.condition.notify_all()
+
+    @contextmanager
+    def slot(self, domain):
+        self.acquire(domain)
+        try:
+            yield
+        finally:
+            self.release(domain)
+
+    def waiting_count(self):
+        with self.condition:
+            return sum(len(queue) for queue in self.waiting.values())
+
+
+class HttpPool(object):
+    """
+    A pool of httplib2.Http objects (each keeps its connections open)
+    shared by every domain. httplib2.Http is not thread safe, so each one
+    is only used by one request at a time.
+    """
+    def __init__(self, timeout=None):
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.free = []
+
+    def get(self):
+        with self.lock:
+            if self.free:
+                return self.free.pop()
+        return Http(timeout=self.timeout)
+
+    def put(self, http):
+        with self.lock:
+            self.free.append(http)
+
+    def request(self, url, method, payload, headers):
+        """
+        Make a request on a pooled Http. An Http whose connection failed
+        is dropped and the request is retried once on a fresh one.
+        """
+        for attempt in (1, 2):
+            http = self.get() if attempt == 1 else Http(timeout=self.timeout)
+            try:
+                response = http.request(url, method, payload, headers=headers)
+            except socket.error as e:
+                if attempt == 2:
+                    raise drest.exc.dRestAPIError(e)
+                continue
+            except ServerNotFoundError as e:
+                raise drest.exc.dRestAPIError(e.args[0])
+            self.put(http)
+            return response
+
+
+class PooledRequestHandler(CommCareRequestHandler):
+    """
+    Request handler that waits for a FairScheduler slot and sends its
+    request over a shared HttpPool. Set pool and scheduler on the handler
+    before use.
+    """
+    pool = None
+    scheduler = None
+
+    def _make_request(self, url, method, payload=None, headers=None):
+        headers = dict(headers or {})
+        if self._auth_credentials:
+            # credentials go in the header because the pooled Http
+            # objects are shared between users
+            headers['Authorization'] = 'Basic ' + base64.b64encode(
+                '%s:%s' % self._auth_credentials)
+        # wait for a token before taking a slot, so a throttled domain
+        # does not hold up the others
+        self._wait_for_rate_limit()
+        with self.scheduler.slot(self.domain):
+            with span('http', method=method, url=url, domain=self.domain):
+                return self.pool.request(url, method, payload or {}, headers)
+
+
+class CommCareMultiDomain(object):
+    """
+    CommCareResources for many domains sharing one pool of connections
+    and one FairScheduler, which caps the requests in flight across all
+    domains at `concurrency`.
+
+        client = CommCareMultiDomain(user, password, concurrency=8,
+                                     weights={'huge-domain': 2})
+        cases = client.resources('my-domain').list_cases()
+    """
+    def __init__(self, user, password, concurrency=8, weights=None,
+                 limit=100, timeout=None, rate_limiter=None):
+        self.user = user
+        self.password = password
+        self.limit = limit
+        self.rate_limiter = rate_limiter
+        self.scheduler = FairScheduler(concurrency, weights)
+        self.pool = HttpPool(timeout=timeout)
+        self.lock = threading.Lock()
+        self.views = {}
+
+    def resources(self, domain):
+        with self.lock:
+            if domain not in self.views:
+                api = CommCareAPI(domain, self.user, self.password,
+                                  limit=self.limit,
+                                  request_handler=PooledRequestHandler,
+                                  rate_limiter=self.rate_limiter)
+                api.request.pool = self.pool
+                api.request.scheduler = self.scheduler
+                self.views[domain] = CommCareResources(api)
+            return self.views[domain]
@@ -0,0 +1,130 @@
+"""
+Priority classes for requests made from one process, so user facing
+lookups are not queued behind the page fetches of a bulk export:
+
+    scheduler = PriorityScheduler(concurrency=4, reserved={INTERACTIVE: 1})
+    # one CommCareResources per thread, sharing the scheduler
+    resources = CommCareResources(api, scheduler=scheduler)
+
+    resources.case(case_id, priority=INTERACTIVE)
+    for case in resources.get_all_resources('case', priority=BULK):
+        ...
+    with scheduler.priority(INTERACTIVE):
+        resources.form(form_id)
+"""
+import collections
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+
+INTERACTIVE = 'interactive'
+NORMAL = 'normal'
+BULK = 'bulk'
+PRIORITIES = (INTERACTIVE, NORMAL, BULK)
+
+
+class PriorityScheduler(object):
+    """
+    Allows `concurrency` requests at once. Free slots go to waiting
+    interactive requests first, then normal, then bulk, except that a
+    request that has waited more than starvation_timeout seconds goes
+    ahead of everything that has waited less, so bulk work always makes
+    progress.
+
+    reserved maps a priority to a number of slots that only it may use,
+    e.g. {INTERACTIVE: 1} keeps one slot free for interactive requests
+    even while bulk requests are waiting.
+    """
+    def __init__(self, concurrency=4, reserved=None, starvation_timeout=5.0):
+        self.concurrency = concurrency
+        self.reserved = reserved or {}
+        if sum(self.reserved.values()) > concurrency:
+            raise ValueError('more slots reserved than concurrency')
+        self.starvation_timeout = starvation_timeout
+        self.condition = threading.Condition()
+        self.waiting = dict((p, collections.deque()) for p in PRIORITIES)
+        self.active = dict((p, 0) for p in PRIORITIES)
+        self.tickets = itertools.count()
+        self.local = threading.local()
+        self.granted = dict((p, 0) for p in PRIORITIES)
+        self.wait_seconds = dict((p, 0.0) for p in PRIORITIES)
+        self.max_wait = dict((p, 0.0) for p in PRIORITIES)
+
+    def _may_run(self, priority):
+        """ Could a request of this priority take a slot now? """
+        active = sum(self.active.values())
+        held_back = sum(max(0, count - self.active[p])
+                        for p, count in self.reserved.items()
+                        if p != priority)
+        return active < self.concurrency and \
+            self.concurrency - active - 1 >= held_back
+
+    def _next_ticket(self, now):
+        """ The ticket to grant next, if any may run """
+        heads = [queue[0] for queue in
+                 (self.waiting[p] for p in PRIORITIES) if queue]
+        starved = sorted(ticket for ticket in heads
+                         if now - ticket[1] >= self.starvation_timeout)
+        for ticket in starved + heads:
+            if self._may_run(ticket[2]):
+                return ticket
+        return None
+
+    def acquire(self, priority=None):
+        priority = priority or self.current_priority()
+        if priority not in self.waiting:
+            raise ValueError('unknown priority %r' % priority)
+        with self.condition:
+            start = time.time()
+            ticket = (next(self.tickets), start, priority)
+            self.waiting[priority].append(ticket)
+            # slots only free up in release(), which wakes every waiter
+            # to look again, so no timed waits are needed for starvation
+            while self._next_ticket(time.time()) is not ticket:
+                self.condition.wait()
+            self.waiting[priority].popleft()
+            self.active[priority] += 1
+            waited = time.time() - start
+            self.granted[priority] += 1
+            self.wait_seconds[priority] += waited
+            self.max_wait[priority] = max(self.max_wait[priority], waited)
+            # another waiter may be able to run too
+            self.condition.notify_all()
+        return priority
+
+    def release(self, priority):
+        with self.condition:
+            self.active[priority] -= 1
+            self.condition.notify_all()
+
+    @contextmanager
+    def slot(self, priority=None):
+        priority = self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release(priority)
+
+    def current_priority(self):
+        """ The priority set by priority() in this thread, or NORMAL """
+        return getattr(self.local, 'priority', None) or NORMAL
+
+    @contextmanager
+    def priority(self, priority):
+        """ Makes requests from this thread default to priority """
+        previous = getattr(self.local, 'priority', None)
+        self.local.priority = priority
+        try:
+            yield
+        finally:
+            self.local.priority = previous
+
+    def stats(self):
+        with self.condition:
+            return dict((p, {'granted': self.granted[p],
+                             'wait_seconds': self.wait_seconds[p],
+                             'max_wait': self.max_wait[p],
+                             'active': self.active[p],
+                             'waiting': len(self.waiting[p])})
+                        for p in PRIORITIES)
@@ -0,0 +1,154 @@
+"""
+Token bucket rate limiting shared by every process on a host.
+
+Bucket state lives in a SQLite file, and each token is taken in an
+immediate transaction, so exports, enrichment jobs and services that
+use the same file share one budget instead of each assuming it owns
+HQ's rate limit:
+
+    limiter = SharedRateLimiter('/var/tmp/commcare-rate.db', rate=5,
+                                burst=10, global_rate=20)
+    api = CommCareAPI(domain, user, password, rate_limiter=limiter)
+
+Every request takes a token from its domain's bucket and from the global
+bucket, waiting until both have one.
+"""
+import sqlite3
+import threading
+import time
+
+from .tracing import span
+
+GLOBAL = '*'
+
+
+class SharedRateLimiter(object):
+    """
+    rate is in requests per second per domain, and burst is the number of
+    requests a domain may make at once after being idle. rates overrides
+    them for some domains: {domain: (rate, burst)}. global_rate and
+    global_burst limit all domains together (no global limit if None).
+
+    Every process using the file should be configured the same way; the
+    settings in effect are those of the process taking the token.
+    """
+    def __init__(self, path, rate=5.0, burst=10, rates=None,
+                 global_rate=None, global_burst=None, max_sleep=1.0,
+                 timeout=30.0):
+        self.path = path
+        self.rate = rate
+        self.burst = burst
+        self.rates = rates or {}
+        self.global_rate = global_rate
+        self.global_burst = global_burst or burst
+        self.max_sleep = max_sleep
+        self.timeout = timeout
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.max_wait = 0.0
+        db = self._db()
+        db.execute('CREATE TABLE IF NOT EXISTS buckets '
+                   '(name TEXT PRIMARY KEY, tokens REAL, updated REAL)')
+        db.execute('CREATE TABLE IF NOT EXISTS waits '
+                   '(name TEXT PRIMARY KEY, requests INTEGER, '
+                   'waits INTEGER, seconds REAL)')
+
+    def _db(self):
+        # sqlite connections can not be shared between threads
+        db = getattr(self.local, 'db', None)
+        if db is None:
+            db = self.local.db = sqlite3.connect(
+                self.path, timeout=self.timeout, isolation_level=None)
+        return db
+
+    def _buckets(self, domain):
+        rate, burst = self.rates.get(domain, (self.rate, self.burst))
+        buckets = [(domain, rate, burst)]
+        if self.global_rate is not None:
+            buckets.append((GLOBAL, self.global_rate, self.global_burst))
+        return buckets
+
+    def _try_take(self, db, buckets, now):
+        """
+        Take a token from every bucket if they all have one and return 0,
+        otherwise take nothing and return the seconds to wait.
+        """
+        levels = []
+        wait = 0.0
+        for name, rate, burst in buckets:
+            row = db.execute('SELECT tokens, updated FROM buckets '
+                             'WHERE name = ?', (name,)).fetchone()
+            if row is None:
+                tokens = burst
+            else:
+                tokens, updated = row
+                # the clock can go backwards between processes
+                tokens = min(burst, tokens + max(0, now - updated) * rate)
+            levels.append((name, tokens))
+            if tokens < 1:
+                wait = max(wait, (1 - tokens) / rate)
+        if wait > 0:
+            return wait
+        for name, tokens in levels:
+            db.execute('INSERT OR REPLACE INTO buckets VALUES (?, ?, ?)',
+                       (name, tokens - 1, now))
+        return 0
+
+    def acquire(self, domain):
+        """
+        Block until a request to domain is allowed, and return the seconds
+        spent waiting.
+        """
+        db = self._db()
+        buckets = self._buckets(domain)
+        start = time.time()
+        slept = False
+        with span('ratelimit.acquire', domain=domain):
+            while True:
+                now = time.time()
+                db.execute('BEGIN IMMEDIATE')
+                try:
+                    wait = self._try_take(db, buckets, now)
+                    if not wait:
+                        waited = now - start if slept else 0.0
+                        self._record(db, domain, waited)
+                    db.execute('COMMIT')
+                except:
+                    db.execute('ROLLBACK')
+                    raise
+                if not wait:
+                    return waited
+                # other processes may take the token first, so look again
+                time.sleep(min(wait, self.max_sleep))
+                slept = True
+
+    def _record(self, db, domain, waited):
+        waits = 1 if waited > 0 else 0
+        with self.lock:
+            self.requests += 1
+            self.waits += waits
+            self.wait_seconds += waited
+            self.max_wait = max(self.max_wait, waited)
+        db.execute('INSERT OR IGNORE INTO waits VALUES (?, 0, 0, 0)',
+                   (domain,))
+        db.execute('UPDATE waits SET requests = requests + 1, '
+                   'waits = waits + ?, seconds = seconds + ? WHERE name = ?',
+                   (waits, waited, domain))
+
+    def stats(self):
+        """ Waiting done by this process """
+        with self.lock:
+            return {'requests': self.requests, 'waits': self.waits,
+                    'wait_seconds': self.wait_seconds,
+                    'max_wait': self.max_wait}
+
+    def shared_stats(self):
+        """ Waiting done by all processes, per domain """
+        rows = self._db().execute('SELECT name, requests, waits, seconds '
+                                  'FROM waits ORDER BY name')
+        return dict((name, {'requests': requests, 'waits': waits,
+                            'wait_seconds': seconds})
+                    for name, requests, waits, seconds in rows)
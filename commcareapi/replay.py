@@ -0,0 +1,267 @@
+"""
+Rebuild case state locally by replaying the case blocks of forms, in
+received_on order, instead of crawling the case API (which only has the
+current state).
+
+    replay = CaseReplay()
+    for event in replay.replay(resources.list_forms(), until='2014-01-01'):
+        ...
+    cases = replay.snapshot()    # case_id -> state as of 2014-01-01
+
+States have the same shape as the case API returns, so they can be
+wrapped in CommCareCase.
+"""
+import json
+import sqlite3
+
+
+class CaseReplayError(Exception):
+    pass
+
+
+def case_blocks(form):
+    """
+    Yields the case blocks of a form's 'form' section in document order,
+    including subcase blocks nested in groups and repeats.
+    """
+    stack = [form]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            case = node.get('case')
+            children = [value for key, value in node.iteritems()
+                        if key != 'case' and isinstance(value, (dict, list))]
+            stack.extend(reversed(children))
+            if isinstance(case, dict):
+                if '@case_id' in case or '@caseid' in case:
+                    yield case
+            elif isinstance(case, list):
+                for block in case:
+                    if isinstance(block, dict):
+                        yield block
+        elif isinstance(node, list):
+            stack.extend(reversed(node))
+
+
+def new_case(case_id):
+    return {
+        'id': case_id,
+        'case_id': case_id,
+        'user_id': None,
+        'date_modified': None,
+        'closed': False,
+        'date_closed': None,
+        'server_date_modified': None,
+        'server_date_opened': None,
+        'xform_ids': [],
+        'properties': {},
+        'indices': {},
+    }
+
+
+def copy_case(state):
+    state = dict(state)
+    state['xform_ids'] = list(state['xform_ids'])
+    state['properties'] = dict(state['properties'])
+    state['indices'] = dict(state['indices'])
+    return state
+
+
+class CaseTable(object):
+    """ In-memory case table: case_id -> state """
+
+    def __init__(self):
+        self.cases = {}
+
+    def get(self, case_id):
+        return self.cases.get(case_id)
+
+    def put(self, case_id, state):
+        self.cases[case_id] = state
+
+    def items(self):
+        return self.cases.iteritems()
+
+    def commit(self):
+        pass
+
+    def __len__(self):
+        return len(self.cases)
+
+
+class SqliteCaseTable(object):
+    """
+    On-disk case table for domains with more cases than fit in memory.
+    Changes are written in a transaction that is committed by commit(),
+    which CaseReplay calls every commit_every forms and at the end of
+    replay().
+    """
+    def __init__(self, path):
+        self.db = sqlite3.connect(path)
+        self.db.execute('CREATE TABLE IF NOT EXISTS cases '
+                        '(case_id TEXT PRIMARY KEY, state TEXT)')
+
+    def get(self, case_id):
+        row = self.db.execute('SELECT state FROM cases WHERE case_id = ?',
+                              (case_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, case_id, state):
+        self.db.execute('INSERT OR REPLACE INTO cases VALUES (?, ?)',
+                        (case_id, json.dumps(state)))
+
+    def items(self):
+        for case_id, state in self.db.execute('SELECT case_id, state '
+                                              'FROM cases ORDER BY case_id'):
+            yield case_id, json.loads(state)
+
+    def commit(self):
+        self.db.commit()
+
+    def __len__(self):
+        return self.db.execute('SELECT COUNT(*) FROM cases').fetchone()[0]
+
+
+def _index(value):
+    """ (case_type, case_id) of an index entry of a case block """
+    if isinstance(value, dict):
+        return value.get('@case_type'), value.get('#text')
+    return None, value
+
+
+class CaseReplay(object):
+    """
+    Applies the create, update, close and index actions of each form's
+    case blocks to a case table, and reports what changed as events:
+
+        {'type': 'create' | 'update' | 'close' | 'index',
+         'case_id', 'form_id', 'received_on', 'changes'}
+
+    'changes' holds the properties (or indices) whose values changed.
+    Forms must come in received_on order; each form should only be
+    replayed once (CommCareFormSync already drops duplicates).
+    """
+    def __init__(self, table=None, commit_every=10000):
+        self.table = table if table is not None else CaseTable()
+        self.commit_every = commit_every
+        self.as_of = None
+        self.form_count = 0
+
+    def apply(self, form):
+        """
+        Apply one form (a CommCareForm or the form API dictionary) and
+        return the list of events it caused.
+        """
+        form_data = getattr(form, 'form_data', form)
+        received_on = form_data.get('received_on')
+        if self.as_of is not None and received_on is not None and \
+                received_on < self.as_of:
+            raise CaseReplayError('Form %s received on %s is older than %s' %
+                                  (form_data.get('id'), received_on,
+                                   self.as_of))
+        if received_on is not None:
+            self.as_of = received_on
+        self.form_count += 1
+
+        events = []
+        for block in case_blocks(form_data.get('form') or {}):
+            self._apply_block(block, form_data.get('id'), received_on, events)
+
+        if self.form_count % self.commit_every == 0:
+            self.table.commit()
+        return events
+
+    def _apply_block(self, block, form_id, received_on, events):
+        case_id = block.get('@case_id') or block.get('@caseid')
+        if not case_id:
+            return
+        table = self.table
+        state = table.get(case_id)
+        if state is None:
+            state = new_case(case_id)
+        date_modified = block.get('@date_modified')
+
+        def event(type, changes):
+            events.append({'type': type, 'case_id': case_id,
+                           'form_id': form_id, 'received_on': received_on,
+                           'changes': changes})
+
+        properties = state['properties']
+        create = block.get('create')
+        if isinstance(create, dict):
+            properties.update(create)
+            properties.setdefault('date_opened', date_modified)
+            state['server_date_opened'] = state['server_date_opened'] or \
+                received_on
+            state['closed'] = False
+            state['date_closed'] = None
+            event('create', dict(create))
+
+        update = block.get('update')
+        if isinstance(update, dict):
+            changes = dict((key, value) for key, value in update.iteritems()
+                           if properties.get(key, object()) != value)
+            properties.update(update)
+            if changes:
+                event('update', changes)
+
+        index = block.get('index')
+        if isinstance(index, dict):
+            indices = state['indices']
+            changes = {}
+            for name, value in index.iteritems():
+                case_type, ref_id = _index(value)
+                if ref_id:
+                    entry = {'case_type': case_type, 'case_id': ref_id}
+                    if indices.get(name) != entry:
+                        indices[name] = changes[name] = entry
+                elif name in indices:
+                    del indices[name]
+                    changes[name] = None
+            if changes:
+                event('index', changes)
+
+        if 'close' in block and not state['closed']:
+            state['closed'] = True
+            state['date_closed'] = date_modified
+            event('close', {})
+
+        if block.get('@user_id'):
+            state['user_id'] = block['@user_id']
+        if date_modified:
+            state['date_modified'] = date_modified
+        state['server_date_modified'] = received_on
+        if form_id and form_id not in state['xform_ids'][-1:]:
+            state['xform_ids'].append(form_id)
+        table.put(case_id, state)
+
+    def replay(self, forms, until=None):
+        """
+        Apply forms in order, yielding their events, and stop before the
+        first form received after `until` (an ISO date or datetime
+        string) so snapshot() gives the state as of that time.
+        """
+        try:
+            for form in forms:
+                form_data = getattr(form, 'form_data', form)
+                if until is not None and form_data.get('received_on') > until:
+                    break
+                for event in self.apply(form_data):
+                    yield event
+        finally:
+            self.table.commit()
+
+    def run(self, forms, until=None):
+        """ Replay forms, discarding the events; returns self """
+        for event in self.replay(forms, until):
+            pass
+        return self
+
+    def cases(self):
+        """ Yields a copy of every case's current state """
+        for case_id, state in self.table.items():
+            yield copy_case(state)
+
+    def snapshot(self):
+        """ case_id -> copy of the case state as of the last form applied """
+        return dict((state['case_id'], state) for state in self.cases())
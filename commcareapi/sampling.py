@@ -0,0 +1,166 @@
+"""
+Random samples of cases or forms without paging through a whole domain.
+
+The size of the listing comes from the meta.total_count of a one object
+page. Random offsets are drawn from it, and only the stretches of the
+listing holding those offsets are fetched, in parallel:
+
+    sampler = Sampler(make_resources, workers=8, seed=1)
+    cases = sampler.sample_cases(2000)
+    by_type = sampler.sample_cases(2000, strata={
+        'household': {'type': 'household'},
+        'child': {'type': 'child'}})
+
+A stratified sample is split between the strata in proportion to their
+total_count, unless the size of each is given.
+
+Offsets only pick the same objects while the listing does not change,
+so objects added or removed while sampling can shift a sample by a few
+places, and the last offsets of a stratum may come back empty (the
+sample is then a little short). The listing needs a fixed order for
+that, so unless params give an order_by, forms are listed by
+received_on, which new submissions do not reorder, and cases by
+server_date_modified, where only the cases updated while sampling move
+(to the end).
+"""
+import random
+import threading
+from multiprocessing.pool import ThreadPool
+
+from .comm_care_data import CommCareCase, CommCareForm
+from .tracing import span
+
+
+def allocate(size, counts):
+    """
+    Split size between strata in proportion to their counts (largest
+    remainders get the rest), never giving a stratum more than its count.
+    """
+    total = sum(counts.values())
+    size = min(size, total)
+    if not size:
+        return dict((name, 0) for name in counts)
+    shares = dict((name, float(size) * count / total)
+                  for name, count in counts.items())
+    sizes = dict((name, int(share)) for name, share in shares.items())
+    by_remainder = sorted(counts, key=lambda name: (sizes[name] - shares[name],
+                                                    name))
+    for name in by_remainder[:size - sum(sizes.values())]:
+        sizes[name] += 1
+    return sizes
+
+
+def runs(offsets, limit):
+    """
+    Group sorted offsets into (start, offsets) runs that each fit in one
+    request of at most limit objects.
+    """
+    grouped = []
+    for offset in offsets:
+        if grouped and offset - grouped[-1][0] < limit:
+            grouped[-1][1].append(offset)
+        else:
+            grouped.append((offset, [offset]))
+    return grouped
+
+
+class Sampler(object):
+    """
+    Draws uniform random samples of a paged resource, fetching pages on
+    `workers` threads, each with its own CommCareResources from
+    make_resources (drest clients are not thread safe). A request never
+    asks for more than page_limit objects. close() stops the threads.
+    """
+    def __init__(self, make_resources, workers=4, page_limit=100,
+                 seed=None):
+        self.make_resources = make_resources
+        self.page_limit = page_limit
+        self.random = random.Random(seed)
+        self.local = threading.local()
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.pool = ThreadPool(workers)
+
+    def _get(self, resource, params):
+        resources = getattr(self.local, 'resources', None)
+        if resources is None:
+            resources = self.local.resources = self.make_resources()
+        with self.lock:
+            self.requests += 1
+        with span('sample.page', resource=resource,
+                  offset=params['offset'], limit=params['limit']):
+            return getattr(resources.api, resource).get(params=params).data
+
+    def count(self, resource, params=None):
+        """ The total_count of resource listed with params """
+        data = self._get(resource, dict(params or {}, offset=0, limit=1))
+        return (data.get('meta') or {}).get('total_count', 0)
+
+    def _fetch_run(self, task):
+        resource, name, params, start, offsets = task
+        data = self._get(resource, dict(params, offset=start,
+                                        limit=offsets[-1] - start + 1))
+        objects = data.get('objects', [])
+        return name, [objects[offset - start] for offset in offsets
+                      if offset - start < len(objects)]
+
+    def stratified(self, resource, strata, size, params=None):
+        """
+        Sample each stratum of resource, where strata maps a name to the
+        filters (added to params) selecting it, and size is the total
+        sample size or a map from stratum name to its size. Returns a map
+        from stratum name to its sampled objects, in listing order.
+        """
+        params = params or {}
+        names = list(strata)
+        counts = dict(zip(names, self.pool.map(
+            lambda name: self.count(resource, dict(params, **strata[name])),
+            names)))
+        if isinstance(size, dict):
+            sizes = dict((name, min(size.get(name, 0), counts[name]))
+                         for name in names)
+        else:
+            sizes = allocate(size, counts)
+
+        tasks = []
+        for name in names:
+            offsets = sorted(self.random.sample(xrange(counts[name]),
+                                                sizes[name]))
+            for start, run in runs(offsets, self.page_limit):
+                tasks.append((resource, name, dict(params, **strata[name]),
+                              start, run))
+        samples = dict((name, []) for name in names)
+        # map keeps the runs of each stratum in order
+        for name, objects in self.pool.map(self._fetch_run, tasks):
+            samples[name].extend(objects)
+        return samples
+
+    def sample(self, resource, size, params=None):
+        """ A uniform sample of size objects of resource, in listing order """
+        return self.stratified(resource, {None: {}}, size, params)[None]
+
+    def _sample_as(self, wrap, resource, size, strata, params):
+        if strata is None:
+            return [wrap(obj) for obj in self.sample(resource, size, params)]
+        samples = self.stratified(resource, strata, size, params)
+        return dict((name, [wrap(obj) for obj in objects])
+                    for name, objects in samples.items())
+
+    def sample_cases(self, size, strata=None, params=None):
+        """
+        CommCareCase objects; a list, or a map from stratum name to a list
+        if strata is given (as for stratified).
+        """
+        params = dict(params or {})
+        params.setdefault('order_by', 'server_date_modified')
+        return self._sample_as(CommCareCase, 'case', size, strata, params)
+
+    def sample_forms(self, size, strata=None, params=None):
+        """ CommCareForm objects, as for sample_cases """
+        params = dict(params or {})
+        params.setdefault('order_by', 'received_on')
+        return self._sample_as(CommCareForm, 'form', size, strata, params)
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
@@ -0,0 +1,219 @@
+"""
+Compact binary snapshots of case and form streams, much smaller and
+faster to reload than the JSON written by dump_api_fixtures.
+
+    with SnapshotWriter('cases.snap', 'case') as writer:
+        for case in resources.list_cases():
+            writer.write(case)
+
+    for case in SnapshotReader('cases.snap'):    # CommCareCase objects
+        ...
+
+A snapshot is a header followed by zlib compressed blocks, with every
+u32 little endian and every value JSON (UTF-8, ASCII escaped):
+
+    MAGIC, u32 length, {"kind": "case" | "form"}
+    block: u32 compressed length, u32 record count, zlib(payload)
+    payload: u32 length, [new strings, new shapes],
+             then per record: u32 length, record
+
+Strings and shapes form a table per file that grows block by block. A
+dictionary at the top two levels of a record is stored as the tuple
+(shape id, values...). Its shape is (key string ids, fixups), where the
+fixups list the positions of values stored as a string id (values of
+the fields in INTERNED_FIELDS: case types, owner ids, xmlns...) or as a
+nested shape list, so the reader only has to look at those. Records
+are lists of values rather than dictionaries, so there are no keys to
+decode. Only plain JSON values can be stored.
+"""
+import json
+import struct
+import zlib
+
+from .comm_care_data import CommCareCase, CommCareForm
+
+MAGIC = 'CCSNAP\x02\n'
+PACKED_DEPTH = 2
+STRING, DICT = 0, 1
+
+INTERNED_FIELDS = frozenset([
+    'case_type', 'owner_id', 'user_id', '@user_id', '@xmlns', '@version',
+    'xmlns', 'type', 'username', 'userID', 'deviceID', 'appVersion',
+])
+
+_u32 = struct.Struct('<I')
+_block = struct.Struct('<II')
+_encode = json.JSONEncoder(separators=(',', ':')).encode
+_decode = json.JSONDecoder().decode
+
+
+class SnapshotError(Exception):
+    pass
+
+
+class SnapshotWriter(object):
+    """
+    Writes CommCareCase or CommCareForm objects (or their dictionaries)
+    to a snapshot, `block_size` records per compressed block.
+    """
+    def __init__(self, path, kind, block_size=1000, level=6):
+        if kind not in ('case', 'form'):
+            raise ValueError("kind must be 'case' or 'form'")
+        self.attribute = kind + '_data'
+        self.file = open(path, 'wb')
+        self.block_size = block_size
+        self.level = level
+        self.strings = {}
+        self.shapes = {}
+        self.new_strings = []
+        self.new_shapes = []
+        self.records = []
+        self.count = 0
+        header = _encode({'kind': kind})
+        self.file.write(MAGIC + _u32.pack(len(header)) + header)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _string(self, string):
+        id = self.strings.get(string)
+        if id is None:
+            id = self.strings[string] = len(self.strings)
+            self.new_strings.append(string)
+        return id
+
+    def _shape(self, keys, fixups):
+        shape = (keys, fixups)
+        id = self.shapes.get(shape)
+        if id is None:
+            id = self.shapes[shape] = len(self.shapes)
+            self.new_shapes.append(
+                (tuple(self._string(key) for key in keys), fixups))
+        return id
+
+    def _pack(self, data, depth):
+        keys = tuple(data)
+        values = []
+        fixups = []
+        for i, key in enumerate(keys):
+            value = data[key]
+            if key in INTERNED_FIELDS and isinstance(value, basestring):
+                value = self._string(value)
+                fixups.append((i, STRING))
+            elif depth < PACKED_DEPTH and type(value) is dict:
+                value = self._pack(value, depth + 1)
+                fixups.append((i, DICT))
+            values.append(value)
+        return (self._shape(keys, tuple(fixups)),) + tuple(values)
+
+    def write(self, record):
+        data = getattr(record, self.attribute, record)
+        self.records.append(_encode(self._pack(data, 1)))
+        self.count += 1
+        if len(self.records) >= self.block_size:
+            self.flush()
+
+    def flush(self):
+        if not self.records:
+            return
+        table = _encode((self.new_strings, self.new_shapes))
+        parts = [_u32.pack(len(table)), table]
+        for record in self.records:
+            parts.append(_u32.pack(len(record)))
+            parts.append(record)
+        payload = zlib.compress(''.join(parts), self.level)
+        self.file.write(_block.pack(len(payload), len(self.records)))
+        self.file.write(payload)
+        self.new_strings = []
+        self.new_shapes = []
+        self.records = []
+
+    def close(self):
+        if self.file.closed:
+            return
+        self.flush()
+        self.file.close()
+
+
+class SnapshotReader(object):
+    """
+    Iterates over a snapshot, yielding CommCareCase or CommCareForm
+    objects (not validated again) as each block is read. records()
+    yields the plain dictionaries instead.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.kind = self._read_header(f)['kind']
+
+    def _read_header(self, f):
+        if f.read(len(MAGIC)) != MAGIC:
+            raise SnapshotError('%s is not a snapshot' % self.path)
+        length, = _u32.unpack(f.read(_u32.size))
+        return _decode(f.read(length))
+
+    def _blocks(self, f):
+        while True:
+            header = f.read(_block.size)
+            if not header:
+                return
+            if len(header) < _block.size:
+                raise SnapshotError('%s is truncated' % self.path)
+            length, count = _block.unpack(header)
+            payload = f.read(length)
+            if len(payload) < length:
+                raise SnapshotError('%s is truncated' % self.path)
+            yield count, payload
+
+    def records(self):
+        strings = []
+        shapes = []
+
+        def unpack(packed):
+            keys, fixups = shapes[packed[0]]
+            if not fixups:
+                return dict(zip(keys, packed[1:]))
+            values = list(packed[1:])
+            for i, kind in fixups:
+                if kind == STRING:
+                    values[i] = strings[values[i]]
+                else:
+                    values[i] = unpack(values[i])
+            return dict(zip(keys, values))
+
+        with open(self.path, 'rb') as f:
+            self._read_header(f)
+            for count, payload in self._blocks(f):
+                payload = zlib.decompress(payload)
+                length, = _u32.unpack_from(payload)
+                offset = _u32.size + length
+                new_strings, new_shapes = _decode(payload[_u32.size:offset])
+                strings.extend(new_strings)
+                shapes.extend((tuple(strings[id] for id in keys), fixups)
+                              for keys, fixups in new_shapes)
+                for _ in xrange(count):
+                    length, = _u32.unpack_from(payload, offset)
+                    offset += _u32.size
+                    yield unpack(_decode(payload[offset:offset + length]))
+                    offset += length
+
+    def __iter__(self):
+        wrap = CommCareCase if self.kind == 'case' else CommCareForm
+        for data in self.records():
+            yield wrap(data, validate=False)
+
+    def __len__(self):
+        """ Number of records, counted from the block headers only """
+        total = 0
+        with open(self.path, 'rb') as f:
+            self._read_header(f)
+            while True:
+                header = f.read(_block.size)
+                if not header:
+                    return total
+                length, count = _block.unpack(header)
+                total += count
+                f.seek(length, 1)
@@ -0,0 +1,108 @@
+"""
+Opt-in timing spans for the slow parts of an export (HTTP, JSON decoding,
+jsonpath, get_questions, make_human_readable), exportable as Chrome
+trace-event JSON for chrome://tracing or https://ui.perfetto.dev.
+
+    tracer = tracing.enable()
+    ... run the export ...
+    tracing.disable()
+    tracer.write('export.trace.json')
+
+While tracing is disabled a span costs one global lookup.
+"""
+import functools
+import json
+import os
+import threading
+import time
+
+_tracer = None
+
+
+class Tracer(object):
+
+    def __init__(self):
+        self.events = []
+        self.pid = os.getpid()
+
+    def add(self, name, start, end, args=None):
+        # list.append is atomic, so spans from several threads are safe
+        self.events.append({
+            'name': name,
+            'cat': name.split('.')[0],
+            'ph': 'X',
+            'ts': start * 1e6,
+            'dur': (end - start) * 1e6,
+            'pid': self.pid,
+            'tid': threading.current_thread().ident,
+            'args': args or {},
+        })
+
+    def chrome_trace(self):
+        return {'traceEvents': list(self.events), 'displayTimeUnit': 'ms'}
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.chrome_trace(), f)
+
+
+class _Span(object):
+
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.tracer.add(self.name, self.start, time.time(), self.args)
+
+
+class _NullSpan(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+_null_span = _NullSpan()
+
+
+def enable(tracer=None):
+    global _tracer
+    _tracer = tracer or Tracer()
+    return _tracer
+
+
+def disable():
+    global _tracer
+    tracer, _tracer = _tracer, None
+    return tracer
+
+
+def span(name, **args):
+    """
+    with span('name', key=value): ... records a span when tracing is on.
+    """
+    if _tracer is None:
+        return _null_span
+    return _Span(_tracer, name, args)
+
+
+def traced(name):
+    """
+    Decorator recording a span around every call of the function.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def _fn(*args, **kwargs):
+            if _tracer is None:
+                return fn(*args, **kwargs)
+            with _Span(_tracer, name, {}):
+                return fn(*args, **kwargs)
+        return _fn
+    return decorator
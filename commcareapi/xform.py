@@ -1,15 +1,95 @@
+from contextlib import contextmanager
 from lxml import etree as ET
+import hashlib
 import re
+import threading
+from io import BytesIO
+
+from .tracing import traced
+
+_local = threading.local()
+
+
+def _get_parser():
+    # lxml parsers are reusable but not thread safe, so keep one per thread
+    parser = getattr(_local, 'parser', None)
+    if parser is None:
+        parser = _local.parser = ET.XMLParser(encoding="utf-8", remove_comments=True)
+    return parser
+
+
+def _parse_error(e):
+    return XFormError("Problem parsing an XForm." + ("The parsing error is: %s" % e if e.message else ""))
+
 
 def parse_xml(string):
+    """
+    Parse a byte string, unicode string or file-like object, returning
+    the root element. An already parsed element is returned as it is.
+    """
+    if ET.iselement(string):
+        return string
     # Work around: ValueError: Unicode strings with encoding
     # declaration are not supported.
-    if isinstance(string, unicode):
+    if isinstance(string, unicode) and string.lstrip().startswith(u'<?xml'):
         string = string.encode("utf-8")
     try:
-        return ET.fromstring(string, parser=ET.XMLParser(encoding="utf-8", remove_comments=True))
+        if hasattr(string, 'read'):
+            return ET.parse(string, parser=_get_parser()).getroot()
+        return ET.fromstring(string, parser=_get_parser())
+    except ET.ParseError, e:
+        raise _parse_error(e)
+
+
+def parse_xml_chunks(chunks):
+    """
+    Incrementally parse an iterable of byte strings, e.g. a download being
+    read in blocks, returning the root element.
+    """
+    parser = _get_parser()
+    try:
+        for chunk in chunks:
+            parser.feed(chunk)
+    except Exception, e:
+        # leave the shared parser ready for the next document
+        try:
+            parser.close()
+        except ET.ParseError:
+            pass
+        if isinstance(e, ET.ParseError):
+            raise _parse_error(e)
+        raise
+    try:
+        return parser.close()
     except ET.ParseError, e:
-        raise XFormError("Problem parsing an XForm." + ("The parsing error is: %s" % e if e.message else ""))
+        raise _parse_error(e)
+
+
+def iterparse_xml(source, tag=None, events=('end',)):
+    """
+    Yield (event, element) pairs without building the whole tree. Elements
+    are cleared once their 'end' event has been consumed, so only pull out
+    what is needed before moving to the next one. An already parsed element
+    is walked instead, and left intact.
+    """
+    if ET.iselement(source):
+        for event, element in ET.iterwalk(source, events=events, tag=tag):
+            yield event, element
+        return
+    if isinstance(source, unicode):
+        source = source.encode("utf-8")
+    if not hasattr(source, 'read'):
+        source = BytesIO(source)
+    try:
+        for event, element in ET.iterparse(source, events=events, tag=tag,
+                                           remove_comments=True):
+            yield event, element
+            if event == 'end':
+                element.clear()
+                while element.getprevious() is not None:
+                    del element.getparent()[0]
+    except ET.ParseError, e:
+        raise _parse_error(e)
 
 class XFormError(Exception):
     pass
@@ -61,6 +141,42 @@ class CaseXPath(XPath):
 SESSION_CASE_ID = CaseIDXPath(u"instance('commcaresession')/session/data/case_id")
 
 
+# Namespace-expanded paths, memoised per template. Only the per-form "x"
+# namespace is expected to change after import, so it is part of the key.
+_expanded_paths = {}
+_EXPANDED_PATHS_MAX = 10000
+
+
+def _expand_path(xpath, nsmap):
+    if nsmap is not namespaces:
+        return xpath.format(**nsmap)
+    key = (xpath, nsmap.get('x'))
+    try:
+        return _expanded_paths[key]
+    except KeyError:
+        if len(_expanded_paths) >= _EXPANDED_PATHS_MAX:
+            _expanded_paths.clear()
+        expanded = _expanded_paths[key] = xpath.format(**nsmap)
+        return expanded
+
+
+def _compile_xpath(path):
+    return ET.XPath(path, namespaces=dict(
+        (prefix, uri[1:-1]) for prefix, uri in namespaces.items()))
+
+# Compiled lookups for the paths that are searched with a different value
+# every time, e.g. find_bind(model, id="...")
+find_bind = _compile_xpath('f:bind[@id=$id]')
+find_bind_by_nodeset = _compile_xpath('f:bind[@nodeset=$nodeset]')
+find_translation = _compile_xpath('f:translation[@lang=$lang]')
+find_text = _compile_xpath('f:text[@id=$id]')
+
+BIND_TAG = '{f}bind'.format(**namespaces)
+
+# attributes of the data node that change with every app build
+VERSION_ATTRIBUTES = ('version', 'uiVersion')
+
+
 class WrappedNode(object):
     def __init__(self, xml, namespaces=namespaces):
         if isinstance(xml, basestring):
@@ -70,25 +186,37 @@ class WrappedNode(object):
         self.namespaces=namespaces
 
     def __getattr__(self, name):
-        if name in ('find', 'findall', 'findtext'):
-            wrap = {
-                'find': WrappedNode,
-                'findall': lambda list: map(WrappedNode, list),
-                'findtext': lambda text: text
-            }[name]
-            none = {
-                'find': lambda: WrappedNode(None),
-                'findall': list,
-                'findtext': lambda: None
-            }[name]
-            def _fn(xpath, *args, **kwargs):
-                if self.xml is not None:
-                    return wrap(getattr(self.xml, name)(xpath.format(**self.namespaces), *args, **kwargs))
-                else:
-                    return none()
-            return _fn
-        else:
-            return getattr(self.xml, name)
+        return getattr(self.xml, name)
+
+    def find(self, xpath, *args, **kwargs):
+        if self.xml is None:
+            return WrappedNode(None)
+        return WrappedNode(self.xml.find(_expand_path(xpath, self.namespaces), *args, **kwargs))
+
+    def findall(self, xpath, *args, **kwargs):
+        if self.xml is None:
+            return []
+        return [WrappedNode(n) for n in self.xml.iterfind(_expand_path(xpath, self.namespaces), *args, **kwargs)]
+
+    def iterfind(self, xpath, *args, **kwargs):
+        if self.xml is None:
+            return iter(())
+        return (WrappedNode(n) for n in self.xml.iterfind(_expand_path(xpath, self.namespaces), *args, **kwargs))
+
+    def findtext(self, xpath, *args, **kwargs):
+        if self.xml is None:
+            return None
+        return self.xml.findtext(_expand_path(xpath, self.namespaces), *args, **kwargs)
+
+    def xpath_first(self, compiled, **variables):
+        """
+        Evaluate a compiled lookup such as find_bind, wrapping the first
+        match (or None) like find does.
+        """
+        if self.xml is None:
+            return WrappedNode(None)
+        matches = compiled(self.xml, **variables)
+        return WrappedNode(matches[0] if matches else None)
 
     @property
     def tag_xmlns(self):
@@ -123,6 +251,79 @@ def raise_if_none(message):
     return decorator
 
 
+def _canonical(node, parts, skip=()):
+    """
+    Append a canonical form of node to parts: namespaced tags, sorted
+    attributes and stripped text. Namespace prefixes, whitespace and
+    attribute order make no difference.
+    """
+    parts.append('<' + node.tag)
+    for name, value in sorted(node.attrib.items()):
+        if name not in skip:
+            parts.append('@%s=%s' % (name, value))
+    parts.append('"' + (node.text or '').strip())
+    for child in node:
+        if isinstance(child.tag, basestring):
+            _canonical(child, parts)
+        parts.append('"' + (child.tail or '').strip())
+    parts.append('>')
+
+
+class _BindBatch(object):
+    """
+    State for XForm.batch_binds: binds by nodeset, and the model children
+    waiting to be appended.
+    """
+    def __init__(self, model_node, data_node_name):
+        self.model_node = model_node
+        self.data_node_name = data_node_name
+        self.binds = {}
+        self.pending = []
+        self.pending_binds = set()
+        for bind in model_node.xml.iterfind(BIND_TAG):
+            self.binds.setdefault(bind.get('nodeset'), bind)
+
+    def _in_model(self, elem):
+        return elem.getparent() is self.model_node.xml or \
+            elem in self.pending_binds
+
+    def all_binds(self):
+        return list(self.model_node.xml.iterfind(BIND_TAG)) + \
+            [elem for elem in self.pending if elem in self.pending_binds]
+
+    def find(self, nodeset):
+        bind = self.binds.get(nodeset)
+        if bind is not None and not self._in_model(bind):
+            # removed from the model since the batch started
+            del self.binds[nodeset]
+            bind = next((other for other in self.all_binds()
+                         if other.get('nodeset') == nodeset), None)
+            if bind is not None:
+                self.binds[nodeset] = bind
+        return bind
+
+    def append(self, elem):
+        if elem.tag == BIND_TAG:
+            self.binds.setdefault(elem.get('nodeset'), elem)
+            self.pending_binds.add(elem)
+        self.pending.append(elem)
+
+    def remove(self, elem):
+        if elem in self.pending_binds:
+            self.pending_binds.discard(elem)
+            self.pending = [pending for pending in self.pending
+                            if pending is not elem]
+        else:
+            elem.getparent().remove(elem)
+        if self.binds.get(elem.get('nodeset')) is elem:
+            del self.binds[elem.get('nodeset')]
+
+    def flush(self):
+        self.model_node.xml.extend(self.pending)
+        self.pending = []
+        self.pending_binds = set()
+
+
 class XForm(WrappedNode):
     """
     A bunch of utility functions for doing certain specific
@@ -132,6 +333,7 @@ class XForm(WrappedNode):
     """
     def __init__(self, *args, **kwargs):
         self.fixtures = kwargs.pop('fixtures', {})
+        self._batch = None
         super(XForm, self).__init__(*args, **kwargs)
         if self.exists():
             xmlns = self.data_node.tag_xmlns
@@ -174,8 +376,8 @@ class XForm(WrappedNode):
         return self.media_references(form="audio")
 
     def rename_language(self, old_code, new_code):
-        trans_node = self.itext_node.find('{f}translation[@lang="%s"]' % old_code)
-        duplicate_node = self.itext_node.find('{f}translation[@lang="%s"]' % new_code)
+        trans_node = self.itext_node.xpath_first(find_translation, lang=old_code)
+        duplicate_node = self.itext_node.xpath_first(find_translation, lang=new_code)
         if not trans_node.exists():
             raise XFormError("There's no language called '%s'" % old_code)
         if duplicate_node.exists():
@@ -205,10 +407,10 @@ class XForm(WrappedNode):
         if lang is None:
             trans_node = self.itext_node.find('{f}translation')
         else:
-            trans_node = self.itext_node.find('{f}translation[@lang="%s"]' % lang)
+            trans_node = self.itext_node.xpath_first(find_translation, lang=lang)
             if not trans_node.exists():
                 return None
-        text_node = trans_node.find('{f}text[@id="%s"]' % id)
+        text_node = trans_node.xpath_first(find_text, id=id)
         if not text_node.exists():
             return None
 
@@ -252,6 +454,8 @@ class XForm(WrappedNode):
         elif path[0] == "/":
             return path
         elif not path_context:
+            if self._batch is not None:
+                return "/%s/%s" % (self._batch.data_node_name, path)
             return "/%s/%s" % (self.data_node.tag_name, path)
         else:
             return "%s/%s" % (path_context, path)
@@ -269,6 +473,7 @@ class XForm(WrappedNode):
         return langs
 
 
+    @traced('XForm.get_questions')
     def get_questions(self, langs):
         """
         parses out the questions from the xform, into the format:
@@ -288,7 +493,7 @@ class XForm(WrappedNode):
                 path = prompt.attrib['ref']
             elif 'bind' in prompt.attrib:
                 bind_id = prompt.attrib['bind']
-                bind = self.model_node.find('{f}bind[@id="%s"]' % bind_id)
+                bind = self.model_node.xpath_first(find_bind, id=bind_id)
                 path = bind.attrib['nodeset']
             elif prompt.tag_name == "group":
                 path = ""
@@ -303,7 +508,7 @@ class XForm(WrappedNode):
         def build_questions(group, path_context="", exclude=False):
             
             questions = []
-            for prompt in group.findall('*'):
+            for prompt in group.iterfind('*'):
                 if prompt.tag_xmlns == namespaces['f'][1:-1] and prompt.tag_name != "label":
                     path = self.resolve_path(get_path(prompt), path_context)
                     excluded_paths.add(path)
@@ -342,7 +547,7 @@ class XForm(WrappedNode):
                             }
                             if question['tag'] in ["select1", "select"]:
                                 options = []
-                                for item in prompt.findall('{f}item'):
+                                for item in prompt.iterfind('{f}item'):
                                     translation = self.get_label_text(item, langs)
                                     try:
                                         value = item.findtext('{f}value').strip()
@@ -362,7 +567,7 @@ class XForm(WrappedNode):
         def get_itemset_options(prompt):
             options = []
                                 
-            for item in prompt.findall('{f}itemset'):
+            for item in prompt.iterfind('{f}itemset'):
                 nodeset = item.attrib['nodeset']
                 
                 label_node = item.find('{f}label')
@@ -474,13 +679,13 @@ class XForm(WrappedNode):
                 ref="meta/appVersion",
                 value="instance('commcaresession')/session/context/appversion"
             )
-        add_meta()
+        with self.batch_binds():
+            add_meta()
 
     def add_case_and_meta_1(self, form):
         case = self.case_node
 
         case_parent = self.data_node
-        bind_parent = self.model_node
 
         casexml, binds, transformation = self.create_casexml_1(form)
         if casexml:
@@ -490,20 +695,16 @@ class XForm(WrappedNode):
             casexml = parse_xml(casexml)
             case_parent.append(casexml)
             # if DEBUG: tree = ET.fromstring(ET.tostring(tree))
-            for bind in bind_parent.findall('{f}bind'):
-                if bind.attrib['nodeset'].startswith('case/'):
-                    bind_parent.remove(bind.xml)
-            for bind in binds:
-#                if DEBUG:
-#                    xpath = ".//{x}" + bind.attrib['nodeset'].replace("/", "/{x}")
-#                    if tree.find(fmt(xpath)) is None:
-#                        raise Exception("Invalid XPath Expression %s" % xpath)
-                conflicting = bind_parent.find('{f}bind[@nodeset="%s"]' % bind.attrib['nodeset'])
-                if conflicting.exists():
-                    for a in bind.attrib:
-                        conflicting.attrib[a] = bind.attrib[a]
-                else:
-                    bind_parent.append(bind)
+            with self.batch_binds():
+                for bind in self._all_binds():
+                    if bind.attrib['nodeset'].startswith('case/'):
+                        self._remove_bind(bind)
+                for bind in binds:
+#                    if DEBUG:
+#                        xpath = ".//{x}" + bind.attrib['nodeset'].replace("/", "/{x}")
+#                        if tree.find(fmt(xpath)) is None:
+#                            raise Exception("Invalid XPath Expression %s" % xpath)
+                    self._merge_bind(bind)
 
         if not case_parent.exists():
             raise XFormError("Couldn't get the case XML from one of your forms. "
@@ -533,9 +734,9 @@ class XForm(WrappedNode):
                 {"id": "%s5" % id, "nodeset": "meta/userID", "type": "xsd:string", "{jr}preload": "meta", "{jr}preloadParams": "UserID"},
                 {"id": "%s6" % id, "nodeset": "meta/instanceID", "type": "xsd:string", "{jr}preload": "uid", "{jr}preloadParams": "general"},
             ]
-            for bind in binds:
-                bind = _make_elem('bind', bind)
-                bind_parent.append(bind)
+            with self.batch_binds():
+                for bind in binds:
+                    self._append_to_model(_make_elem('bind', bind))
         add_meta()
         # apply any other transformations
         # necessary to make casexml work
@@ -553,6 +754,27 @@ class XForm(WrappedNode):
                 else:
                     translation.attrib.pop('default', None)
 
+    def fingerprint(self):
+        """
+        A hash of the form's structure: its data node, binds, body and
+        itext, ignoring the version attributes. Builds of an app that
+        leave a form alone give it the same fingerprint, though its
+        version (and so xmlns_unique_id) changes.
+        """
+        parts = []
+        _canonical(self.data_node.xml, parts, skip=VERSION_ATTRIBUTES)
+        for bind in self.model_node.xml.iterfind(BIND_TAG):
+            _canonical(bind, parts)
+        itext = self.model_node.find('{f}itext')
+        if not itext.exists():
+            itext = self.model_node.find('itext')
+        for node in (self.find('{h}body'), itext):
+            if node.exists():
+                _canonical(node.xml, parts)
+            else:
+                parts.append('')
+        return hashlib.sha1(u'\0'.join(parts).encode('utf-8')).hexdigest()
+
     def set_version(self, version):
         """set the form's version attribute"""
         self.data_node.set('version', "%s" % version)
@@ -563,13 +785,58 @@ class XForm(WrappedNode):
             del d['relevant']
         d['nodeset'] = self.resolve_path(d['nodeset'])
         if len(d) > 1:
-            bind = _make_elem('bind', d)
-            conflicting = self.model_node.find('{f}bind[@nodeset="%s"]' % bind.attrib['nodeset'])
-            if conflicting.exists():
-                for a in bind.attrib:
-                    conflicting.attrib[a] = bind.attrib[a]
-            else:
-                self.model_node.append(bind)
+            self._merge_bind(_make_elem('bind', d))
+
+    @contextmanager
+    def batch_binds(self):
+        """
+        Within the block, binds and setvalues are collected and appended to
+        the model in one go, and conflicting binds are found through a
+        nodeset -> bind map instead of searching the model every time.
+        Nested blocks join the outermost one. Binds removed from the model
+        during the block are dropped from the map, and _remove_bind also
+        removes binds that are still waiting to be appended.
+        """
+        if self._batch is not None:
+            yield
+            return
+        self._batch = _BindBatch(self.model_node, self.data_node.tag_name)
+        try:
+            yield
+        finally:
+            batch, self._batch = self._batch, None
+            batch.flush()
+
+    def _find_bind(self, nodeset):
+        if self._batch is not None:
+            return WrappedNode(self._batch.find(nodeset))
+        return self.model_node.xpath_first(find_bind_by_nodeset, nodeset=nodeset)
+
+    def _all_binds(self):
+        """ The bind elements of the model, including those of a batch """
+        if self._batch is not None:
+            return self._batch.all_binds()
+        return list(self.model_node.xml.iterfind(BIND_TAG))
+
+    def _remove_bind(self, bind):
+        if self._batch is not None:
+            self._batch.remove(bind)
+        else:
+            self.model_node.xml.remove(bind)
+
+    def _append_to_model(self, elem):
+        if self._batch is not None:
+            self._batch.append(elem)
+        else:
+            self.model_node.append(elem)
+
+    def _merge_bind(self, bind):
+        conflicting = self._find_bind(bind.attrib['nodeset'])
+        if conflicting.exists():
+            for a in bind.attrib:
+                conflicting.attrib[a] = bind.attrib[a]
+        else:
+            self._append_to_model(bind)
 
     def add_instance(self, id, src):
         """
@@ -585,7 +852,7 @@ class XForm(WrappedNode):
 
     def add_setvalue(self, ref, value, event='xforms-ready', type=None):
         ref = self.resolve_path(ref)
-        self.model_node.append(_make_elem('setvalue', {'ref': ref, 'value': value, 'event': event}))
+        self._append_to_model(_make_elem('setvalue', {'ref': ref, 'value': value, 'event': event}))
         if type:
             self.add_bind(nodeset=ref, type=type)
 
@@ -673,7 +940,7 @@ class XForm(WrappedNode):
                     if not name_path:
                         raise CaseError("Please set 'Name according to question'. "
                                         "This will give each case a 'name' attribute")
-                    name_bind = self.model_node.find('{f}bind[@nodeset="%s"]' % name_path)
+                    name_bind = self.model_node.xpath_first(find_bind_by_nodeset, nodeset=name_path)
 
                     if name_bind.exists():
                         name_bind.attrib['required'] = "true()"
@@ -830,51 +1097,90 @@ class XForm(WrappedNode):
         ET.SubElement(hq_tmp, "{x}freshguid".format(**namespaces))
         self.data_node.append(hq_tmp)
 
-        # binds: username, password
-        for key, path in [('username', username_path), ('password', password_path)]:
-            self.model_node.append(_make_elem('{f}bind', {
-                'nodeset': self.resolve_path('registration/%s' % key),
-                'calculate': self.resolve_path(path)
-            }))
-
-            # add required="true()" to binds of required elements
-            bind = self.model_node.find('{f}bind[@nodeset="%s"]' % self.resolve_path(path))
-            if not bind.exists():
-                bind = _make_elem('{f}bind', {
+        with self.batch_binds():
+            # binds: username, password
+            for key, path in [('username', username_path), ('password', password_path)]:
+                self._append_to_model(_make_elem('{f}bind', {
+                    'nodeset': self.resolve_path('registration/%s' % key),
+                    'calculate': self.resolve_path(path)
+                }))
+
+                # add required="true()" to binds of required elements
+                bind = self._find_bind(self.resolve_path(path))
+                if not bind.exists():
+                    bind = _make_elem('{f}bind', {
+                        'nodeset': self.resolve_path(path),
+                        })
+                    self._append_to_model(bind)
+                bind.set('required', "true()")
+
+            # binds: hq_tmp/loadedguid, hq_tmp/freshguid, registration/date, registration/registering_phone_id
+
+            for path, type, preload, preload_params in [
+                ('registration/date', 'xsd:dateTime', 'timestamp', 'start'),
+                ('registration/registering_phone_id', 'xsd:string', 'property', 'DeviceID'),
+                ('%s/loadedguid' % HQ_TMP, 'xsd:string', 'user', 'uuid'),
+                ('%s/freshguid' % HQ_TMP, 'xsd:string', 'uid', 'general'),
+            ]:
+                self._append_to_model(_make_elem('{f}bind', {
                     'nodeset': self.resolve_path(path),
-                    })
-                self.model_node.append(bind)
-            bind.set('required', "true()")
-
-        # binds: hq_tmp/loadedguid, hq_tmp/freshguid, registration/date, registration/registering_phone_id
-
-        for path, type, preload, preload_params in [
-            ('registration/date', 'xsd:dateTime', 'timestamp', 'start'),
-            ('registration/registering_phone_id', 'xsd:string', 'property', 'DeviceID'),
-            ('%s/loadedguid' % HQ_TMP, 'xsd:string', 'user', 'uuid'),
-            ('%s/freshguid' % HQ_TMP, 'xsd:string', 'uid', 'general'),
-        ]:
-            self.model_node.append(_make_elem('{f}bind', {
-                'nodeset': self.resolve_path(path),
-                'type': type,
-                '{jr}preload': preload,
-                '{jr}preloadParams': preload_params,
+                    'type': type,
+                    '{jr}preload': preload,
+                    '{jr}preloadParams': preload_params,
+                }))
+
+
+            # bind: registration/uuid
+            self._append_to_model(_make_elem('{f}bind', {
+                'nodeset': self.resolve_path('registration/uuid'),
+                'type': 'xsd:string',
+                'calculate': "if({loadedguid}='', {freshguid}, {loadedguid})".format(
+                    loadedguid=self.resolve_path('%s/loadedguid' % HQ_TMP),
+                    freshguid=self.resolve_path('%s/freshguid' % HQ_TMP),
+                )
             }))
 
+            # user_data binds
+            for key, path in data_paths.items():
+                self._append_to_model(_make_elem('{f}bind', {
+                    'nodeset': self.resolve_path('registration/user_data/%s' % key),
+                    'calculate': self.resolve_path(path),
+                }))
 
-        # bind: registration/uuid
-        self.model_node.append(_make_elem('{f}bind', {
-            'nodeset': self.resolve_path('registration/uuid'),
-            'type': 'xsd:string',
-            'calculate': "if({loadedguid}='', {freshguid}, {loadedguid})".format(
-                loadedguid=self.resolve_path('%s/loadedguid' % HQ_TMP),
-                freshguid=self.resolve_path('%s/freshguid' % HQ_TMP),
-            )
-        }))
 
-        # user_data binds
-        for key, path in data_paths.items():
-            self.model_node.append(_make_elem('{f}bind', {
-                'nodeset': self.resolve_path('registration/user_data/%s' % key),
-                'calculate': self.resolve_path(path),
-            }))
+class XFormCache(object):
+    """
+    Parsed XForms and their get_questions output, shared by every
+    definition with the same fingerprint, so a new app build that does
+    not change a form reuses the work done for the previous build.
+
+    Definitions are parsed once per key (e.g. xmlns_unique_id), and
+    get_questions runs once per fingerprint and list of languages.
+    Every definition is parsed with the same fixtures, which are not
+    part of the fingerprint.
+    """
+    def __init__(self, fixtures=None):
+        self.fixtures = fixtures or {}
+        self.fingerprints = {}
+        self.xforms = {}
+        self.questions = {}
+
+    def fingerprint(self, key, definition):
+        fingerprint = self.fingerprints.get(key)
+        if fingerprint is None:
+            xform = XForm(definition, fixtures=self.fixtures)
+            fingerprint = self.fingerprints[key] = xform.fingerprint()
+            self.xforms.setdefault(fingerprint, xform)
+        return fingerprint
+
+    def xform(self, key, definition):
+        return self.xforms[self.fingerprint(key, definition)]
+
+    def get_questions(self, key, definition, langs):
+        fingerprint = self.fingerprint(key, definition)
+        questions_key = (fingerprint, tuple(langs))
+        questions = self.questions.get(questions_key)
+        if questions is None:
+            questions = self.xforms[fingerprint].get_questions(langs)
+            self.questions[questions_key] = questions
+        return questions
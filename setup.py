@@ -7,7 +7,7 @@ from setuptools.command.test import test as TestCommand
 class PyTest(TestCommand):
     def finalize_options(self):
         TestCommand.finalize_options(self)
-        self.test_args = ['-m', 'not apitest']
+        self.test_args = ['-m', 'not apitest and not memtest']
         self.test_suite = True
 
     def run_tests(self):
@@ -0,0 +1,174 @@
+import copy
+import json
+import math
+import os
+import pickle
+import random
+
+import pytest
+
+from commcareapi.aggregate import FormAggregation, NumericSummary, \
+    QuantileSketch
+from commcareapi.comm_care_data import CommCareForm
+from commcareapi.xform import XForm
+
+test_dir = os.path.abspath(os.path.dirname(__file__))
+
+
+def read_fixture(name):
+    with open(os.path.join(test_dir, 'test_fixtures', name), 'r') as f:
+        return f.read()
+
+
+@pytest.fixture
+def xform():
+    xform = XForm(read_fixture('form_definition_for_0len.xml'))
+    # make the plain text questions numbers
+    for bind in xform.model_node.findall('{f}bind'):
+        if bind.attrib['nodeset'] in (
+                '/data/testmodule1_form_createcase_question2',
+                '/data/repeat/testmodule1_form_createcase_repeat_question1'):
+            bind.set('type', 'xsd:int')
+    return xform
+
+
+def make_form(select1='', select='', number='', repeat=None,
+              group_select1=''):
+    data = json.loads(read_fixture('form_data_with_0len_select1.json'))
+    form = data['form']
+    form['testmodule1_form_createcase_question3'] = select1
+    form['testmodule1_form_createcase_question4'] = select
+    form['testmodule1_form_createcase_question2'] = number
+    form['test_module_1_group'][
+        'testmodule1_form_createcase_group_question3'] = group_select1
+    if repeat is not None:
+        form['repeat'] = repeat
+    return CommCareForm(data)
+
+
+def entry(number):
+    return {'testmodule1_form_createcase_repeat_question1': number,
+            'testmodule1_form_createcase_repeat_question2': 'x'}
+
+
+class TestQuantileSketch():
+
+    def test_quantiles_are_within_relative_accuracy(self):
+        values = [random.uniform(-100, 1000) for _ in range(5000)]
+        sketch = QuantileSketch(0.01)
+        sketch.add_values(values)
+        values.sort()
+        for q in (0.05, 0.5, 0.95):
+            exact = values[int(q * (len(values) - 1))]
+            assert abs(sketch.quantile(q) - exact) <= 0.011 * abs(exact)
+
+    def test_merge_is_exact(self):
+        values = [random.expovariate(0.1) for _ in range(1000)] + [0, 0]
+        whole, left, right = QuantileSketch(), QuantileSketch(), \
+            QuantileSketch()
+        whole.add_values(values)
+        left.add_values(values[:300])
+        right.add_values(values[300:])
+        left.merge(right)
+        for q in (0, 0.1, 0.5, 0.9, 1):
+            assert left.quantile(q) == whole.quantile(q)
+
+    def test_empty_sketch(self):
+        assert QuantileSketch().quantile(0.5) is None
+
+
+class TestFormAggregation():
+
+    def test_accumulators_come_from_the_definition(self, xform):
+        aggregation = FormAggregation.from_xform(xform, ['en'])
+        kinds = dict((path, accumulator.kind) for path, accumulator
+                     in aggregation.accumulators.items())
+        assert kinds == {
+            '/data/testmodule1_form_createcase_question2': 'numeric',
+            '/data/testmodule1_form_createcase_question3': 'select',
+            '/data/testmodule1_form_createcase_question4': 'select',
+            '/data/repeat': 'repeat',
+            '/data/repeat/testmodule1_form_createcase_repeat_question1':
+                'numeric',
+            '/data/test_module_1_group/'
+            'testmodule1_form_createcase_group_question3': 'select',
+        }
+
+    def test_aggregates_answers(self, xform):
+        forms = [
+            make_form('select1', 'select1 select2', '4',
+                      repeat=[entry('1'), entry('2')],
+                      group_select1='select2'),
+            make_form('select2', 'select2', 'n/a', repeat=entry('3')),
+            make_form('select1', '', '8'),
+        ]
+        result = FormAggregation.from_xform(xform, ['en']) \
+            .add_forms(forms, batch_size=2).result()
+        questions = result['questions']
+
+        assert result['forms'] == 3
+        select1 = questions['/data/testmodule1_form_createcase_question3']
+        assert select1['answered'] == 3
+        assert select1['counts'] == {'select1': 2, 'select2': 1}
+        assert select1['labels']['select1'] == 'Select 1 Item'
+        select = questions['/data/testmodule1_form_createcase_question4']
+        assert select['answered'] == 2
+        assert select['counts'] == {'select1': 1, 'select2': 2}
+        group = questions['/data/test_module_1_group/'
+                          'testmodule1_form_createcase_group_question3']
+        assert group['counts'] == {'select1': 0, 'select2': 1}
+
+        number = questions['/data/testmodule1_form_createcase_question2']
+        assert (number['count'], number['invalid']) == (2, 1)
+        assert (number['min'], number['max'], number['mean']) == (4, 8, 6)
+        assert number['quantiles'][0.5] == pytest.approx(4, rel=0.01)
+
+        assert questions['/data/repeat']['histogram'] == {2: 1, 1: 1, 0: 1}
+        in_repeat = questions[
+            '/data/repeat/testmodule1_form_createcase_repeat_question1']
+        assert (in_repeat['count'], in_repeat['mean']) == (3, 2)
+
+    def test_unknown_options_are_counted(self, xform):
+        result = FormAggregation.from_xform(xform, ['en']) \
+            .add_forms([make_form('old_option')]).result()
+        counts = result['questions'][
+            '/data/testmodule1_form_createcase_question3']['counts']
+        assert counts.items() == [('select1', 0), ('select2', 0),
+                                  ('old_option', 1)]
+
+    def test_merged_partial_results_match_one_pass(self, xform):
+        forms = [make_form(random.choice(['select1', 'select2']),
+                           number=repr(random.uniform(-1e6, 1e6)),
+                           repeat=[entry(repr(random.expovariate(0.1)))
+                                   for _ in range(random.randint(0, 3))])
+                 for _ in range(50)]
+        whole = FormAggregation.from_xform(xform, ['en']).add_forms(forms)
+
+        parts = []
+        for start in range(0, 50, 20):
+            part = FormAggregation.from_xform(xform, ['en'])
+            part.add_forms(forms[start:start + 20])
+            # as returned from a worker process
+            parts.append(pickle.loads(pickle.dumps(part)))
+        merged = parts[0]
+        for part in parts[1:]:
+            merged.merge(part)
+
+        assert merged.result() == whole.result()
+
+    def test_merged_totals_are_exact(self):
+        values = [1e16, 1.0, -1e16, 0.1, 0.2, 0.3] * 10
+        whole = NumericSummary({'label': 'n'})
+        whole.add_values(values)
+        merged = NumericSummary({'label': 'n'})
+        for value in values:
+            part = NumericSummary({'label': 'n'})
+            part.add_values([value])
+            merged.merge(part)
+        assert merged.result()['mean'] == whole.result()['mean'] == \
+            math.fsum(values) / len(values)
+
+    def test_merge_rejects_other_questions(self, xform):
+        aggregation = FormAggregation.from_xform(xform, ['en'])
+        with pytest.raises(ValueError):
+            aggregation.merge(FormAggregation([]))
@@ -1,10 +1,17 @@
 import os
 import pytest
 import json
+import mock
+import threading
+import time
+import urllib2
+
+from io import BytesIO
 
 from commcareapi.comm_care_data import CommCareAPI, CommCareResources, \
     CommCareResourceValidationError, CommCareSuiteXML, CommCareCase, \
-    CommCareCaseValueError
+    CommCareCaseValueError, CommCareSuiteWatcher, ResourceValidator, \
+    SingleFlight
 from commcareapi.xform import XForm
 
 
@@ -121,6 +128,18 @@ valid_suite = """
         </suite>"""
 
 
+def suite_response(suite_xml, etag=None):
+    response = BytesIO(suite_xml)
+    headers = {'ETag': etag}
+    response.info = lambda: mock.Mock(getheader=headers.get)
+    return response
+
+
+def not_modified(request):
+    raise urllib2.HTTPError(request.get_full_url(), 304, 'Not Modified',
+                            None, None)
+
+
 class TestCommCareSuiteXML():
 
     @pytest.fixture(scope="session")
@@ -160,6 +179,37 @@ class TestCommCareSuiteXML():
         xmlns = xform.data_node.tag_xmlns
         assert len(xmlns) > 20
 
+    def test_get_suite_xml_downloads_and_parses_suite(self):
+        ccfd = CommCareSuiteXML('domain', 'app_id')
+        with mock.patch('commcareapi.comm_care_data.urllib2.urlopen') as urlopen:
+            urlopen.return_value = suite_response(valid_suite)
+            suite_xml = ccfd.get_suite_xml()
+        assert suite_xml == valid_suite
+        assert ccfd.suite_tree.attrib['version'] == '25'
+
+    def test_get_suite_xml_returns_none_when_not_modified(self):
+        ccfd = CommCareSuiteXML('domain', 'app_id')
+        with mock.patch('commcareapi.comm_care_data.urllib2.urlopen') as urlopen:
+            urlopen.side_effect = not_modified
+            assert ccfd.get_suite_xml(etag='"abc"') is None
+        request = urlopen.call_args[0][0]
+        assert request.get_header('If-none-match') == '"abc"'
+
+    def test_get_xform_fingerprints_skips_known_resources(self):
+        test_dir = os.path.abspath(os.path.dirname(__file__))
+        fixture = os.path.join(test_dir, 'test_fixtures',
+                               'test_xform_definition.xml')
+        with open(fixture, 'r') as f:
+            definition = f.read()
+        ccfd = CommCareSuiteXML('domain', 'app_id')
+        with mock.patch.object(ccfd, 'get_xform_definition',
+                               return_value=definition) as get_definition:
+            fingerprints = ccfd.get_xform_fingerprints(
+                valid_suite, known={'c9d5180df5v25': 'abc'})
+        get_definition.assert_called_once_with('./modules-0/forms-1.xml')
+        assert fingerprints == {'c9d5180df5v25': 'abc',
+                                'c9dv25': XForm(definition).fingerprint()}
+
     def test_get_suite_version_returns_version_from_xml(self):
         test_dir = os.path.abspath(os.path.dirname(__file__))
         fixture = os.path.join(test_dir, 'test_fixtures', 'suite.xml')
@@ -315,3 +365,209 @@ class TestCommCareCase():
         assert str(error.value).find(expectederror) >= 0, \
             "Did not find correct error message: %s" % expectederror
 
+
+
+class TestCommCareSuiteWatcher():
+
+    new_suite = valid_suite.replace('version="25"', 'version="26"', 1) \
+        .replace('<resource id="c9d" version="25">',
+                 '<resource id="c9d" version="26">')
+
+    @pytest.fixture
+    def watcher(self, tmpdir):
+        state_file = str(tmpdir.join('suite_state.json'))
+        return CommCareSuiteWatcher(CommCareSuiteXML('domain', 'app_id'),
+                                    state_file=state_file)
+
+    def check(self, watcher, response):
+        with mock.patch('commcareapi.comm_care_data.urllib2.urlopen') as urlopen:
+            if callable(response):
+                urlopen.side_effect = response
+            else:
+                urlopen.return_value = response
+            return watcher.check()
+
+    def test_first_check_adds_all_xforms(self, watcher):
+        change = self.check(watcher, suite_response(valid_suite, '"1"'))
+        assert change['version'] == '25'
+        assert sorted(change['added']) == ['c9d5180df5v25', 'c9dv25']
+        assert change['removed'] == {}
+
+    def test_not_modified_suite_is_no_change(self, watcher):
+        self.check(watcher, suite_response(valid_suite, '"1"'))
+        assert self.check(watcher, not_modified) is None
+        assert watcher.version == '25'
+
+    def test_new_build_only_reports_changed_xforms(self, watcher):
+        self.check(watcher, suite_response(valid_suite, '"1"'))
+        change = self.check(watcher, suite_response(self.new_suite, '"2"'))
+        assert change == {
+            'version': '26',
+            'added': {'c9dv26': './modules-0/forms-1.xml'},
+            'removed': {'c9dv25': './modules-0/forms-1.xml'},
+        }
+
+    def test_state_is_persisted(self, watcher):
+        self.check(watcher, suite_response(valid_suite, '"1"'))
+        restarted = CommCareSuiteWatcher(watcher.suite,
+                                         state_file=watcher.state_file)
+        assert restarted.version == '25'
+        assert restarted.state['etag'] == '"1"'
+
+    def test_get_changed_xform_definitions_fetches_added_only(self, watcher):
+        change = {'added': {'c9dv26': './modules-0/forms-1.xml'}}
+        with mock.patch.object(watcher.suite, 'get_xform_definition',
+                               return_value='<xform/>') as get_definition:
+            definitions = watcher.get_changed_xform_definitions(change)
+        get_definition.assert_called_once_with('./modules-0/forms-1.xml')
+        assert definitions == {'c9dv26': '<xform/>'}
+
+
+class TestResourceValidator():
+
+    validator = ResourceValidator({'id': None, 'properties': None},
+                                  {'properties': {'case_type': None}})
+
+    def test_valid_object_has_no_errors(self):
+        assert self.validator.errors(
+            {'id': 'a', 'properties': {'case_type': 't'}}) == []
+
+    def test_errors_name_missing_keys(self):
+        assert self.validator.errors({'properties': {}}) == \
+            ['missing id', 'missing properties.case_type']
+
+    def test_validate_page_reports_invalid_records(self):
+        page = [{'id': 'a', 'properties': {'case_type': 't'}},
+                {'id': 'b', 'properties': []},
+                {'id': 'c'}]
+        assert self.validator.validate_page(page) == [
+            (1, 'b', ['properties is not a dictionary']),
+            (2, 'c', ['missing properties'])]
+
+    def test_validate_page_can_sample(self):
+        page = [{'id': 'a'}, {'id': 'b'}, {'id': 'c'}]
+        assert [index for index, _, _ in
+                self.validator.validate_page(page, sample=2)] == [0, 2]
+
+    def test_validate_page_sample_spans_pages(self):
+        page = [{'id': 'd'}, {'id': 'e'}, {'id': 'f'}]
+        assert [index for index, _, _ in self.validator.validate_page(
+            page, sample=2, start=3)] == [4]
+
+    def list_cases(self, objects, **kwargs):
+        api = mock.Mock()
+        api.case.get.return_value = mock.Mock(data={
+            'objects': objects, 'meta': {'total_count': len(objects)}})
+        return CommCareResources(api).list_cases(**kwargs)
+
+    def test_listing_reports_each_invalid_case(self):
+        case = json.loads(open(os.path.join(
+            os.path.dirname(__file__), 'test_fixtures',
+            'case_response.json')).read())
+        with pytest.raises(CommCareResourceValidationError) as error:
+            self.list_cases([case, {'id': 'b'}, dict(case, id='c',
+                                                     properties=[])])
+        message = str(error.value)
+        assert 'object 1 (id b): missing' in message
+        assert 'missing case_id' in message
+        assert 'object 2 (id c): properties is not a dictionary' in message
+
+    def test_trusted_listing_is_not_validated(self):
+        assert len(self.list_cases([{'id': 'b'}], validate=0)) == 1
+
+    def test_case_without_properties_is_rejected(self):
+        with pytest.raises(CommCareResourceValidationError):
+            CommCareCase({'case_id': 'a'})
+
+    def test_trusted_case_is_not_validated(self):
+        assert CommCareCase({'case_id': 'a'}, validate=False).case_id == 'a'
+
+
+class TestSingleFlight():
+
+    def concurrent(self, flight, key, fn, count=5):
+        """ Call flight.do(key, fn) from count threads at once """
+        results = []
+        def run():
+            try:
+                results.append(flight.do(key, fn))
+            except Exception as e:
+                results.append(e)
+        threads = [threading.Thread(target=run) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def slow(self, calls, result):
+        def fn():
+            calls.append(1)
+            time.sleep(0.05)
+            if isinstance(result, Exception):
+                raise result
+            return result
+        return fn
+
+    def test_concurrent_calls_share_one_request(self):
+        flight, calls = SingleFlight(window=0), []
+        results = self.concurrent(flight, 'a', self.slow(calls, 'data'))
+        assert calls == [1]
+        assert results == ['data'] * 5
+        assert (flight.requests, flight.shared) == (1, 4)
+
+    def test_concurrent_calls_share_the_exception(self):
+        flight, calls = SingleFlight(), []
+        error = ValueError('boom')
+        results = self.concurrent(flight, 'a', self.slow(calls, error))
+        assert calls == [1]
+        assert results == [error] * 5
+        # failures are not kept for the window
+        assert flight.do('a', lambda: 'retried') == 'retried'
+
+    def test_results_are_reused_within_window(self):
+        flight = SingleFlight(window=60)
+        assert flight.do('a', lambda: 1) == 1
+        assert flight.do('a', lambda: 2) == 1
+        assert flight.do('b', lambda: 3) == 3
+
+    def test_results_expire_after_window(self):
+        flight = SingleFlight(window=0.01)
+        assert flight.do('a', lambda: 1) == 1
+        time.sleep(0.02)
+        assert flight.do('a', lambda: 2) == 2
+        assert flight.calls.keys() == ['a']
+
+    def test_resources_coalesce_case_lookups(self):
+        test_dir = os.path.abspath(os.path.dirname(__file__))
+        fixture = os.path.join(test_dir, 'test_fixtures', 'case_response.json')
+        with open(fixture, 'r') as f:
+            case_data = json.load(f)
+        api = mock.Mock()
+        api.case.get.return_value = mock.Mock(data=case_data)
+        resources = CommCareResources(api, lookup_window=60)
+
+        first = resources.case(case_data['case_id'])
+        first.case_data['properties']['case_name'] = 'changed'
+        second = resources.case(case_data['case_id'])
+
+        api.case.get.assert_called_once_with(case_data['case_id'], {})
+        assert first.case_id == second.case_id
+        assert second.case_data['properties']['case_name'] != 'changed'
+
+    def test_results_are_not_kept_by_default(self):
+        api = mock.Mock()
+        api.fixture.get.return_value = mock.Mock(data={
+            'objects': [{'id': 1}], 'meta': {'total_count': 1}})
+        resources = CommCareResources(api)
+        resources.fixture()
+        resources.fixture()
+        assert api.fixture.get.call_count == 2
+
+    def test_concurrent_callers_get_their_own_copy(self):
+        flight, calls = SingleFlight(), []
+        results = self.concurrent(flight, 'a', self.slow(calls, {'a': [1]}))
+        assert calls == [1]
+        assert all(result == {'a': [1]} for result in results)
+        assert len(set(id(result) for result in results)) == 5
+        assert len(set(id(result['a']) for result in results)) == 5
@@ -0,0 +1,97 @@
+import pytest
+
+from commcareapi.comm_care_data import CommCareFormSync
+from mock_api import PagedResource, get_resources_for
+
+
+def form(form_id, received_on):
+    return {'id': form_id, 'received_on': received_on, 'type': 'data',
+            'metadata': {},
+            'form': {'@xmlns': 'http://example.org/form', 'meta': {}}}
+
+
+def received_since(form, params):
+    start = params.get('received_on_start')
+    return start is None or form['received_on'] >= start
+
+
+def form_resource(forms):
+    """ Serves forms two a page, honouring received_on_start """
+    return PagedResource(forms, filter=received_since, max_limit=2)
+
+
+class TestListForms():
+
+    def test_streams_all_pages_as_forms(self):
+        forms = [form('a', '2013-01-01'), form('b', '2013-01-02'),
+                 form('c', '2013-01-03')]
+        resources = get_resources_for('form', form_resource(forms))
+
+        listed = resources.list_forms()
+
+        assert not isinstance(listed, list)
+        assert [f.form_id for f in listed] == ['a', 'b', 'c']
+
+    def test_filters_are_sent_as_params(self):
+        resource = form_resource([])
+        list(get_resources_for('form', resource).list_forms(
+            xmlns='http://example.org/form',
+            received_on_start='2013-01-01', received_on_end='2013-02-01'))
+        params = resource.requests[0]
+        assert params['xmlns'] == 'http://example.org/form'
+        assert params['received_on_start'] == '2013-01-01'
+        assert params['received_on_end'] == '2013-02-01'
+        assert params['order_by'] == 'received_on'
+
+
+class TestCommCareFormSync():
+
+    def test_second_sync_only_yields_new_forms(self, tmpdir):
+        state_file = str(tmpdir.join('forms.json'))
+        forms = [form('a', '2013-01-01'), form('b', '2013-01-02'),
+                 form('c', '2013-01-02')]
+        resource = form_resource(forms)
+        resources = get_resources_for('form', resource)
+
+        first = CommCareFormSync(resources, state_file)
+        assert [f.form_id for f in first.sync()] == ['a', 'b', 'c']
+
+        forms.append(form('d', '2013-01-02'))
+        forms.append(form('e', '2013-01-03'))
+        second = CommCareFormSync(resources, state_file)
+        assert [f.form_id for f in second.sync()] == ['d', 'e']
+        assert resource.requests[-1]['received_on_start'] == '2013-01-02'
+        assert second.received_on == '2013-01-03'
+
+    def test_progress_is_saved_when_sync_is_abandoned(self, tmpdir):
+        state_file = str(tmpdir.join('forms.json'))
+        forms = [form('a', '2013-01-01'), form('b', '2013-01-02'),
+                 form('c', '2013-01-03')]
+        resources = get_resources_for('form', form_resource(forms))
+
+        sync = CommCareFormSync(resources, state_file).sync()
+        next(sync)
+        next(sync)
+        next(sync)
+        sync.close()
+
+        resumed = CommCareFormSync(resources, state_file)
+        assert [f.form_id for f in resumed.sync()] == ['c']
+
+    def test_form_whose_consumer_failed_is_synced_again(self, tmpdir):
+        state_file = str(tmpdir.join('forms.json'))
+        forms = [form('a', '2013-01-01'), form('b', '2013-01-02'),
+                 form('c', '2013-01-02')]
+        resources = get_resources_for('form', form_resource(forms))
+
+        consumed = []
+        with pytest.raises(ValueError):
+            for f in CommCareFormSync(resources, state_file).sync():
+                if f.form_id == 'b':
+                    raise ValueError('could not process %s' % f.form_id)
+                consumed.append(f.form_id)
+
+        assert consumed == ['a']
+        resumed = CommCareFormSync(resources, state_file)
+        assert resumed.received_on == '2013-01-01'
+        assert [f.form_id for f in resumed.sync()] == ['b', 'c']
@@ -2,7 +2,8 @@ import os
 import pytest
 import json
 import pprint
-from commcareapi.comm_care_data import CommCareForm
+from commcareapi.comm_care_data import CommCareForm, \
+    CommCareResourceValidationError, should_validate, fixed_path, jsonpath
 from commcareapi.xform import XForm
 
 
@@ -21,7 +22,8 @@ def comm_care_form_initial():
 
 @pytest.fixture()
 def comm_care_form_corrupt():
-    return CommCareForm(form_data('form_response_corrupt.json'))
+    return CommCareForm(form_data('form_response_corrupt.json'),
+                        validate=False)
 
 
 @pytest.fixture()
@@ -58,7 +60,7 @@ class TestCommCareForm():
 
         form_data = {"form": {"@xmlns": xmlns}}
 
-        form = CommCareForm(form_data)
+        form = CommCareForm(form_data, validate=False)
         expected_xmlns_id = xmlns
         assert form.xmlns_id, expected_xmlns_id
 
@@ -69,13 +71,18 @@ class TestCommCareForm():
         form_data = {"form": {"@xmlns": xmlns,
                               "@version": version}}
 
-        form = CommCareForm(form_data)
+        form = CommCareForm(form_data, validate=False)
         expected_xmlns_unique_id = xmlns + "v" + version
         assert form.xmlns_unique_id, expected_xmlns_unique_id
 
+    def test_xmlns_unique_id_is_none_without_version(self):
+        form_data = {"form": {"@xmlns": "http://example.org/form"}}
+        form = CommCareForm(form_data, validate=False)
+        assert form.xmlns_unique_id is None
+
     def test_form_case_id_returns_case_id(self):
         form_data = {"form": {"case": {"@caseid": "bananas"}}}
-        form = CommCareForm(form_data)
+        form = CommCareForm(form_data, validate=False)
         assert form.form_case_id == "bananas"
 
     def test_is_form_valid_passes_with_good_data(self,
@@ -86,6 +93,33 @@ class TestCommCareForm():
                                                            comm_care_form_corrupt):
         assert comm_care_form_corrupt.is_form_valid() is False
 
+    def test_corrupt_form_is_rejected(self):
+        with pytest.raises(CommCareResourceValidationError):
+            CommCareForm(form_data('form_response_corrupt.json'))
+
+    def test_sampled_validation_checks_one_form_in_n(self):
+        corrupt = form_data('form_response_corrupt.json')
+        forms = [CommCareForm(corrupt, should_validate(3, i))
+                 for i in (1, 2, 4, 5)]
+        assert len(forms) == 4
+        with pytest.raises(CommCareResourceValidationError):
+            CommCareForm(corrupt, should_validate(3, 6))
+
+    def test_sample_rate_of_zero_checks_nothing(self):
+        corrupt = form_data('form_response_corrupt.json')
+        assert CommCareForm(corrupt, should_validate(0, 0))
+
+    @pytest.mark.parametrize('data', [
+        {'id': 'f', 'form': {'case': {'@case_updated': 'x'}}},
+        {'id': None, 'form': {'case': None}},
+        {'form': []},
+        {}])
+    def test_fixed_path_matches_jsonpath(self, data):
+        for keys in (('id',), ('form', 'case'),
+                     ('form', 'case', '@case_updated')):
+            expression = '$.' + '.'.join(keys)
+            assert fixed_path(data, *keys) == jsonpath(data, expression)
+
 
 class TestHumaniseFormData():
 
@@ -152,7 +186,7 @@ class TestHumaniseFormData():
                 ), 
                 ('PEAR', 'No Data')]
 
-        form = CommCareForm(form_data)
+        form = CommCareForm(form_data, validate=False)
         actual = form.make_human_readable(self.form_definition)
         assert actual == expected
 
@@ -175,7 +209,7 @@ class TestHumaniseFormData():
                 ),
                 ('PEAR', 'No Data')]
 
-        form = CommCareForm(form_data)
+        form = CommCareForm(form_data, validate=False)
         actual = form.make_human_readable(self.form_definition)
         assert actual == expected
 
@@ -278,7 +312,7 @@ class TestHumaniseFormData():
             ]
         )]
 
-        form = CommCareForm(form_data)
+        form = CommCareForm(form_data, validate=False)
         actual = form.make_human_readable(form_definition)
         
         assert actual == expected
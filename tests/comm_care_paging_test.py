@@ -0,0 +1,111 @@
+import json
+import socket
+
+import httplib2
+import mock
+import pytest
+
+from commcareapi.comm_care_data import AdaptivePageSize, CommCareAPI, \
+    CommCareResources
+from mock_api import PagedResource, get_resources_for
+
+
+class TestAdaptivePageSize():
+
+    def test_grows_when_pages_are_fast_and_full(self):
+        page_size = AdaptivePageSize(min_limit=10, max_limit=1000, limit=100)
+        page_size.page_fetched(0, 100, 0.1)
+        assert page_size.limit == 200
+
+    def test_does_not_grow_past_max_limit(self):
+        page_size = AdaptivePageSize(max_limit=150, limit=100)
+        page_size.page_fetched(0, 100, 0.1)
+        assert page_size.limit == 150
+
+    def test_shrinks_in_proportion_to_slow_page(self):
+        page_size = AdaptivePageSize(limit=100, target_seconds=2.0)
+        page_size.page_fetched(0, 100, 4.0)
+        assert page_size.limit == 50
+
+    def test_shrinks_when_over_size_budget(self):
+        page_size = AdaptivePageSize(limit=100, target_bytes=1000)
+        page_size.page_fetched(0, 100, 0.1, size=4000)
+        assert page_size.limit == 25
+
+    def test_halves_after_failure_but_not_below_min_limit(self):
+        page_size = AdaptivePageSize(min_limit=40, limit=60)
+        page_size.page_failed(0, 1.0, socket.timeout())
+        assert page_size.limit == 40
+
+    def test_decisions_are_recorded(self):
+        page_size = AdaptivePageSize(limit=100)
+        page_size.page_fetched(0, 100, 0.1)
+        assert page_size.history == [{
+            'offset': 0, 'limit': 100, 'objects': 100, 'seconds': 0.1,
+            'bytes': None, 'error': None, 'next_limit': 200}]
+
+
+class TestAdaptivePaging():
+
+    def test_all_objects_returned_once_in_order(self):
+        resource = PagedResource(range(1000))
+        page_size = AdaptivePageSize(min_limit=10, max_limit=400, limit=10)
+
+        objects = list(get_resources_for('case', resource).get_all_resources(
+            'case', page_size=page_size))
+
+        assert objects == range(1000)
+        limits = [r['limit'] for r in resource.requests]
+        assert limits[:3] == [10, 20, 40]
+
+    def test_failed_page_is_retried_at_same_offset_with_smaller_limit(self):
+        resource = PagedResource(range(30), failures=1)
+        page_size = AdaptivePageSize(min_limit=5, limit=20)
+
+        objects = list(get_resources_for('case', resource).get_all_resources(
+            'case', page_size=page_size))
+
+        assert objects == range(30)
+        assert [(r['offset'], r['limit']) for r in resource.requests][:2] == \
+            [(0, 20), (0, 10)]
+        assert page_size.history[0]['error'] is not None
+
+    def test_gives_up_after_max_retries(self):
+        resource = PagedResource(range(30), failures=10)
+        page_size = AdaptivePageSize(limit=20, max_retries=2)
+
+        with pytest.raises(socket.timeout):
+            list(get_resources_for('case', resource).get_all_resources(
+                'case', page_size=page_size))
+        assert len(resource.requests) == 3
+
+    def test_non_retryable_errors_are_raised(self):
+        resource = PagedResource(range(30), failures=1,
+                                 error=ValueError('bad'))
+        with pytest.raises(ValueError):
+            list(get_resources_for('case', resource).get_all_resources(
+                'case', page_size=AdaptivePageSize()))
+        assert len(resource.requests) == 1
+
+    def test_socket_errors_through_drest_are_retried(self):
+        api = CommCareAPI('domain', 'user', 'password')
+        body = json.dumps({'objects': [{'id': 1}],
+                           'meta': {'total_count': 1}})
+        response = httplib2.Response({'status': '200',
+                                      'content-type': 'application/json'})
+        http = mock.Mock()
+        # drest retries a socket error once itself, then raises
+        # dRestAPIError
+        http.request.side_effect = [socket.timeout('timed out'),
+                                    socket.error('reset'),
+                                    (response, body)]
+        page_size = AdaptivePageSize(limit=20)
+
+        with mock.patch.object(api.request, '_get_http', return_value=http):
+            objects = list(CommCareResources(api).get_all_resources(
+                'case', page_size=page_size))
+
+        assert objects == [{'id': 1}]
+        assert http.request.call_count == 3
+        assert page_size.history[0]['error'] is not None
+        assert page_size.limit == 10
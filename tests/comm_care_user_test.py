@@ -1,3 +1,6 @@
+import mock
+
+from commcareapi.comm_care_data import CommCareResources, CommCareDirectory
 from mock_api import get_mock_api_resource
 
 
@@ -6,7 +9,66 @@ class TestCommCareUser():
     def test_list_users_resource_has_objects(self):
         resources = get_mock_api_resource(
             'user',
-            {'objects': 'bar'}
+            {'objects': ['bar']}
         )
         users = resources.list_users()
-        assert users == "bar"
+        assert users == ['bar']
+
+    def test_list_users_pages_through_all_users(self):
+        def get_data(params):
+            data = [{'objects': ['foo'], 'meta': {'total_count': 2}},
+                    {'objects': ['bar'], 'meta': {'total_count': 2}}]
+            return mock.Mock(data=data[params['offset']])
+
+        api_mock = mock.Mock()
+        api_mock.user.get = get_data
+        resources = CommCareResources(api_mock)
+
+        assert resources.list_users() == ['foo', 'bar']
+
+
+class TestCommCareDirectory():
+
+    users = [{'id': 'u1', 'username': 'alice'},
+             {'id': 'u2', 'username': 'bob'}]
+    groups = [{'id': 'g1', 'name': 'Team', 'users': ['u1', 'u2', 'gone']}]
+
+    def directory(self, ttl=3600):
+        resources = mock.Mock()
+        resources.list_users.return_value = self.users
+        resources.list_groups.return_value = self.groups
+        return CommCareDirectory(resources, ttl=ttl)
+
+    def test_lookups(self):
+        directory = self.directory()
+        assert directory.user('u2')['username'] == 'bob'
+        assert directory.user_by_username('alice')['id'] == 'u1'
+        assert directory.group('g1')['name'] == 'Team'
+        assert directory.user('nobody') is None
+
+    def test_members_and_groups_for_user(self):
+        directory = self.directory()
+        assert [u['id'] for u in directory.members('g1')] == ['u1', 'u2']
+        assert [g['id'] for g in directory.groups_for_user('u1')] == ['g1']
+        assert directory.groups_for_user('nobody') == []
+
+    def test_owner_can_be_user_or_group(self):
+        directory = self.directory()
+        assert directory.owner('u1')['username'] == 'alice'
+        assert directory.owner('g1')['name'] == 'Team'
+        assert directory.owner('unknown') is None
+
+    def test_lists_are_fetched_once_within_ttl(self):
+        directory = self.directory()
+        directory.user('u1')
+        directory.group('g1')
+        assert directory.resources.list_users.call_count == 1
+
+    def test_lists_are_fetched_again_after_ttl(self):
+        directory = self.directory(ttl=60)
+        with mock.patch('commcareapi.comm_care_data.time.time') as now:
+            now.return_value = 1000
+            directory.user('u1')
+            now.return_value = 1061
+            directory.user('u1')
+        assert directory.resources.list_users.call_count == 2
@@ -0,0 +1,60 @@
+import mock
+import pytest
+
+from commcareapi.comm_care_data import CommCareCase, CommCareForm, \
+    CommCareDirectory
+from commcareapi.enrich import CommCareEnricher
+
+
+def make_case(user_id, owner_id):
+    return CommCareCase({'case_id': 'c', 'user_id': user_id,
+                         'properties': {'owner_id': owner_id}},
+                        validate=False)
+
+
+@pytest.fixture
+def directory():
+    resources = mock.Mock()
+    resources.list_users.return_value = [
+        {'id': 'u1', 'username': 'alice', 'email': 'alice@example.org'}]
+    resources.list_groups.return_value = [
+        {'id': 'g1', 'name': 'Team', 'users': ['u1']}]
+    return CommCareDirectory(resources)
+
+
+class TestCommCareEnricher():
+
+    def test_case_owned_by_group(self, directory):
+        case, = CommCareEnricher(directory).enrich([make_case('u1', 'g1')])
+        assert case.enrichment == {
+            'user': {'id': 'u1', 'type': 'user', 'username': 'alice',
+                     'groups': [{'id': 'g1', 'type': 'group',
+                                 'name': 'Team'}]},
+            'owner': {'id': 'g1', 'type': 'group', 'name': 'Team'},
+        }
+
+    def test_unknown_owner_passes_through(self, directory):
+        case, = CommCareEnricher(directory).enrich([make_case('x', 'y')])
+        assert case.enrichment == {'user': None, 'owner': None}
+
+    def test_projected_fields_are_configurable(self, directory):
+        enricher = CommCareEnricher(directory, user_fields=('email',),
+                                    group_fields=())
+        case, = enricher.enrich([make_case('u1', 'u1')])
+        assert case.enrichment['owner'] == {
+            'id': 'u1', 'type': 'user', 'email': 'alice@example.org',
+            'groups': [{'id': 'g1', 'type': 'group'}]}
+
+    def test_form_user_and_case_owner(self, directory):
+        form = CommCareForm({'form': {
+            'meta': {'userID': 'u1'},
+            'case': {'create': {'owner_id': 'g1'}}}}, validate=False)
+        form, = CommCareEnricher(directory).enrich([form])
+        assert form.enrichment['user']['username'] == 'alice'
+        assert form.enrichment['owner']['name'] == 'Team'
+
+    def test_projections_are_built_once_per_id(self, directory):
+        enricher = CommCareEnricher(directory)
+        cases = list(enricher.enrich(make_case('u1', 'g1')
+                                     for _ in range(3)))
+        assert cases[0].enrichment['user'] is cases[2].enrichment['user']
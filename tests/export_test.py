@@ -0,0 +1,262 @@
+import copy
+import gzip
+import os
+import json
+
+import mock
+import pytest
+
+from commcareapi.comm_care_data import CommCareForm
+from commcareapi.export import render_forms, BulkExport, ExportIndex, \
+    ExportError
+from commcareapi.xform import XForm
+from mock_api import PagedResource
+
+
+def read_fixture(fixture):
+    test_dir = os.path.abspath(os.path.dirname(__file__))
+    with open(os.path.join(test_dir, 'test_fixtures', fixture), 'r') as f:
+        return f.read()
+
+
+class TestRenderForms():
+
+    def forms(self, count):
+        form_data = json.loads(
+            read_fixture('form_data_with_0len_select1.json'))
+        forms = []
+        for i in range(count):
+            data = copy.deepcopy(form_data)
+            data['id'] = 'form%d' % i
+            forms.append(CommCareForm(data))
+        return forms
+
+    def definitions(self):
+        definition = read_fixture('form_definition_for_0len.xml')
+        xmlns = XForm(definition).data_node.tag_xmlns
+        return {xmlns: definition}
+
+    def test_output_matches_make_human_readable(self):
+        form = self.forms(1)[0]
+        definitions = self.definitions()
+        questions = XForm(definitions.values()[0]).get_questions(['en'])
+
+        rendered = list(render_forms([form], definitions, ['en'],
+                                     processes=1))
+
+        assert rendered == [(form.form_id,
+                             form.make_human_readable(questions))]
+
+    def test_order_is_preserved_across_processes(self):
+        forms = self.forms(25)
+
+        rendered = render_forms(forms, self.definitions(), ['en'],
+                                processes=2, batch_size=3, max_in_flight=2)
+
+        assert [form_id for form_id, _ in rendered] == \
+            [form.form_id for form in forms]
+
+    def test_form_without_definition_renders_as_none(self):
+        form = self.forms(1)[0]
+        rendered = list(render_forms([form], {}, ['en'], processes=1))
+        assert rendered == [(form.form_id, None)]
+
+    def test_form_without_version_uses_its_xmlns(self):
+        # real HQ data: form_response_2.json has no @version
+        form = CommCareForm(json.loads(read_fixture('form_response_2.json')))
+        definition = read_fixture('form_definition_for_0len.xml')
+
+        assert list(render_forms([form], {}, ['en'], processes=1)) == \
+            [(form.form_id, None)]
+        rendered = list(render_forms([form], {form.xmlns_id: definition},
+                                     ['en'], processes=1))
+        questions = XForm(definition).get_questions(['en'])
+        assert rendered == [(form.form_id,
+                             form.make_human_readable(questions))]
+
+
+def with_value(i):
+    # values of i characters, so lines differ in length
+    return {'id': i, 'value': 'x' * i}
+
+
+def make_export(resource, output_dir, **kwargs):
+    def make_resources():
+        return mock.Mock(api=mock.Mock(case=resource))
+    return BulkExport(make_resources, 'case', output_dir, progress=None,
+                      **kwargs)
+
+
+def read_parts(output_dir):
+    objects = []
+    for name in sorted(os.listdir(output_dir)):
+        if name.endswith('.ndjson.gz'):
+            f = gzip.open(os.path.join(output_dir, name), 'rb')
+        elif name.endswith('.ndjson'):
+            f = open(os.path.join(output_dir, name), 'rb')
+        else:
+            continue
+        objects.extend(json.loads(line) for line in f)
+        f.close()
+    return objects
+
+
+def part_files(output_dir):
+    return sorted(name for name in os.listdir(output_dir)
+                  if name.startswith('case-'))
+
+
+class TestBulkExport():
+
+    def test_exports_all_objects_in_windows(self, tmpdir):
+        output_dir = str(tmpdir.join('out'))
+        resource = PagedResource(25)
+
+        count = make_export(resource, output_dir, window=10, workers=3).run()
+
+        assert count == 25
+        assert read_parts(output_dir) == [{'id': i} for i in range(25)]
+        assert sorted(resource.offsets) == [0, 10, 20]
+
+    def test_checkpoint_records_completed_windows(self, tmpdir):
+        output_dir = str(tmpdir.join('out'))
+        make_export(PagedResource(25), output_dir, window=10).run()
+
+        with open(os.path.join(output_dir, 'case.checkpoint.json')) as f:
+            checkpoint = json.load(f)
+        assert checkpoint['total_count'] == 25
+        assert checkpoint['done'] == {'0': 10, '10': 10, '20': 5}
+
+    def test_resume_only_fetches_missing_windows(self, tmpdir):
+        output_dir = str(tmpdir.join('out'))
+        make_export(PagedResource(25), output_dir, window=10).run()
+        os.remove(os.path.join(output_dir, 'case-000000010.ndjson.gz'))
+        checkpoint_file = os.path.join(output_dir, 'case.checkpoint.json')
+        with open(checkpoint_file) as f:
+            checkpoint = json.load(f)
+        del checkpoint['done']['10']
+        with open(checkpoint_file, 'w') as f:
+            json.dump(checkpoint, f)
+
+        resource = PagedResource(25)
+        count = make_export(resource, output_dir, window=10).run()
+
+        # the total_count check, then the missing window
+        assert resource.offsets == [0, 10]
+        assert resource.requests[0]['limit'] == 1
+        assert count == 25
+        assert read_parts(output_dir) == [{'id': i} for i in range(25)]
+
+    def test_resume_fetches_objects_added_since(self, tmpdir):
+        output_dir = str(tmpdir.join('out'))
+        make_export(PagedResource(25), output_dir, window=10).run()
+
+        resource = PagedResource(45)
+        count = make_export(resource, output_dir, window=10).run()
+
+        assert resource.offsets == [0, 20, 30, 40]
+        assert count == 45
+        assert read_parts(output_dir) == [{'id': i} for i in range(45)]
+
+    def test_listing_order_is_fixed(self, tmpdir):
+        resource = PagedResource(5)
+        make_export(resource, str(tmpdir.join('cases')), window=10).run()
+        assert resource.requests[0]['order_by'] == 'server_date_modified'
+
+        resource = PagedResource(5)
+        make_export(resource, str(tmpdir.join('by_date')), window=10,
+                    params={'order_by': 'date_modified'}).run()
+        assert resource.requests[0]['order_by'] == 'date_modified'
+
+    def test_compressed_layout(self, tmpdir):
+        output_dir = str(tmpdir.join('out'))
+        resource = PagedResource(25, with_value)
+
+        make_export(resource, output_dir, window=10).run()
+
+        assert part_files(output_dir) == [
+            'case-000000000.ndjson.gz', 'case-000000010.ndjson.gz',
+            'case-000000020.ndjson.gz']
+        assert read_parts(output_dir) == [{'id': i, 'value': 'x' * i}
+                                          for i in range(25)]
+
+    def test_indexed_layout(self, tmpdir):
+        output_dir = str(tmpdir.join('out'))
+        resource = PagedResource(25, with_value)
+
+        make_export(resource, output_dir, window=10, compress=False).run()
+
+        assert part_files(output_dir) == [
+            'case-000000000.ndjson', 'case-000000000.ndjson.idx',
+            'case-000000010.ndjson', 'case-000000010.ndjson.idx',
+            'case-000000020.ndjson', 'case-000000020.ndjson.idx']
+        assert read_parts(output_dir) == [{'id': i, 'value': 'x' * i}
+                                          for i in range(25)]
+        with open(os.path.join(output_dir, 'case.checkpoint.json')) as f:
+            assert json.load(f)['compress'] is False
+
+    def test_windows_larger_than_a_page_are_filled(self, tmpdir):
+        output_dir = str(tmpdir.join('out'))
+        resource = PagedResource(250, max_limit=100)
+
+        count = make_export(resource, output_dir, window=1000).run()
+
+        assert count == 250
+        assert [obj['id'] for obj in read_parts(output_dir)] == range(250)
+        assert resource.offsets == [0, 100, 200]
+
+    def test_short_window_is_not_marked_done(self, tmpdir):
+        output_dir = str(tmpdir.join('out'))
+        resource = PagedResource(25)
+        get = resource.get
+
+        def short_get(params):
+            # objects 15-19 go missing though total_count still says 25
+            resp = get(params)
+            if params['offset'] == 10:
+                resp.data['objects'] = resp.data['objects'][:5]
+            elif params['offset'] == 15:
+                resp.data['objects'] = []
+            return resp
+        resource.get = short_get
+
+        with pytest.raises(ExportError):
+            make_export(resource, output_dir, window=10).run()
+        with open(os.path.join(output_dir, 'case.checkpoint.json')) as f:
+            assert '10' not in json.load(f)['done']
+
+
+class TestExportIndex():
+
+    def export(self, tmpdir, total=25):
+        output_dir = str(tmpdir.join('out'))
+        make_export(PagedResource(total, with_value), output_dir,
+                    window=10, compress=False).run()
+        return output_dir
+
+    def test_index_is_written_next_to_each_part(self, tmpdir):
+        output_dir = self.export(tmpdir)
+        with open(os.path.join(output_dir, 'case-000000010.ndjson.idx')) as f:
+            lines = [line.split('\t') for line in f]
+        assert [line[0] for line in lines] == [str(i) for i in range(10, 20)]
+        assert lines[0][1] == '0'
+
+    def test_get(self, tmpdir):
+        with ExportIndex(self.export(tmpdir), 'case') as index:
+            assert len(index) == 25
+            case = index.get(u'17')
+            assert case.case_data == {'id': 17, 'value': 'x' * 17}
+            assert index.get(u'missing') is None
+
+    def test_get_many_reads_in_offset_order(self, tmpdir):
+        index = ExportIndex(self.export(tmpdir), 'case')
+        reads = []
+        read = index._read
+        index._read = lambda entry: reads.append(entry) or read(entry)
+
+        found = index.get_many([u'21', u'3', u'missing', u'12', u'4'])
+
+        assert sorted(found) == [u'12', u'21', u'3', u'4']
+        assert found[u'3'].case_data['id'] == 3
+        assert reads == sorted(reads)
+        index.close()
@@ -0,0 +1,102 @@
+import threading
+
+import mock
+import pytest
+
+from commcareapi.comm_care_data import CommCareResources
+from commcareapi.hedging import Hedger
+
+
+class SlowFirstResource(object):
+    """
+    A fake drest resource whose first GET only answers once a later one
+    has, like a request stuck on a slow HQ server.
+    """
+    def __init__(self, error=None):
+        self.calls = 0
+        self.lock = threading.Lock()
+        self.answered = threading.Event()
+        self.error = error
+
+    def get(self, id, params):
+        with self.lock:
+            self.calls += 1
+            call = self.calls
+        if call == 1:
+            self.answered.wait(5)
+            return mock.Mock(data={'id': id, 'call': call})
+        self.answered.set()
+        if self.error:
+            raise self.error
+        return mock.Mock(data={'id': id, 'call': call})
+
+
+def hedger_for(resource, **kwargs):
+    def make_resources():
+        return mock.Mock(api=mock.Mock(case=resource))
+    return Hedger(make_resources, **kwargs)
+
+
+class TestHedger():
+
+    def test_fast_responses_are_not_hedged(self):
+        resource = mock.Mock()
+        resource.get.return_value = 'response'
+        hedger = hedger_for(resource, delay=5)
+
+        assert hedger.get('case', 'c1') == 'response'
+        assert hedger.stats() == {'requests': 1, 'hedges': 0,
+                                  'hedge_wins': 0}
+        hedger.close()
+
+    def test_hedge_wins_over_slow_request(self):
+        resource = SlowFirstResource()
+        hedger = hedger_for(resource, delay=0.01, max_extra=1)
+
+        assert hedger.get('case', 'c1').data == {'id': 'c1', 'call': 2}
+        assert hedger.stats() == {'requests': 1, 'hedges': 1,
+                                  'hedge_wins': 1}
+        hedger.close()
+
+    def test_failed_hedge_falls_back_to_the_first_request(self):
+        resource = SlowFirstResource(error=ValueError('boom'))
+        hedger = hedger_for(resource, delay=0.01, max_extra=1)
+
+        assert hedger.get('case', 'c1').data['call'] == 1
+        assert hedger.stats()['hedge_wins'] == 0
+        hedger.close()
+
+    def test_errors_are_raised_when_every_attempt_fails(self):
+        resource = mock.Mock()
+        resource.get.side_effect = ValueError('boom')
+        hedger = hedger_for(resource, delay=5)
+        with pytest.raises(ValueError):
+            hedger.get('case', 'c1')
+        hedger.close()
+
+    def test_extra_load_is_capped(self):
+        hedger = hedger_for(mock.Mock(), max_extra=0.1)
+        hedger.requests = 20
+        assert [hedger._may_hedge() for _ in range(3)] == \
+            [True, True, False]
+
+    def test_delay_follows_latency_percentile(self):
+        hedger = hedger_for(mock.Mock(), percentile=90, min_delay=0.01,
+                            max_delay=1.0, min_samples=10)
+        assert hedger.hedge_delay() == 1.0
+        hedger.latencies.extend(i / 100.0 for i in range(1, 101))
+        assert hedger.hedge_delay() == 0.91
+        hedger.latencies.extend([5.0] * 100)
+        assert hedger.hedge_delay() == 1.0
+
+
+class TestHedgedResources():
+
+    def test_case_lookups_go_through_the_hedger(self):
+        hedger = mock.Mock()
+        hedger.get.return_value = mock.Mock(data={'case_id': 'c1'})
+        resources = CommCareResources(mock.Mock(), hedger=hedger)
+        with mock.patch('commcareapi.comm_care_data.CommCareCase') as case:
+            resources.case('c1')
+        hedger.get.assert_called_once_with('case', 'c1', {})
+        case.assert_called_once_with({'case_id': 'c1'})
@@ -0,0 +1,165 @@
+"""
+Memory footprint of the bulk listing paths against synthetic paged data.
+
+These are slow, so they are marked memtest and not run by default:
+
+    py.test -m memtest
+    COMMCARE_MEMTEST_SIZES=10000,100000,1000000 py.test -m memtest
+
+Each scenario runs in a fresh process and fails if its peak or steady
+state memory goes over the budget in BUDGETS. Memory is measured with
+tracemalloc where it is available, otherwise from the process RSS.
+"""
+import multiprocessing
+import os
+import Queue
+import resource
+import sys
+
+import mock
+import pytest
+
+from commcareapi import dump_api_fixtures
+from mock_api import get_paged_mock_api_resource
+
+SIZES = [int(size) for size in
+         os.environ.get('COMMCARE_MEMTEST_SIZES', '10000,100000').split(',')]
+# seconds to wait for a scenario's measurements
+RUN_TIMEOUT = int(os.environ.get('COMMCARE_MEMTEST_TIMEOUT', 600))
+
+# scenario: (fixed bytes, bytes per object), for both peak and steady state
+BUDGETS = {
+    'list_cases': (32 * 2 ** 20, 4096),
+    'get_all_resources': (32 * 2 ** 20, 0),
+    'fixture': (32 * 2 ** 20, 2048),
+    'dump_cases': (32 * 2 ** 20, 8192),
+}
+
+
+def make_case(i):
+    case_id = 'case-%09d' % i
+    return {
+        u'id': case_id,
+        u'case_id': case_id,
+        u'user_id': u'3c5a623af057e23a32ae4000cf291339',
+        u'date_modified': u'2013-02-11T19:59:49',
+        u'closed': False,
+        u'date_closed': None,
+        u'server_date_modified': u'2013-02-11T19:59:50',
+        u'server_date_opened': u'2013-02-11T19:59:50',
+        u'xform_ids': [u'form-%09d' % i],
+        u'properties': {
+            u'case_name': u'Case %d' % i,
+            u'case_type': u'pregnant_mother',
+            u'date_opened': u'2013-02-11T19:59:49',
+            u'owner_id': u'ac9d34ff59cf6388e4f5804b12276d8a',
+        },
+        u'indices': {},
+    }
+
+
+def make_fixture(i):
+    return {u'id': u'fixture-%09d' % i, u'fixture_type': u'shg',
+            u'fields': {u'name': u'Group %d' % i}}
+
+
+def list_cases(count):
+    resources = get_paged_mock_api_resource('case', count, make_case)
+    return resources.list_cases(params={})
+
+
+def get_all_resources(count):
+    resources = get_paged_mock_api_resource('case', count, make_case)
+    for case in resources.get_all_resources('case', params={}):
+        pass
+
+
+def fixture(count):
+    resources = get_paged_mock_api_resource('fixture', count, make_fixture)
+    return resources.fixture()
+
+
+def dump_cases(count):
+    resources = get_paged_mock_api_resource('case', count, make_case)
+    argv = ['dump_api_fixtures.py', '-u', 'u', '-p', 'p', '-d', 'd', 'case']
+    with open(os.devnull, 'w') as devnull:
+        with mock.patch.object(sys, 'argv', argv), \
+                mock.patch.object(sys, 'stdout', devnull), \
+                mock.patch.object(dump_api_fixtures, 'CommCareAPI'), \
+                mock.patch.object(dump_api_fixtures, 'CommCareResources',
+                                  return_value=resources):
+            dump_api_fixtures.main()
+
+
+def current_rss():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * resource.getpagesize()
+
+
+def peak_rss():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def measure(scenario, count, queue):
+    """
+    Run scenario(count) and put (peak, steady) bytes used by it on the
+    queue. Steady state is measured while its result is still referenced.
+    """
+    try:
+        import tracemalloc
+    except ImportError:
+        tracemalloc = None
+
+    if tracemalloc is not None:
+        tracemalloc.start()
+        result = scenario(count)
+        steady, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    else:
+        base_peak, base_current = peak_rss(), current_rss()
+        result = scenario(count)
+        peak = peak_rss() - base_peak
+        steady = current_rss() - base_current
+    queue.put((max(peak, 0), max(steady, 0)))
+    del result
+
+
+def run_isolated(scenario, count, timeout=RUN_TIMEOUT):
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=measure,
+                                      args=(scenario, count, queue))
+    process.start()
+    try:
+        peak, steady = queue.get(timeout=timeout)
+    except Queue.Empty:
+        if process.is_alive():
+            process.terminate()
+        process.join()
+        pytest.fail('%s(%d) gave no result within %d seconds, exit code %s '
+                    '(-9 is SIGKILL, e.g. from the OOM killer)' % (
+                        scenario.__name__, count, timeout, process.exitcode))
+    process.join(timeout)
+    assert process.exitcode == 0, \
+        '%s(%d) measuring process exited with %s' % (
+            scenario.__name__, count, process.exitcode)
+    return peak, steady
+
+
+@pytest.mark.memtest
+@pytest.mark.parametrize('count', SIZES)
+@pytest.mark.parametrize('scenario', [list_cases, get_all_resources,
+                                      fixture, dump_cases])
+def test_memory_within_budget(scenario, count):
+    fixed, per_object = BUDGETS[scenario.__name__]
+    budget = fixed + per_object * count
+
+    peak, steady = run_isolated(scenario, count)
+
+    sys.stderr.write('%s(%d): peak %.0f B/object, steady %.0f B/object\n' % (
+        scenario.__name__, count, float(peak) / count, float(steady) / count))
+    assert peak <= budget, \
+        "%s peak %d bytes is over budget %d" % (scenario.__name__, peak, budget)
+    assert steady <= budget, \
+        "%s steady state %d bytes is over budget %d" % (
+            scenario.__name__, steady, budget)
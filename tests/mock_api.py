@@ -1,3 +1,5 @@
+import socket
+
 import mock
 
 from commcareapi.comm_care_data import CommCareResources
@@ -22,3 +24,78 @@ def get_mock_api_resource(resource_name, data):
     resources = CommCareResources(api_mock)
     api_mock.add_resource.assert_any_call(resource_name)
     return resources
+
+
+class PagedResource(object):
+    """
+        A fake drest resource listing objects a page at a time. objects is
+        a list, or a number of objects made by make_object(index) (by
+        default {'id': index}) only when a page holding them is requested.
+
+        filter(obj, params) picks the objects a request lists, a page
+        holds at most max_limit objects whatever limit is asked for, and
+        the first 'failures' requests raise error. Every request's params
+        are kept in .requests.
+    """
+
+    def __init__(self, objects, make_object=None, filter=None,
+                 max_limit=None, default_limit=20, failures=0, error=None):
+        self.objects = objects
+        self.make_object = make_object or (lambda index: {'id': index})
+        self.filter = filter
+        self.max_limit = max_limit
+        self.default_limit = default_limit
+        self.failures = failures
+        self.error = error or socket.timeout('timed out')
+        self.requests = []
+
+    @property
+    def offsets(self):
+        return [params.get('offset', 0) for params in self.requests]
+
+    def get(self, resource_id=None, params=None):
+        params = params or {}
+        self.requests.append(dict(params))
+        if self.failures:
+            self.failures -= 1
+            raise self.error
+        offset = params.get('offset', 0)
+        limit = params.get('limit', self.default_limit)
+        if self.max_limit is not None:
+            limit = min(limit, self.max_limit)
+
+        objects = self.objects
+        if isinstance(objects, (int, long)) and self.filter is None:
+            total = objects
+            page = [self.make_object(index) for index
+                    in xrange(offset, min(offset + limit, total))]
+        else:
+            if isinstance(objects, (int, long)):
+                objects = [self.make_object(index)
+                           for index in xrange(objects)]
+            if self.filter is not None:
+                objects = [obj for obj in objects if self.filter(obj, params)]
+            total = len(objects)
+            page = objects[offset:offset + limit]
+        return mock.Mock(data={'objects': page,
+                               'meta': {'total_count': total,
+                                        'limit': limit,
+                                        'offset': offset}},
+                         headers={'content-length': str(100 * len(page))})
+
+
+def get_resources_for(resource_name, resource):
+    """ A CommCareResources whose resource_name is the given fake """
+    api_mock = mock.Mock()
+    setattr(api_mock, resource_name, resource)
+    return CommCareResources(api_mock)
+
+
+def get_paged_mock_api_resource(resource_name, total, make_object, limit=100):
+    """
+        Like get_mock_api_resource, but '.get()' serves 'total' objects
+        a page of at most 'limit' at a time, building each page from
+        make_object(index) only when it is requested.
+    """
+    return get_resources_for(resource_name, PagedResource(
+        total, make_object, max_limit=limit, default_limit=limit))
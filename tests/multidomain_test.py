@@ -0,0 +1,129 @@
+import base64
+import socket
+import threading
+import time
+
+import drest
+import mock
+import pytest
+
+from commcareapi.multidomain import FairScheduler, HttpPool, \
+    CommCareMultiDomain
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, "timed out"
+        time.sleep(0.001)
+
+
+def grant_order(scheduler, requests):
+    """
+    Queue `requests` (a list of domains, in arrival order) behind a held
+    slot, then release it and return the order the slots were granted in.
+    """
+    granted = []
+    scheduler.acquire('holder')
+    threads = []
+    for i, domain in enumerate(requests):
+        def run(domain=domain, i=i):
+            with scheduler.slot(domain):
+                granted.append('%s%d' % (domain, i))
+        thread = threading.Thread(target=run)
+        thread.start()
+        threads.append(thread)
+        # make sure the arrival order is the list order
+        wait_until(lambda: scheduler.waiting_count() == i + 1)
+    scheduler.release('holder')
+    for thread in threads:
+        thread.join()
+    return granted
+
+
+class TestFairScheduler():
+
+    def test_busy_domain_does_not_starve_others(self):
+        scheduler = FairScheduler(1)
+        order = grant_order(scheduler, ['a', 'a', 'a', 'b'])
+        assert order == ['a0', 'b3', 'a1', 'a2']
+
+    def test_weights(self):
+        scheduler = FairScheduler(1, weights={'a': 2})
+        order = grant_order(scheduler, ['a', 'a', 'a', 'a', 'b', 'b'])
+        assert order == ['a0', 'b4', 'a1', 'a2', 'b5', 'a3']
+
+    def test_caps_concurrency(self):
+        scheduler = FairScheduler(2)
+        lock = threading.Lock()
+        state = {'active': 0, 'max': 0}
+
+        def run(domain):
+            with scheduler.slot(domain):
+                with lock:
+                    state['active'] += 1
+                    state['max'] = max(state['max'], state['active'])
+                time.sleep(0.005)
+                with lock:
+                    state['active'] -= 1
+
+        threads = [threading.Thread(target=run, args=(domain,))
+                   for domain in 'abcabcabc']
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert state['max'] == 2
+        assert scheduler.active == 0
+
+
+class TestHttpPool():
+
+    def test_reuses_connections(self):
+        with mock.patch('commcareapi.multidomain.Http') as Http:
+            pool = HttpPool()
+            pool.request('http://x/1', 'GET', '', {})
+            pool.request('http://x/2', 'GET', '', {})
+        assert Http.call_count == 1
+        assert Http.return_value.request.call_count == 2
+
+    def test_retries_once_on_a_fresh_connection(self):
+        with mock.patch('commcareapi.multidomain.Http') as Http:
+            Http.return_value.request.side_effect = socket.error('reset')
+            with pytest.raises(drest.exc.dRestAPIError):
+                HttpPool().request('http://x/', 'GET', '', {})
+        assert Http.call_count == 2
+
+
+class TestCommCareMultiDomain():
+
+    def test_domains_share_pool_and_scheduler(self):
+        client = CommCareMultiDomain('user', 'pw', concurrency=3)
+        a, b = client.resources('a'), client.resources('b')
+
+        assert client.resources('a') is a
+        assert a.api.domain == 'a'
+        assert a.api.request.pool is b.api.request.pool is client.pool
+        assert a.api.request.scheduler is client.scheduler
+        assert b.api.request.domain == 'b'
+
+    def test_request_sends_basic_auth_through_the_pool(self):
+        client = CommCareMultiDomain('user', 'pw')
+        handler = client.resources('a').api.request
+        response = ({'status': '200'}, '{}')
+        with mock.patch.object(client.pool, 'request',
+                               return_value=response) as request:
+            assert handler._make_request('http://x/', 'GET') == response
+
+        url, method, payload, headers = request.call_args[0]
+        assert headers['Authorization'] == \
+            'Basic ' + base64.b64encode('user:pw')
+        assert client.scheduler.active == 0
+
+    def test_rate_limiter_is_passed_to_every_domain(self):
+        limiter = mock.Mock()
+        client = CommCareMultiDomain('user', 'pw', rate_limiter=limiter)
+        handler = client.resources('a').api.request
+        with mock.patch.object(client.pool, 'request'):
+            handler._make_request('http://x/', 'GET')
+        limiter.acquire.assert_called_once_with('a')
@@ -0,0 +1,143 @@
+import threading
+import time
+
+import mock
+import pytest
+
+from commcareapi.comm_care_data import CommCareResources
+from commcareapi.priority import PriorityScheduler, INTERACTIVE, NORMAL, \
+    BULK
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, "timed out"
+        time.sleep(0.001)
+
+
+def waiting(scheduler):
+    return sum(s['waiting'] for s in scheduler.stats().values())
+
+
+def grant_order(scheduler, requests, held=1):
+    """
+    Queue `requests` (priorities, in arrival order) behind `held` slots,
+    then release them and return the order the requests were granted in.
+    """
+    granted = []
+    for _ in range(held):
+        scheduler.acquire(NORMAL)
+    threads = []
+    for i, priority in enumerate(requests):
+        def run(priority=priority, i=i):
+            with scheduler.slot(priority):
+                granted.append('%s%d' % (priority, i))
+        thread = threading.Thread(target=run)
+        thread.start()
+        threads.append(thread)
+        wait_until(lambda: waiting(scheduler) == i + 1)
+    for _ in range(held):
+        scheduler.release(NORMAL)
+    for thread in threads:
+        thread.join()
+    return granted
+
+
+class TestPriorityScheduler():
+
+    def test_interactive_goes_first(self):
+        scheduler = PriorityScheduler(concurrency=1)
+        order = grant_order(scheduler, [BULK, NORMAL, BULK, INTERACTIVE])
+        assert order == ['interactive3', 'normal1', 'bulk0', 'bulk2']
+
+    def test_starved_requests_go_first(self):
+        scheduler = PriorityScheduler(concurrency=1, starvation_timeout=0.05)
+        granted = []
+        scheduler.acquire(NORMAL)
+
+        def run(priority, name):
+            with scheduler.slot(priority):
+                granted.append(name)
+        bulk = threading.Thread(target=run, args=(BULK, 'bulk'))
+        bulk.start()
+        wait_until(lambda: waiting(scheduler) == 1)
+        time.sleep(0.06)
+        interactive = threading.Thread(target=run,
+                                       args=(INTERACTIVE, 'interactive'))
+        interactive.start()
+        wait_until(lambda: waiting(scheduler) == 2)
+        scheduler.release(NORMAL)
+        bulk.join()
+        interactive.join()
+        assert granted == ['bulk', 'interactive']
+
+    def test_reserved_slots(self):
+        scheduler = PriorityScheduler(concurrency=2,
+                                      reserved={INTERACTIVE: 1})
+        scheduler.acquire(BULK)
+        assert not scheduler._may_run(BULK)
+        assert scheduler._may_run(INTERACTIVE)
+        scheduler.acquire(INTERACTIVE)
+        assert not scheduler._may_run(INTERACTIVE)
+
+    def test_too_many_reserved_slots(self):
+        with pytest.raises(ValueError):
+            PriorityScheduler(concurrency=1, reserved={INTERACTIVE: 2})
+
+    def test_thread_priority(self):
+        scheduler = PriorityScheduler()
+        with scheduler.priority(BULK):
+            with scheduler.slot():
+                assert scheduler.stats()[BULK]['active'] == 1
+        assert scheduler.current_priority() == NORMAL
+        assert scheduler.stats()[BULK]['granted'] == 1
+
+
+class TestScheduledResources():
+
+    def resources(self):
+        api = mock.Mock()
+        api.case.get.return_value = mock.Mock(
+            data={'objects': [{'id': 1}], 'meta': {'total_count': 1}})
+        scheduler = mock.MagicMock()
+        return CommCareResources(api, scheduler=scheduler), scheduler
+
+    def test_pages_use_the_iterator_priority(self):
+        resources, scheduler = self.resources()
+        list(resources.get_all_resources('case', priority=BULK))
+        scheduler.slot.assert_called_once_with(BULK)
+
+    def test_lookups_are_tagged(self):
+        resources, scheduler = self.resources()
+        with mock.patch('commcareapi.comm_care_data.CommCareCase'):
+            resources.case('c1', priority=INTERACTIVE)
+        scheduler.slot.assert_called_once_with(INTERACTIVE)
+
+    def test_lookups_only_share_requests_of_the_same_priority(self):
+        scheduler = PriorityScheduler(concurrency=1)
+        api = mock.Mock()
+        fetched = []
+
+        def get(id, params):
+            fetched.append(scheduler.stats()[INTERACTIVE]['active'])
+            return mock.Mock(data={'id': id})
+        api.case.get.side_effect = get
+        resources = CommCareResources(api, scheduler=scheduler)
+
+        scheduler.acquire(NORMAL)
+        threads = []
+        for priority in (BULK, INTERACTIVE):
+            thread = threading.Thread(
+                target=resources._get, args=('case', 'c1', None, priority))
+            # a follower never queues, so don't hang the suite if it fails
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+            wait_until(lambda: waiting(scheduler) == len(threads))
+        scheduler.release(NORMAL)
+        for thread in threads:
+            thread.join()
+
+        # the interactive lookup made its own request, ahead of the bulk one
+        assert fetched == [1, 0]
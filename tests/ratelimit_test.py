@@ -0,0 +1,104 @@
+import threading
+
+import mock
+import pytest
+
+from commcareapi.comm_care_data import CommCareAPI
+from commcareapi.ratelimit import SharedRateLimiter
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    clock = FakeClock()
+    with mock.patch('commcareapi.ratelimit.time', clock):
+        yield clock
+
+
+@pytest.fixture
+def path(tmpdir):
+    return str(tmpdir.join('rate.db'))
+
+
+class TestSharedRateLimiter():
+
+    def test_burst_then_rate(self, clock, path):
+        limiter = SharedRateLimiter(path, rate=2, burst=3)
+        waits = [limiter.acquire('a') for _ in range(5)]
+        assert waits == [0, 0, 0, 0.5, 0.5]
+
+    def test_budget_is_shared_through_the_file(self, clock, path):
+        # two limiters on one file stand in for two processes
+        first = SharedRateLimiter(path, rate=1, burst=2)
+        second = SharedRateLimiter(path, rate=1, burst=2)
+        first.acquire('a')
+        first.acquire('a')
+        assert second.acquire('a') == 1.0
+
+    def test_domains_have_separate_buckets(self, clock, path):
+        limiter = SharedRateLimiter(path, rate=1, burst=1,
+                                    rates={'big': (10, 5)})
+        assert limiter.acquire('a') == 0
+        assert limiter.acquire('b') == 0
+        assert [limiter.acquire('big') for _ in range(6)] == \
+            [0, 0, 0, 0, 0, pytest.approx(0.1)]
+
+    def test_global_bucket(self, clock, path):
+        limiter = SharedRateLimiter(path, rate=10, burst=10, global_rate=1,
+                                    global_burst=2)
+        limiter.acquire('a')
+        limiter.acquire('b')
+        assert limiter.acquire('c') == 1.0
+
+    def test_long_waits_are_rechecked(self, clock, path):
+        limiter = SharedRateLimiter(path, rate=0.25, burst=1, max_sleep=1)
+        limiter.acquire('a')
+        assert limiter.acquire('a') == 4.0
+        assert clock.slept == [1, 1, 1, 1]
+
+    def test_wait_metrics(self, clock, path):
+        limiter = SharedRateLimiter(path, rate=2, burst=1)
+        for _ in range(3):
+            limiter.acquire('a')
+        SharedRateLimiter(path, rate=2, burst=1).acquire('a')
+
+        assert limiter.stats() == {'requests': 3, 'waits': 2,
+                                   'wait_seconds': 1.0, 'max_wait': 0.5}
+        assert limiter.shared_stats() == {
+            'a': {'requests': 4, 'waits': 3, 'wait_seconds': 1.5}}
+
+    def test_threads_share_the_budget(self, path):
+        limiter = SharedRateLimiter(path, rate=1, burst=20)
+        threads = [threading.Thread(target=limiter.acquire, args=('a',))
+                   for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert limiter.stats()['requests'] == 10
+        assert limiter.stats()['waits'] == 0
+
+
+class TestRateLimitedRequests():
+
+    def test_requests_wait_for_a_token(self):
+        limiter = mock.Mock()
+        api = CommCareAPI('my-domain', 'user', 'pw', rate_limiter=limiter)
+        with mock.patch('drest.request.RequestHandler._make_request',
+                        return_value='response'):
+            assert api.request._make_request('http://x/', 'GET') == \
+                'response'
+        limiter.acquire.assert_called_once_with('my-domain')
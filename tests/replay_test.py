@@ -0,0 +1,103 @@
+import json
+import os
+
+import pytest
+
+from commcareapi.comm_care_data import CommCareCase, CommCareForm
+from commcareapi.replay import CaseReplay, CaseReplayError, \
+    SqliteCaseTable, case_blocks
+
+
+def read_fixture(fixture):
+    test_dir = os.path.abspath(os.path.dirname(__file__))
+    with open(os.path.join(test_dir, 'test_fixtures', fixture), 'r') as f:
+        return json.load(f)
+
+
+def form(form_id, received_on, *blocks):
+    data = {'@xmlns': 'http://example.com/form', 'meta': {}}
+    if blocks:
+        data['case'] = blocks[0]
+    if blocks[1:]:
+        data['subcases'] = {'item': [{'case': block} for block in blocks[1:]]}
+    return {'id': form_id, 'received_on': received_on, 'form': data}
+
+
+def block(case_id, date_modified, **actions):
+    data = {'@case_id': case_id, '@date_modified': date_modified,
+            '@user_id': 'u1'}
+    data.update(actions)
+    return data
+
+
+FORMS = [
+    form('f1', '2014-01-01T10:00:00',
+         block('c1', '2014-01-01T09:59:00',
+               create={'case_type': 'mother', 'case_name': 'Rose',
+                       'owner_id': 'o1'}),
+         block('c2', '2014-01-01T09:59:00',
+               create={'case_type': 'child', 'case_name': 'Lily',
+                       'owner_id': 'o1'},
+               index={'parent': {'@case_type': 'mother', '#text': 'c1'}})),
+    form('f2', '2014-01-02T10:00:00',
+         block('c1', '2014-01-02T09:00:00',
+               update={'owner_id': 'o2', 'case_name': 'Rose'})),
+    form('f3', '2014-01-03T10:00:00',
+         block('c2', '2014-01-03T09:00:00', close='')),
+]
+
+
+class TestCaseReplay():
+
+    def test_case_blocks_include_subcases(self):
+        assert [b['@case_id'] for b in case_blocks(FORMS[0]['form'])] == \
+            ['c1', 'c2']
+
+    def test_events(self):
+        events = list(CaseReplay().replay(FORMS))
+        assert [(e['type'], e['case_id'], e['form_id']) for e in events] == [
+            ('create', 'c1', 'f1'), ('create', 'c2', 'f1'),
+            ('index', 'c2', 'f1'), ('update', 'c1', 'f2'),
+            ('close', 'c2', 'f3')]
+        # only properties whose value changed are reported
+        assert events[3]['changes'] == {'owner_id': 'o2'}
+
+    def test_snapshot_as_of(self):
+        cases = CaseReplay().run(FORMS, until='2014-01-02T12:00:00').snapshot()
+
+        mother, child = cases['c1'], cases['c2']
+        assert mother['properties']['owner_id'] == 'o2'
+        assert mother['xform_ids'] == ['f1', 'f2']
+        assert mother['date_modified'] == '2014-01-02T09:00:00'
+        assert child['closed'] is False
+        assert child['indices'] == {
+            'parent': {'case_type': 'mother', 'case_id': 'c1'}}
+
+    def test_close(self):
+        child = CaseReplay().run(FORMS).snapshot()['c2']
+        assert child['closed'] is True
+        assert child['date_closed'] == '2014-01-03T09:00:00'
+
+    def test_snapshot_is_a_copy(self):
+        replay = CaseReplay().run(FORMS[:1])
+        replay.snapshot()['c1']['properties']['owner_id'] = 'changed'
+        assert replay.snapshot()['c1']['properties']['owner_id'] == 'o1'
+
+    def test_state_is_a_valid_case(self):
+        replay = CaseReplay().run([CommCareForm(read_fixture(name)) for name
+                                   in ('form_response.json',
+                                       'form_response_2.json')])
+        case = CommCareCase(replay.snapshot().values()[0])
+        assert case.case_name == 'Test Data 1 - Question1'
+        assert case.case_properties['owner_id'] == \
+            'cf0b7d3f231d2c384d3259d4f04d3978'
+
+    def test_out_of_order_forms_are_rejected(self):
+        with pytest.raises(CaseReplayError):
+            CaseReplay().run([FORMS[1], FORMS[0]])
+
+    def test_sqlite_table_matches_memory(self, tmpdir):
+        table = SqliteCaseTable(str(tmpdir.join('cases.db')))
+        on_disk = CaseReplay(table, commit_every=1).run(FORMS).snapshot()
+        assert on_disk == CaseReplay().run(FORMS).snapshot()
+        assert len(table) == 2
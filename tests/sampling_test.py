@@ -0,0 +1,110 @@
+import mock
+import pytest
+
+from commcareapi.sampling import Sampler, allocate, runs
+from mock_api import PagedResource
+
+
+def by_type(obj, params):
+    return params.get('type') in (None, obj['type'])
+
+
+def typed_resource(total, types=('a',)):
+    """ Lists `total` numbered objects, each with a type to filter by """
+    return PagedResource([{'id': i, 'type': types[i % len(types)]}
+                          for i in range(total)], filter=by_type)
+
+
+@pytest.fixture
+def sampler_for(request):
+    def make_sampler(resource, **kwargs):
+        def make_resources():
+            return mock.Mock(api=mock.Mock(case=resource))
+        sampler = Sampler(make_resources, **kwargs)
+        request.addfinalizer(sampler.close)
+        return sampler
+    return make_sampler
+
+
+def test_allocate_is_proportional_and_capped():
+    assert allocate(10, {'a': 70, 'b': 20, 'c': 10}) == \
+        {'a': 7, 'b': 2, 'c': 1}
+    assert allocate(10, {'a': 1, 'b': 1}) == {'a': 1, 'b': 1}
+    assert sum(allocate(10, {'a': 1, 'b': 1, 'c': 1}).values()) == 3
+    assert sum(allocate(5, {'a': 10, 'b': 10, 'c': 10}).values()) == 5
+
+
+def test_runs_fit_in_one_request():
+    assert runs([0, 5, 99, 100, 250], 100) == \
+        [(0, [0, 5, 99]), (100, [100]), (250, [250])]
+
+
+class TestSampler():
+
+    def test_sample_fetches_only_pages_with_sampled_offsets(self, sampler_for):
+        resource = typed_resource(100000)
+        sample = sampler_for(resource, seed=1).sample('case', 50)
+
+        ids = [obj['id'] for obj in sample]
+        assert len(set(ids)) == 50
+        assert ids == sorted(ids)
+        pages = resource.requests[1:]
+        assert len(pages) <= 50
+        assert sum(page['limit'] for page in pages) < 5000
+        assert all(page['limit'] <= 100 for page in pages)
+
+    def test_sample_is_uniform(self, sampler_for):
+        resource = typed_resource(10)
+        sampler = sampler_for(resource, seed=2)
+        counts = dict((i, 0) for i in range(10))
+        for _ in range(500):
+            for obj in sampler.sample('case', 2):
+                counts[obj['id']] += 1
+        assert all(60 < count < 140 for count in counts.values())
+
+    def test_sample_larger_than_listing_returns_everything(self, sampler_for):
+        sample = sampler_for(typed_resource(30)).sample('case', 100)
+        assert [obj['id'] for obj in sample] == range(30)
+
+    def test_stratified_sample_uses_filters(self, sampler_for):
+        resource = typed_resource(1000, types=('a', 'a', 'a', 'b'))
+        samples = sampler_for(resource, workers=2).stratified(
+            'case', {'a': {'type': 'a'}, 'b': {'type': 'b'}}, 100)
+
+        assert len(samples['a']) == 75 and len(samples['b']) == 25
+        assert all(obj['type'] == 'a' for obj in samples['a'])
+        assert all(obj['type'] == 'b' for obj in samples['b'])
+
+    def test_stratified_sizes_can_be_given(self, sampler_for):
+        resource = typed_resource(1000, types=('a', 'a', 'a', 'b'))
+        samples = sampler_for(resource).stratified(
+            'case', {'a': {'type': 'a'}, 'b': {'type': 'b'}},
+            {'a': 10, 'b': 10})
+        assert len(samples['a']) == len(samples['b']) == 10
+
+    def test_shrunk_listing_gives_a_shorter_sample(self, sampler_for):
+        resource = typed_resource(100)
+        sampler = sampler_for(resource, seed=3)
+        count = sampler.count
+
+        def count_then_shrink(*args, **kwargs):
+            total = count(*args, **kwargs)
+            del resource.objects[50:]
+            return total
+        with mock.patch.object(sampler, 'count', count_then_shrink):
+            sample = sampler.sample('case', 100)
+        assert [obj['id'] for obj in sample] == range(50)
+
+    @mock.patch('commcareapi.sampling.CommCareCase')
+    def test_cases_are_sampled_in_a_fixed_order(self, case, sampler_for):
+        resource = typed_resource(1000, types=('a', 'b'))
+        sampler = sampler_for(resource, seed=4)
+        sampler.sample_cases(10)
+        sampler.sample_cases(10, strata={'a': {'type': 'a'}})
+        assert all(params['order_by'] == 'server_date_modified'
+                   for params in resource.requests)
+
+        del resource.requests[:]
+        sampler.sample_cases(10, params={'order_by': 'date_modified'})
+        assert all(params['order_by'] == 'date_modified'
+                   for params in resource.requests)
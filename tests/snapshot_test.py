@@ -0,0 +1,115 @@
+import json
+import os
+import struct
+import zlib
+
+import pytest
+
+from commcareapi.comm_care_data import CommCareCase, CommCareForm
+from commcareapi.snapshot import SnapshotReader, SnapshotWriter, \
+    SnapshotError, MAGIC
+
+
+def read_fixture(fixture):
+    test_dir = os.path.abspath(os.path.dirname(__file__))
+    with open(os.path.join(test_dir, 'test_fixtures', fixture), 'r') as f:
+        return json.load(f)
+
+
+def cases(count):
+    case = read_fixture('case_response.json')
+    for i in range(count):
+        data = dict(case, id=u'case-%d' % i, case_id=u'case-%d' % i)
+        data['properties'] = dict(case['properties'], visits=i)
+        yield data
+
+
+class TestSnapshot():
+
+    def write(self, path, kind, records, **kwargs):
+        with SnapshotWriter(path, kind, **kwargs) as writer:
+            for record in records:
+                writer.write(record)
+
+    def test_cases_round_trip(self, tmpdir):
+        path = str(tmpdir.join('cases.snap'))
+        expected = list(cases(25))
+        self.write(path, 'case', [CommCareCase(data) for data in expected],
+                   block_size=10)
+
+        reader = SnapshotReader(path)
+        assert reader.kind == 'case'
+        assert len(reader) == 25
+        assert list(reader.records()) == expected
+        assert all(isinstance(case, CommCareCase) for case in reader)
+
+    def test_forms_round_trip(self, tmpdir):
+        path = str(tmpdir.join('forms.snap'))
+        expected = [read_fixture(name) for name in ('form_response.json',
+                                                    'form_response_2.json')]
+        self.write(path, 'form', expected)
+
+        forms = list(SnapshotReader(path))
+        assert [form.form_data for form in forms] == expected
+        assert isinstance(forms[0], CommCareForm)
+
+    def test_awkward_values(self, tmpdir):
+        path = str(tmpdir.join('cases.snap'))
+        record = {'big': 2 ** 70, 'case_type': 'mother', 'none': None,
+                  'nested': {'empty': {}, 'list': [1, {'a': 'b'}],
+                             'owner_id': u'\xe9t\xe9', 'big': 2 ** 70},
+                  'list': [], 'closed': False, 'weight': 2.5}
+        self.write(path, 'case', [record, record])
+        assert list(SnapshotReader(path).records()) == [record, record]
+
+    def test_strings_are_interned_once_per_file(self, tmpdir):
+        path = str(tmpdir.join('cases.snap'))
+        self.write(path, 'case', cases(100), block_size=10)
+        records = list(SnapshotReader(path).records())
+        assert records[0]['properties']['case_type'] is \
+            records[99]['properties']['case_type']
+
+    def test_smaller_than_json(self, tmpdir):
+        path = str(tmpdir.join('cases.snap'))
+        expected = list(cases(100))
+        self.write(path, 'case', expected)
+        assert os.path.getsize(path) * 10 < len(json.dumps(expected,
+                                                           indent=4))
+
+    def test_not_a_snapshot(self, tmpdir):
+        path = tmpdir.join('cases.json')
+        path.write('[]')
+        with pytest.raises(SnapshotError):
+            SnapshotReader(str(path))
+
+    def test_truncated(self, tmpdir):
+        path = str(tmpdir.join('cases.snap'))
+        self.write(path, 'case', cases(10))
+        with open(path, 'rb') as f:
+            data = f.read()
+        with open(path, 'wb') as f:
+            f.write(data[:-10])
+        with pytest.raises(SnapshotError):
+            list(SnapshotReader(path).records())
+
+    def test_format_is_length_prefixed_json(self, tmpdir):
+        path = str(tmpdir.join('cases.snap'))
+        self.write(path, 'case', [{'id': u'a', 'case_type': u'mother'}])
+        with open(path, 'rb') as f:
+            data = f.read()
+        assert data.startswith(MAGIC)
+        offset = len(MAGIC)
+        length, = struct.unpack_from('<I', data, offset)
+        offset += 4
+        assert json.loads(data[offset:offset + length]) == {'kind': 'case'}
+        offset += length
+        compressed, count = struct.unpack_from('<II', data, offset)
+        payload = zlib.decompress(data[offset + 8:offset + 8 + compressed])
+        length, = struct.unpack_from('<I', payload)
+        strings, shapes = json.loads(payload[4:4 + length])
+        record_length, = struct.unpack_from('<I', payload, 4 + length)
+        record = json.loads(payload[8 + length:8 + length + record_length])
+        assert count == 1
+        keys, fixups = shapes[record[0]]
+        assert dict(zip([strings[key] for key in keys], record[1:])) == \
+            {'id': 'a', 'case_type': strings.index('mother')}
@@ -0,0 +1,77 @@
+import json
+
+import mock
+import pytest
+
+from commcareapi import tracing
+from commcareapi.comm_care_data import CommCareAPI, CommCareForm, \
+    CommCareResources, jsonpath
+
+
+@pytest.fixture
+def tracer():
+    tracer = tracing.enable()
+    yield tracer
+    tracing.disable()
+
+
+def span_names(tracer):
+    return [event['name'] for event in tracer.events]
+
+
+class TestTracing():
+
+    def test_spans_are_not_recorded_when_disabled(self):
+        tracer = tracing.Tracer()
+        with tracing.span('nothing'):
+            pass
+        assert tracer.events == []
+
+    def test_span_records_complete_event(self, tracer):
+        with tracing.span('work', size=3):
+            pass
+        event, = tracer.events
+        assert event['name'] == 'work'
+        assert event['ph'] == 'X'
+        assert event['args'] == {'size': 3}
+        assert event['dur'] >= 0
+
+    def test_traced_decorator(self, tracer):
+        @tracing.traced('double')
+        def double(x):
+            return x * 2
+        assert double(2) == 4
+        assert span_names(tracer) == ['double']
+
+    def test_chrome_trace_export(self, tracer, tmpdir):
+        with tracing.span('work'):
+            pass
+        path = str(tmpdir.join('trace.json'))
+        tracer.write(path)
+        with open(path) as f:
+            trace = json.load(f)
+        assert [e['name'] for e in trace['traceEvents']] == ['work']
+
+    def test_hot_paths_are_traced(self, tracer):
+        form = CommCareForm({'id': 'f', 'form': {}}, validate=False)
+        jsonpath(form.form_data, '$.id')
+        form.make_human_readable([])
+        assert span_names(tracer) == ['jsonpath', 'make_human_readable']
+
+    def test_pages_are_traced(self, tracer):
+        api = mock.Mock()
+        api.case.get.return_value = mock.Mock(
+            data={'objects': [1], 'meta': {'total_count': 1}})
+        list(CommCareResources(api).get_all_resources('case'))
+        event, = tracer.events
+        assert event['name'] == 'get_all_resources.page'
+        assert event['args'] == {'resource': 'case', 'offset': 0}
+
+    def test_http_and_json_decoding_are_traced(self, tracer):
+        api = CommCareAPI('domain', 'user', 'password')
+        CommCareResources(api)
+        http = mock.Mock()
+        http.request.return_value = ({'status': '200'}, '{"objects": []}')
+        with mock.patch.object(api.request, '_get_http', return_value=http):
+            api.case.get()
+        assert span_names(tracer) == ['http', 'json']
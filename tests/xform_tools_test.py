@@ -1,8 +1,14 @@
 import os
+import mock
 import pytest
 import pprint
 
-from commcareapi.xform import XForm
+from io import BytesIO
+from lxml import etree as ET
+
+from commcareapi.xform import XForm, XFormError, parse_xml, \
+    parse_xml_chunks, iterparse_xml, WrappedNode, find_bind, XFormCache, \
+    find_bind_by_nodeset, _make_elem
 
 
 class TestGetQuestions:
@@ -131,3 +137,197 @@ class TestGetQuestions:
         ]
 
         assert actual_questions == expected_questions
+
+
+class TestParseXml:
+
+    xml = '<?xml version="1.0" encoding="UTF-8"?><a><b>1</b><b>2</b><c/></a>'
+
+    def test_parses_unicode_with_encoding_declaration(self):
+        assert parse_xml(unicode(self.xml)).tag == 'a'
+
+    def test_parses_file_object(self):
+        assert parse_xml(BytesIO(self.xml)).find('c') is not None
+
+    def test_returns_parsed_element_unchanged(self):
+        tree = parse_xml(self.xml)
+        assert parse_xml(tree) is tree
+
+    def test_parses_chunks(self):
+        chunks = [self.xml[i:i + 5] for i in range(0, len(self.xml), 5)]
+        tree = parse_xml_chunks(chunks)
+        assert [b.text for b in tree.findall('b')] == ['1', '2']
+
+    def test_bad_chunks_raise_xform_error_and_parser_is_reusable(self):
+        with pytest.raises(XFormError):
+            parse_xml_chunks(['<a><b>', '</a>'])
+        assert parse_xml_chunks([self.xml]).tag == 'a'
+
+    def test_iterparse_yields_matching_elements(self):
+        texts = [element.text for _, element in iterparse_xml(self.xml, tag='b')]
+        assert texts == ['1', '2']
+
+    def test_iterparse_clears_consumed_elements(self):
+        elements = [element for _, element in iterparse_xml(self.xml)]
+        root = elements[-1]
+        assert root.tag == 'a'
+        assert len(root) == 0
+
+
+class TestWrappedNode:
+
+    xml = ('<a xmlns="http://www.w3.org/2002/xforms">'
+           '<bind id="one" nodeset="/data/one"/>'
+           '<bind id="two" nodeset="/data/two"/>'
+           '</a>')
+
+    def test_iterfind_is_lazy_and_wraps_nodes(self):
+        node = WrappedNode(self.xml)
+        binds = node.iterfind('{f}bind')
+        assert not isinstance(binds, list)
+        assert [b.attrib['id'] for b in binds] == ['one', 'two']
+
+    def test_findall_matches_iterfind(self):
+        node = WrappedNode(self.xml)
+        assert [b.xml for b in node.findall('{f}bind')] == \
+            [b.xml for b in node.iterfind('{f}bind')]
+
+    def test_missing_node_lookups(self):
+        node = WrappedNode(None)
+        assert not node.find('{f}bind').exists()
+        assert node.findall('{f}bind') == []
+        assert list(node.iterfind('{f}bind')) == []
+        assert node.findtext('{f}bind') is None
+
+    def test_xpath_first_uses_compiled_lookup(self):
+        node = WrappedNode(self.xml)
+        assert node.xpath_first(find_bind, id='two').attrib['nodeset'] == \
+            '/data/two'
+        assert not node.xpath_first(find_bind, id='three').exists()
+
+    def test_form_namespace_is_expanded_per_form(self):
+        for xmlns in ('http://example.org/one', 'http://example.org/two'):
+            xml = ('<h:html xmlns:h="http://www.w3.org/1999/xhtml" '
+                   'xmlns="http://www.w3.org/2002/xforms"><h:head><model>'
+                   '<instance><data xmlns="%s"><q/></data></instance>'
+                   '</model></h:head></h:html>' % xmlns)
+            xform = XForm(xml)
+            assert xform.data_node.find('{x}q').exists()
+
+
+class TestBatchBinds:
+
+    @pytest.fixture
+    def xform(self):
+        test_dir = os.path.abspath(os.path.dirname(__file__))
+        raw_xform_file = os.path.join(test_dir, 'test_fixtures', 'test_xform_definition.xml')
+        return XForm(open(raw_xform_file, 'r').read())
+
+    def edit(self, xform):
+        xform.add_bind(nodeset='new_question', type='xsd:string')
+        xform.add_bind(nodeset='new_question', required='true()')
+        xform.add_setvalue(ref='meta/timeStart', value='now()',
+                           type='xsd:dateTime')
+        xform.add_bind(nodeset='testmodule1_form_createcase_question1',
+                       required='true()')
+
+    def test_batch_gives_same_model_as_single_edits(self, xform):
+        expected = XForm(xform.render())
+        self.edit(expected)
+
+        with xform.batch_binds():
+            self.edit(xform)
+
+        assert xform.model_node.render() == expected.model_node.render()
+
+    def test_model_is_only_changed_when_batch_ends(self, xform):
+        before = len(xform.model_node.findall('*'))
+        with xform.batch_binds():
+            self.edit(xform)
+            assert len(xform.model_node.findall('*')) == before
+        assert len(xform.model_node.findall('*')) > before
+
+    def binds_for(self, xform, nodeset):
+        return xform.model_node.xml.xpath(
+            '*[local-name()="bind"][@nodeset=$nodeset]', nodeset=nodeset)
+
+    def replace_bind(self, xform, nodeset):
+        bind = xform.model_node.xpath_first(find_bind_by_nodeset,
+                                            nodeset=nodeset)
+        xform.model_node.remove(bind.xml)
+        xform.add_bind(nodeset=nodeset, type='xsd:int')
+
+    def test_bind_removed_in_a_nested_batch_can_be_added_again(self, xform):
+        nodeset = '/data/testmodule1_form_createcase_question1'
+        expected = XForm(xform.render())
+        self.replace_bind(expected, nodeset)
+
+        with xform.batch_binds():
+            with xform.batch_binds():
+                self.replace_bind(xform, nodeset)
+
+        assert [bind.attrib['type'] for bind in
+                self.binds_for(xform, nodeset)] == ['xsd:int']
+        assert xform.model_node.render() == expected.model_node.render()
+
+    def test_pending_bind_can_be_removed(self, xform):
+        def case_bind(type):
+            return _make_elem('{f}bind', {'nodeset': 'case/x', 'type': type})
+
+        with xform.batch_binds():
+            xform._merge_bind(case_bind('xsd:string'))
+            with xform.batch_binds():
+                for bind in xform._all_binds():
+                    if bind.attrib['nodeset'].startswith('case/'):
+                        xform._remove_bind(bind)
+                xform._merge_bind(case_bind('xsd:int'))
+
+        assert [bind.attrib['type'] for bind in
+                self.binds_for(xform, 'case/x')] == ['xsd:int']
+
+class TestFingerprint:
+
+    @pytest.fixture
+    def definition(self):
+        test_dir = os.path.abspath(os.path.dirname(__file__))
+        with open(os.path.join(test_dir, 'test_fixtures',
+                               'test_xform_definition.xml')) as f:
+            return f.read()
+
+    def rebuild(self, definition, version):
+        xform = XForm(definition)
+        xform.set_version(version)
+        xform.data_node.set('uiVersion', '2')
+        return ET.tostring(xform.xml)
+
+    def test_new_version_has_the_same_fingerprint(self, definition):
+        rebuilt = self.rebuild(definition, 26)
+        assert rebuilt != definition
+        assert XForm(rebuilt).fingerprint() == XForm(definition).fingerprint()
+
+    def test_formatting_does_not_change_the_fingerprint(self, definition):
+        compact = ET.tostring(parse_xml(definition.replace('\t', '')))
+        assert XForm(compact).fingerprint() == \
+            XForm(definition).fingerprint()
+
+    def test_changed_label_changes_the_fingerprint(self, definition):
+        xform = XForm(definition)
+        value = xform.itext_node.find('{f}translation/{f}text/{f}value')
+        value.xml.text = 'changed'
+        assert xform.fingerprint() != XForm(definition).fingerprint()
+
+    def test_changed_bind_changes_the_fingerprint(self, definition):
+        xform = XForm(definition)
+        xform.model_node.find('{f}bind').set('required', 'true()')
+        assert xform.fingerprint() != XForm(definition).fingerprint()
+
+    def test_cache_shares_questions_across_versions(self, definition):
+        cache = XFormCache()
+        questions = cache.get_questions('xv1', definition, ['en'])
+        rebuilt = self.rebuild(definition, 2)
+
+        with mock.patch.object(XForm, 'get_questions') as get_questions:
+            assert cache.get_questions('xv2', rebuilt, ['en']) is questions
+        assert not get_questions.called
+        assert cache.xform('xv2', rebuilt) is cache.xform('xv1', definition)
+        assert questions == XForm(definition).get_questions(['en'])